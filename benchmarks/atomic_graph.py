@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""Headless benchmarks for atomic on synthetic graphs
+
+    python -m benchmarks.atomic_graph --json atomic.json
+
+The graph has N atoms, M renders that each read K atoms,
+a chain of D selectors and a ListAtom with L items.
+atomic is imported in client mode with the same trick as tests/test_atomic.py
+"""
+
+import anvil
+
+from .harness import Report, make_parser, measure, peak_memory
+
+is_server_side = anvil.is_server_side
+anvil.is_server_side = lambda: False  # so that atomic thinks we're client side
+
+from client_code.atomic import action, atom, autorun, selector  # noqa: E402
+from client_code.atomic.contexts import RenderContext  # noqa: E402
+from client_code.atomic.rendering import call_queued, new_scope, request  # noqa: E402
+from client_code.atomic.subscribers import Render  # noqa: E402
+
+anvil.is_server_side = is_server_side
+
+__version__ = "0.0.1"
+
+
+@atom
+class Node:
+    def __init__(self, value=0):
+        self.value = value
+        self.items = []
+
+
+def make_chain(depth):
+    """a chain of atoms - each selector depends on the previous atom's selector"""
+
+    @atom
+    class Link:
+        def __init__(self, prev):
+            self.prev = prev
+            self.value = 0
+
+        @selector
+        def total(self):
+            prev = self.prev
+            return self.value + (prev.total() if prev is not None else 0)
+
+    link = None
+    chain = []
+    for _ in range(depth):
+        link = Link(link)
+        chain.append(link)
+    return chain
+
+
+def noop():
+    pass
+
+
+def bench_register(report, n, repeat):
+    atoms = [Node() for _ in range(n)]
+
+    def read_all(render):
+        with RenderContext(render):
+            for a in atoms:
+                a.value
+
+    seconds = measure(read_all, setup=lambda: Render(noop), repeat=repeat)
+    report.add("register.new", {"atoms": n}, seconds, ops=n)
+
+    render = Render(noop)
+    read_all(render)
+    seconds = measure(lambda: read_all(render), repeat=repeat)
+    report.add("register.existing", {"atoms": n}, seconds, ops=n)
+
+
+def make_renders(atoms, m, k):
+    n = len(atoms)
+    for i in range(m):
+        deps = [atoms[(i + j) % n] for j in range(k)]
+        autorun(lambda deps=deps: [a.value for a in deps])
+
+
+def bench_request(report, n, m, k, repeat):
+    with new_scope() as scope:
+        atoms = [Node() for _ in range(n)]
+        make_renders(atoms, m, k)
+
+        def request_all(_):
+            for a in atoms:
+                request(a, "value")
+
+        def queue_all():
+            request_all(None)
+
+        seconds = measure(request_all, setup=call_queued, repeat=repeat)
+        params = {"atoms": n, "renders": m, "reads": k}
+        report.add("request", params, seconds, ops=n)
+
+        seconds = measure(lambda _: call_queued(), setup=queue_all, repeat=repeat)
+        report.add("call_queued", params, seconds, ops=m)
+
+        target = atoms[0]
+
+        @action
+        def write():
+            target.value += 1
+
+        seconds = measure(write, number=100, repeat=repeat)
+        report.add("action.write", {**params, "renders_per_write": k}, seconds)
+    scope.dispose()
+
+
+def bench_selectors(report, depth, repeat):
+    with new_scope() as scope:
+        chain = make_chain(depth)
+        head, tail = chain[0], chain[-1]
+        autorun(lambda: tail.total())
+
+        def write():
+            head.value += 1
+
+        seconds = measure(write, number=10, repeat=repeat)
+        report.add("selector.recompute", {"depth": depth}, seconds, ops=depth)
+
+        seconds = measure(tail.total, number=1000, repeat=repeat)
+        report.add("selector.cached", {"depth": depth}, seconds)
+    scope.dispose()
+
+
+def bench_lists(report, size, repeat):
+    with new_scope() as scope:
+        node = Node()
+        items = list(range(size))
+
+        def assign():
+            node.items = items
+
+        seconds = measure(assign, repeat=repeat)
+        report.add("list.assign", {"size": size}, seconds, ops=size)
+
+        autorun(lambda: len(node.items))
+        seconds = measure(lambda: node.items.append(0), number=100, repeat=repeat)
+        report.add("list.append", {"size": size}, seconds)
+    scope.dispose()
+
+
+def bench_memory(report, m, k):
+    atoms = [Node() for _ in range(k)]
+    scope = new_scope()
+
+    def create():
+        with scope:
+            make_renders(atoms, m, k)
+
+    _, current, peak = peak_memory(create)
+    params = {"renders": m, "reads": k}
+    report.add(
+        "memory.per_subscriber", params, bytes=current // m, peak_bytes=peak // m
+    )
+    scope.dispose()
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--atoms", type=int, default=1000, help="N")
+    parser.add_argument("--renders", type=int, default=1000, help="M")
+    parser.add_argument("--reads", type=int, default=10, help="K")
+    parser.add_argument("--depth", type=int, default=100, help="D")
+    parser.add_argument("--list-size", type=int, default=10_000, help="L")
+    args = parser.parse_args(argv)
+
+    report = Report("atomic")
+    bench_register(report, args.atoms, args.repeat)
+    bench_request(report, args.atoms, args.renders, args.reads, args.repeat)
+    bench_selectors(report, args.depth, args.repeat)
+    bench_lists(report, args.list_size, args.repeat)
+    bench_memory(report, args.renders, args.reads)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""Server side incremental mode vs recomputing an aggregate on every request
+
+    python -m benchmarks.atomic_incremental --writes 100000
+
+A ledger has G groups of K accounts.
+Each write updates the balance of a random account and then reads the ledger total.
+With incremental mode, only the group that changed is re-summed.
+"""
+
+import random
+import time
+
+import anvil
+
+from client_code import atomic
+
+from .harness import Report, make_parser
+
+__version__ = "0.0.1"
+
+
+def make_classes():
+    @atomic.atom
+    class Account:
+        def __init__(self, balance=0):
+            self.balance = balance
+
+    @atomic.atom
+    class Group:
+        def __init__(self, accounts):
+            self.accounts = accounts
+
+        @atomic.selector
+        def total(self):
+            return sum(a.balance for a in self.accounts)
+
+    @atomic.atom
+    class Ledger:
+        def __init__(self, groups):
+            self.groups = groups
+
+        @atomic.selector
+        def total(self):
+            return sum(g.total() for g in self.groups)
+
+    return Account, Group, Ledger
+
+
+def make_ledger(classes, num_groups, group_size):
+    Account, Group, Ledger = classes
+    groups = [Group([Account(1) for _ in range(group_size)]) for _ in range(num_groups)]
+    return Ledger(groups)
+
+
+def run(ledger, writes, seed):
+    rng = random.Random(seed)
+    accounts = [a for g in ledger.groups for a in g.accounts]
+    total = 0
+    start = time.perf_counter()
+    for _ in range(writes):
+        account = rng.choice(accounts)
+        account.balance += 1
+        total = ledger.total()
+    return time.perf_counter() - start, total
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--writes", type=int, default=100_000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--group-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    assert anvil.is_server_side(), "run this benchmark with the anvil-uplink stubs"
+    shape = args.groups, args.group_size
+    params = {"writes": args.writes, "groups": args.groups, "size": args.group_size}
+    report = Report("atomic_incremental")
+
+    inert = make_ledger(make_classes(), *shape)
+    inert_time, inert_total = run(inert, args.writes, args.seed)
+    report.add("recompute", params, inert_time, ops=args.writes)
+
+    atomic.enable_incremental()
+    incremental = make_ledger(make_classes(), *shape)
+    incremental_time, incremental_total = run(incremental, args.writes, args.seed)
+    report.add("incremental", params, incremental_time, ops=args.writes)
+
+    assert inert_total == incremental_total
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
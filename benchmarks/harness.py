@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""Shared helpers for the benchmark scripts
+
+Each benchmark module builds a Report, adds results to it and calls report.finish(args).
+Results are printed as a table and, with --json, written as a machine readable file.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+__version__ = "0.0.1"
+
+
+def make_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--json", metavar="PATH", help="write the results to a file")
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser
+
+
+def measure(fn, setup=None, number=1, repeat=5):
+    """call setup() then time fn() `number` times, `repeat` times
+    setup is not timed - its return value is passed to fn
+    Returns: the best time per call in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            if setup is None:
+                for _ in range(number):
+                    fn()
+            else:
+                for _ in range(number):
+                    fn(arg)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = min(best, elapsed / number)
+    return best
+
+
+def peak_memory(fn):
+    """Returns: (the return value of fn(), the bytes still allocated, the peak bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        rv = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return rv, current, peak
+
+
+class Report:
+    def __init__(self, suite):
+        self.suite = suite
+        self.results = []
+
+    def add(self, name, params=None, seconds=None, ops=1, **metrics):
+        """add a result - seconds is the time taken for `ops` operations"""
+        result = {"name": name, "params": params or {}}
+        if seconds is not None:
+            result["seconds"] = seconds
+            result["us_per_op"] = seconds / ops * 1e6
+            result["ops_per_sec"] = ops / seconds if seconds else None
+        result.update(metrics)
+        self.results.append(result)
+        return result
+
+    def as_dict(self):
+        return {
+            "suite": self.suite,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "results": self.results,
+        }
+
+    def print_table(self, file=sys.stdout):
+        for r in self.results:
+            params = ", ".join(f"{k}={v}" for k, v in r["params"].items())
+            metrics = []
+            if "us_per_op" in r:
+                metrics.append(f"{r['us_per_op']:12.3f} us/op")
+                metrics.append(f"{r['ops_per_sec']:14,.0f} ops/s")
+            metrics += [
+                f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}"
+                for k, v in r.items()
+                if k not in ("name", "params", "seconds", "us_per_op", "ops_per_sec")
+            ]
+            print(f"{r['name']:<28} {'  '.join(metrics)}  [{params}]", file=file)
+
+    def finish(self, args):
+        self.print_table()
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(self.as_dict(), f, indent=2)
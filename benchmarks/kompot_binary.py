@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot binary values - base64 strings vs the old list of ints
+
+    python -m benchmarks.kompot_binary --size 1000000
+
+Each encoding serializes N bytes and sends them through JSON, then back again.
+base64 - bytes as they are sent now
+ints   - the same bytes as a list of ints, the way older versions of kompot sent them
+array  - N/8 doubles in an array.array
+"""
+
+import json
+from array import array
+
+from client_code import kompot
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+def dumps(obj):
+    serialized = kompot.serialize(obj)
+    serialized.pop(UNHANDLED)
+    return json.dumps(serialized)
+
+
+def loads(payload):
+    serialized = json.loads(payload)
+    serialized[UNHANDLED] = []
+    return kompot.reconstruct(serialized)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=1_000_000, help="N")
+    args = parser.parse_args(argv)
+
+    data = bytes(i % 251 for i in range(args.size))
+    values = {
+        "base64": data,
+        "ints": list(data),
+        "array": array("d", (i / 3 for i in range(args.size // 8))),
+    }
+    report = Report("kompot_binary")
+    for encoding, obj in values.items():
+        params = {"encoding": encoding, "size": args.size}
+        payload = dumps(obj)
+        seconds = measure(lambda: dumps(obj), repeat=args.repeat)
+        report.add("dumps", params, seconds, ops=args.size, bytes=len(payload))
+        seconds = measure(lambda: loads(payload), repeat=args.repeat)
+        report.add("loads", params, seconds, ops=args.size)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot compiled per-class serializers vs the generic __dict__ path
+
+    python -m benchmarks.kompot_classes --width 10000
+
+Each class kind is serialized and reconstructed as a list of W objects.
+The compiled runs use the fields kompot finds for the class.
+The generic runs replace the compiled encoder with one that walks __dict__.
+Lists are sent one object at a time - see kompot_serialize for the columnar encoding.
+"""
+
+import anvil.server
+
+from client_code import kompot
+from client_code.dataklasses import portable_dataklass
+from client_code.kompot import _serialize
+from client_code.kompot._compile import Encoder, get_encoder
+from client_code.kompot._register import encoders
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Plain:
+    def __init__(self, a, b, c):
+        self.a = a
+        self.b = b
+        self.c = c
+
+
+@kompot.register
+@portable_dataklass
+class Klass:
+    a: int
+    b: str
+    c: float
+
+
+@kompot.register
+@anvil.server.portable_class
+class Slotted:
+    __slots__ = ("a", "b", "c")
+
+    def __init__(self, a, b, c):
+        self.a = a
+        self.b = b
+        self.c = c
+
+
+@kompot.register(fields=["a", "b", "c"])
+@anvil.server.portable_class
+class Schema(Plain):
+    pass
+
+
+def bench(report, cls, width, repeat, generic):
+    objs = [cls(i, str(i), i / 2) for i in range(width)]
+    params = {"class": cls.__name__, "size": width, "generic": generic}
+    compiled = get_encoder(cls)
+    if generic:
+        encoders[cls] = Encoder(compiled.name)
+    try:
+        seconds = measure(lambda: kompot.serialize(objs), repeat=repeat)
+        report.add("serialize", params, seconds, ops=width)
+        seconds = measure(
+            kompot.reconstruct, setup=lambda: kompot.serialize(objs), repeat=repeat
+        )
+        report.add("reconstruct", params, seconds, ops=width)
+    finally:
+        encoders[cls] = compiled
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--width", type=int, default=10_000, help="W")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_classes")
+    min_rows = _serialize.COLUMNAR_MIN_ROWS
+    _serialize.COLUMNAR_MIN_ROWS = float("inf")
+    try:
+        for cls in (Plain, Klass, Schema):
+            bench(report, cls, args.width, args.repeat, generic=True)
+            bench(report, cls, args.width, args.repeat, generic=False)
+        # slotted objects have no __dict__ so there is no generic path
+        bench(report, Slotted, args.width, args.repeat, generic=False)
+    finally:
+        _serialize.COLUMNAR_MIN_ROWS = min_rows
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot RPC codecs - encode and decode time and payload size
+
+    python -m benchmarks.kompot_codecs --size 100000
+
+Each payload is serialized once and then encoded and decoded with every codec.
+numbers - N floats and ints
+objects - N/10 portable objects with a few fields
+text    - N/10 short strings
+"""
+
+import random
+
+import anvil.server
+
+from client_code import kompot
+from client_code.kompot._codecs import BinaryCodec, JSONCodec, packb
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Reading:
+    def __init__(self, sensor, value, ok):
+        self.sensor = sensor
+        self.value = value
+        self.ok = ok
+
+
+def make_payloads(size, seed):
+    rng = random.Random(seed)
+    numbers = [rng.random() * 1000 for _ in range(size // 2)]
+    numbers += [rng.randrange(-(10**6), 10**6) for _ in range(size // 2)]
+    objects = [
+        Reading(f"s{i % 50}", rng.random(), i % 7 != 0) for i in range(size // 10)
+    ]
+    text = [f"row {i} of the table" for i in range(size // 10)]
+    return {"numbers": numbers, "objects": objects, "text": text}
+
+
+def encoded_bytes(codec, payload):
+    if codec is BinaryCodec:
+        return len(packb(payload))
+    return len(codec.dumps(payload).encode("utf-8"))
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=100_000, help="N")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_codecs")
+    for shape, obj in make_payloads(args.size, args.seed).items():
+        serialized = kompot.serialize(obj)
+        serialized.pop(UNHANDLED)
+        size = len(obj)
+        for codec in (JSONCodec, BinaryCodec):
+            params = {"shape": shape, "size": size, "codec": codec.name}
+            nbytes = encoded_bytes(codec, serialized)
+            seconds = measure(lambda: codec.dumps(serialized), repeat=args.repeat)
+            report.add("dumps", params, seconds, ops=size, bytes=nbytes)
+            payload = codec.dumps(serialized)
+            seconds = measure(lambda: codec.loads(payload), repeat=args.repeat)
+            report.add("loads", params, seconds, ops=size)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
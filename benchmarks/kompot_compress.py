@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot payload compression - size and time with zlib and the pure Python fallback
+
+    python -m benchmarks.kompot_compress --size 10000
+
+Each payload is serialized and encoded with the JSON codec, then compressed and decompressed.
+objects - N portable objects with a few fields
+numbers - N floats
+text    - N short strings
+zlib is used on the server, the pure Python version on clients without zlib.
+"""
+
+import random
+
+import anvil.server
+
+from client_code import kompot
+from client_code.kompot import _compress
+from client_code.kompot._codecs import JSONCodec
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Order:
+    def __init__(self, id, customer, total, status):
+        self.id = id
+        self.customer = customer
+        self.total = total
+        self.status = status
+
+
+def make_payloads(size, seed):
+    rng = random.Random(seed)
+    statuses = ["open", "paid", "shipped", "cancelled"]
+    objects = [
+        Order(i, f"customer {rng.randrange(500)}", rng.randrange(10**5) / 100, s)
+        for i, s in ((i, rng.choice(statuses)) for i in range(size))
+    ]
+    numbers = [rng.random() * 1000 for _ in range(size)]
+    text = [f"note {i}: {rng.choice(statuses)}" for i in range(size)]
+    return {"objects": objects, "numbers": numbers, "text": text}
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=10_000, help="N")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    zlib = _compress._zlib
+    report = Report("kompot_compress")
+    for shape, obj in make_payloads(args.size, args.seed).items():
+        serialized = kompot.serialize(obj)
+        serialized.pop(UNHANDLED)
+        data = JSONCodec.dumps(serialized).encode("utf-8")
+        for impl in ("zlib", "python"):
+            _compress._zlib = zlib if impl == "zlib" else None
+            try:
+                params = {"shape": shape, "size": args.size, "impl": impl}
+                compressed = _compress.compress(data)
+                sizes = {"bytes": len(data), "compressed": len(compressed)}
+                sizes["ratio"] = round(len(compressed) / len(data), 3)
+                seconds = measure(lambda: _compress.compress(data), repeat=args.repeat)
+                report.add("compress", params, seconds, ops=len(data), **sizes)
+                seconds = measure(
+                    lambda: _compress.decompress(compressed), repeat=args.repeat
+                )
+                report.add("decompress", params, seconds, ops=len(data))
+            finally:
+                _compress._zlib = zlib
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
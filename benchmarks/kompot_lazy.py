@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot lazy vs eager reconstruction
+
+    python -m benchmarks.kompot_lazy --size 50000
+
+Each payload holds N portable objects and is reconstructed from a fresh copy of its JSON.
+columns - a list of N objects of one class, sent as columns
+objects - a list of N objects of alternating classes, sent one entry per object
+nested  - a dict with a list of N/5 orders, each with a customer and a list of 4 lines
+first   - reconstruct and read the first object
+all     - reconstruct and read every object
+"""
+
+import json
+
+import anvil.server
+
+from client_code import kompot
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@kompot.register
+@anvil.server.portable_class
+class Label:
+    def __init__(self, x, text):
+        self.x = x
+        self.text = text
+
+
+@kompot.register
+@anvil.server.portable_class
+class Customer:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+@kompot.register
+@anvil.server.portable_class
+class Line:
+    def __init__(self, x, qty):
+        self.x = x
+        self.qty = qty
+
+
+@kompot.register
+@anvil.server.portable_class
+class Order:
+    def __init__(self, x, customer, lines):
+        self.x = x
+        self.customer = customer
+        self.lines = lines
+
+
+def make_payloads(size):
+    columns = [Point(i, -i) for i in range(size)]
+    objects = [Point(i, -i) if i % 2 else Label(i, str(i)) for i in range(size)]
+    orders = [
+        Order(i, Customer(i % 100, f"c{i % 100}"), [Line(j, i) for j in range(4)])
+        for i in range(size // 5)
+    ]
+    return {"columns": columns, "objects": objects, "nested": {"orders": orders}}
+
+
+def read_first(obj):
+    rows = obj["orders"] if isinstance(obj, dict) else obj
+    order = rows[0]
+    return order.x if not hasattr(order, "lines") else order.lines[0].x
+
+
+def read_all(obj):
+    if isinstance(obj, dict):
+        return sum(line.x for order in obj["orders"] for line in order.lines)
+    return sum(item.x for item in obj)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=50_000, help="N")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_lazy")
+    for shape, obj in make_payloads(args.size).items():
+        serialized = kompot.serialize(obj)
+        serialized.pop(UNHANDLED)
+        payload = json.dumps(serialized)
+        for read_name, read in (("first", read_first), ("all", read_all)):
+            for lazy in (False, True):
+                params = {"shape": shape, "read": read_name, "lazy": lazy}
+                seconds = measure(
+                    lambda json_obj: read(kompot.reconstruct(json_obj, lazy=lazy)),
+                    setup=lambda: json.loads(payload),
+                    repeat=args.repeat,
+                )
+                report.add("reconstruct", params, seconds, ops=args.size)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot numeric and datetime leaves
+
+    python -m benchmarks.kompot_leaves --size 1000000
+
+Each payload is a list of N leaves.
+ints      - ints that fit in JSON, with a few large ones
+floats    - finite floats, with a few infinities
+datetimes - datetimes with a fixed utc offset, one a minute
+naive     - datetimes without a timezone, sent with the local offset
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import anvil.tz
+
+from client_code import kompot
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+def make_payloads(size):
+    start = datetime(2021, 1, 2, 3, 4, 5, 600000)
+    minute = timedelta(minutes=1)
+    tz = anvil.tz.tzoffset(hours=2)
+    return {
+        "ints": [i if i % 1000 else 2**40 + i for i in range(size)],
+        "floats": [i / 7 if i % 1000 else float("inf") for i in range(size)],
+        "datetimes": [(start + i * minute).replace(tzinfo=tz) for i in range(size)],
+        "naive": [start + i * minute for i in range(size)],
+    }
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=1_000_000, help="N")
+    parser.add_argument("--shapes", nargs="*", help="only run these payloads")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_leaves")
+    for shape, obj in make_payloads(args.size).items():
+        if args.shapes and shape not in args.shapes:
+            continue
+        params = {"shape": shape, "size": args.size}
+        serialized = kompot.serialize(obj)
+        serialized.pop(UNHANDLED)
+        nbytes = len(json.dumps(serialized))
+        seconds = measure(lambda: kompot.serialize(obj), repeat=args.repeat)
+        report.add("serialize", params, seconds, ops=args.size, bytes=nbytes)
+        seconds = measure(
+            kompot.reconstruct, setup=lambda: kompot.serialize(obj), repeat=args.repeat
+        )
+        report.add("reconstruct", params, seconds, ops=args.size)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
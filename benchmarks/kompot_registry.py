@@ -0,0 +1,148 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot type lookups - unknown names and cold start decoding
+
+    python -m benchmarks.kompot_registry --modules 50
+
+unknown - reconstruct a payload with a type that isn't registered, which raises
+          module=importable - the module imports but doesn't register the type
+          module=failing - the module can't be imported
+          cached - the failed lookup is remembered, uncached - the module import is tried every time
+cold    - the first reconstruct of a payload with a class from each of M modules that haven't been imported
+          lazy - each module is imported when its first type name is seen
+          preload - kompot.preload(manifest) at startup, then reconstruct
+"""
+
+import importlib
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from client_code import kompot
+from client_code.kompot import _register
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+PACKAGE = "kompot_registry_bench"
+
+MODULE = """
+import anvil.server
+from client_code import kompot
+
+
+@kompot.register
+@anvil.server.portable_class
+class Thing{i}:
+    def __init__(self, x):
+        self.x = x
+"""
+
+
+def write_modules(root, n):
+    package = Path(root, PACKAGE)
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    for i in range(n):
+        (package / f"types_{i}.py").write_text(MODULE.format(i=i))
+
+
+def unload(n):
+    """forget the modules and their classes, as if this were a new server process"""
+    for i in range(n):
+        mod = f"{PACKAGE}.types_{i}"
+        sys.modules.pop(mod, None)
+        tp_name = f"{mod}.Thing{i}"
+        cls = _register.registered_names.pop(tp_name, None)
+        _register.registered_types.pop(cls, None)
+        _register.decoders.pop(tp_name, None)
+    importlib.invalidate_caches()
+
+
+def make_payload(n):
+    objs = []
+    for i in range(n):
+        cls = getattr(importlib.import_module(f"{PACKAGE}.types_{i}"), f"Thing{i}")
+        objs.append(cls(i))
+    serialized = kompot.serialize(objs)
+    serialized.pop(UNHANDLED)
+    return serialized
+
+
+def copy(serialized):
+    import json
+
+    return json.loads(json.dumps(serialized))
+
+
+def bench_unknown(report, repeat, number=1000):
+    def reconstruct_all(serialized, cached):
+        for _ in range(number):
+            if not cached:
+                _register._missing.clear()
+            try:
+                kompot.reconstruct(copy(serialized))
+            except Exception:
+                pass
+
+    for module, tp_name in (
+        ("importable", "json.Missing"),
+        ("failing", "nowhere.Missing"),
+    ):
+        serialized = {"V": 2, "_": [{}], "P": [[0, "_", 0]], "N": [tp_name]}
+        serialized["T"] = [[0, 1]]
+        for cached in (False, True):
+            seconds = measure(
+                lambda: reconstruct_all(serialized, cached), repeat=repeat
+            )
+            params = {"module": module, "cached": cached}
+            report.add("unknown", params, seconds, ops=number)
+    _register._missing.clear()
+
+
+def bench_cold(report, modules, repeat):
+    root = tempfile.mkdtemp()
+    sys.path.insert(0, root)
+    try:
+        write_modules(root, modules)
+        serialized = make_payload(modules)
+        manifest = kompot.get_manifest()
+        for preload in (False, True):
+            best = best_decode = float("inf")
+            for _ in range(repeat):
+                unload(modules)
+                payload = copy(serialized)
+                start = time.perf_counter()
+                if preload:
+                    kompot.preload(manifest)
+                decode_start = time.perf_counter()
+                kompot.reconstruct(payload)
+                end = time.perf_counter()
+                best = min(best, end - start)
+                best_decode = min(best_decode, end - decode_start)
+            params = {"modules": modules, "preload": preload}
+            report.add("cold", params, best, ops=modules, decode_seconds=best_decode)
+    finally:
+        unload(modules)
+        sys.path.remove(root)
+        sys.modules.pop(PACKAGE, None)
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--modules", type=int, default=50, help="M")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_registry")
+    bench_unknown(report, args.repeat)
+    bench_cold(report, args.modules, args.repeat)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot serialize and reconstruct on deep and wide payloads
+
+    python -m benchmarks.kompot_serialize --json kompot_serialize.json
+
+deep - D nested portable objects, each wrapping a tuple
+wide - a list of W portable objects, each with a few leaves and a tuple
+
+Each shape is run with the original format (version 1) and the compact format,
+with and without the columnar encoding of homogeneous lists.
+"""
+
+import json
+
+import anvil.server
+
+from client_code import kompot
+from client_code.kompot import _serialize
+from client_code.kompot._serialize import FORMAT_VERSION, VALUE
+
+from .harness import Report, make_parser, measure
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Item:
+    def __init__(self, name, value, child=None):
+        self.name = name
+        self.value = value
+        self.pair = (value, child)
+
+
+def make_deep(depth):
+    obj = None
+    for i in range(depth):
+        obj = Item("item", i, obj)
+    return obj
+
+
+def make_wide(width):
+    return [Item(f"item{i}", i) for i in range(width)]
+
+
+def payload_bytes(serialized):
+    """the size of the JSON that would be sent, split into the value and the metadata"""
+    try:
+        total = len(json.dumps(serialized, separators=(",", ":")))
+        value = len(json.dumps(serialized[VALUE], separators=(",", ":")))
+    except RecursionError:
+        # the json module recurses - very deep payloads can't be measured
+        return {}
+    return {"bytes": total, "metadata_bytes": total - value}
+
+
+def bench(report, shape, obj, size, repeat, version, columnar=False):
+    params = {"shape": shape, "size": size, "version": version}
+    if version > 1:
+        params["columnar"] = columnar
+    min_rows = _serialize.COLUMNAR_MIN_ROWS
+    if not columnar:
+        _serialize.COLUMNAR_MIN_ROWS = float("inf")
+    try:
+        bench_version(report, params, obj, size, repeat, version)
+    finally:
+        _serialize.COLUMNAR_MIN_ROWS = min_rows
+
+
+def bench_version(report, params, obj, size, repeat, version):
+    seconds = measure(lambda: kompot.serialize(obj, version), repeat=repeat)
+    sizes = payload_bytes(kompot.serialize(obj, version))
+    report.add("serialize", params, seconds, ops=size, **sizes)
+
+    # reconstruct mutates the payload so serialize a fresh copy each time
+    seconds = measure(
+        kompot.reconstruct,
+        setup=lambda: kompot.serialize(obj, version),
+        repeat=repeat,
+    )
+    report.add("reconstruct", params, seconds, ops=size)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--depth", type=int, default=10_000, help="D")
+    parser.add_argument("--width", type=int, default=10_000, help="W")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_serialize")
+    deep, wide = make_deep(args.depth), make_wide(args.width)
+    bench(report, "deep", deep, args.depth, args.repeat, 1)
+    bench(report, "deep", deep, args.depth, args.repeat, FORMAT_VERSION)
+    for version, columnar in (
+        (1, False),
+        (FORMAT_VERSION, False),
+        (FORMAT_VERSION, True),
+    ):
+        bench(report, "wide", wide, args.width, args.repeat, version, columnar)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot streamed results vs one large result
+
+    python -m benchmarks.kompot_stream --rows 100000 --page 1000
+
+The server function builds N portable objects, either as one list or yielded in pages of P.
+Calls go through kompot's serialization in process - there is no network.
+The client counts the rows and throws them away.
+first - the time until the client has the first row
+total - the time until the client has every row
+peak  - the peak memory used by the server and the client together
+"""
+
+import time
+
+import anvil.server
+
+from client_code import kompot
+from client_code.kompot import _rpc
+
+from .harness import Report, make_parser, measure, peak_memory
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Row:
+    def __init__(self, id, name, value):
+        self.id = id
+        self.name = name
+        self.value = value
+
+
+def make_row(i):
+    return Row(i, f"row {i}", i / 3)
+
+
+@kompot.callable("bench_rows")
+def get_rows(n):
+    return [make_row(i) for i in range(n)]
+
+
+@kompot.callable("bench_pages")
+def get_pages(n, page):
+    for start in range(0, n, page):
+        yield [make_row(i) for i in range(start, min(n, start + page))]
+
+
+def server_call(fn_name, payload, unhandled, *codec_name):
+    fn = _rpc._wrap_callable(_rpc._registered[fn_name])
+    return fn(payload, unhandled, *codec_name)
+
+
+def consume(get_chunks):
+    """Returns: the seconds until the first row"""
+    start = time.perf_counter()
+    first = None
+    n = 0
+    for chunk in get_chunks():
+        if first is None:
+            first = time.perf_counter() - start
+        n += len(chunk)
+    return first
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="N")
+    parser.add_argument("--page", type=int, default=1000, help="P")
+    args = parser.parse_args(argv)
+    anvil.server.call = anvil.server.call_s = server_call
+
+    runs = {
+        "full": lambda: consume(lambda: [kompot.call("bench_rows", args.rows)]),
+        "stream": lambda: consume(
+            lambda: kompot.stream("bench_pages", args.rows, args.page)
+        ),
+    }
+    report = Report("kompot_stream")
+    for mode, run in runs.items():
+        params = {"mode": mode, "rows": args.rows, "page": args.page}
+        first = min(run() for _ in range(args.repeat))
+        _, _, peak = peak_memory(run)
+        seconds = measure(run, repeat=args.repeat)
+        report.add("total", params, seconds, ops=args.rows, peak=peak)
+        report.add("first", params, first)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+"""kompot throughput against plain Anvil serialization
+
+    python -m benchmarks.kompot_suite --size 10000 --json suite.json
+
+Every shape is run through kompot and through Anvil's own serialization on its own.
+kompot
+  serialize, reconstruct, preserve - the JSONable format, without the wire
+  encode - _dumps, then Anvil serializes the payload and the unhandled objects for the wire
+  decode - the reverse, ending with _loads
+anvil
+  serialize, reconstruct - anvil.server's fill_out_media and _reconstruct_objects
+  encode, decode - the same with the JSON for the wire
+bytes is the size of the JSON plus any Media sent alongside it
+peak is the peak memory of one encode and decode
+
+deep      - D nested portable objects
+wide      - N dicts of leaves
+classes   - N portable objects of 10 different classes
+datetimes - N timezone aware datetimes and dates
+bytes     - N/10 bytes values of 256 bytes, sent as Media by plain Anvil
+unhandled - N portable objects, every 10th item a small Media object
+"""
+
+import json
+import random
+from datetime import date, datetime
+
+import anvil
+import anvil.server
+import anvil.tz
+from anvil import _server as anvil_server
+
+from client_code import kompot
+from client_code.kompot import _rpc
+from client_code.kompot._codecs import get_codec
+from client_code.kompot._serialize import UNHANDLED
+
+from .harness import Report, make_parser, measure, peak_memory
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Node:
+    def __init__(self, value, child=None):
+        self.value = value
+        self.child = child
+
+
+def make_class(i):
+    def __init__(self, a, b, c):
+        self.a = a
+        self.b = b
+        self.c = c
+
+    cls = type(f"Shape{i}", (), {"__init__": __init__, "__module__": __name__})
+    return kompot.register(anvil.server.portable_class(cls))
+
+
+CLASSES = [make_class(i) for i in range(10)]
+
+
+def make_shapes(size, depth, seed):
+    """Returns: {shape: (obj, the same payload for plain Anvil, the number of items)}"""
+    rng = random.Random(seed)
+    deep = None
+    for i in range(depth):
+        deep = Node(i, deep)
+    wide = [
+        {"id": i, "name": f"row {i}", "value": rng.random(), "ok": i % 3 == 0}
+        for i in range(size)
+    ]
+    classes = [CLASSES[i % 10](i, f"s{i}", rng.random()) for i in range(size)]
+    tz = anvil.tz.tzoffset(hours=1)
+    datetimes = [
+        (
+            datetime(2021, 1, 1 + i % 28, i % 24, i % 60, tzinfo=tz)
+            if i % 2
+            else date(2021, 1 + i % 12, 1 + i % 28)
+        )
+        for i in range(size)
+    ]
+    blobs = [bytes(rng.randrange(256) for _ in range(256)) for _ in range(size // 10)]
+    media = [anvil.BlobMedia("application/octet-stream", b) for b in blobs]
+    unhandled = [
+        anvil.BlobMedia("text/plain", b"media") if i % 10 == 0 else Node(i)
+        for i in range(size)
+    ]
+    return {
+        "deep": (deep, deep, depth),
+        "wide": (wide, wide, size),
+        "classes": (classes, classes, size),
+        "datetimes": (datetimes, datetimes, size),
+        "bytes": (blobs, media, len(blobs)),
+        "unhandled": (unhandled, unhandled, size),
+    }
+
+
+# PLAIN ANVIL
+
+
+def anvil_serialize(obj):
+    """Returns: (the JSONable request, the Media objects sent alongside it)"""
+    media = []
+
+    def enqueue_media(m):
+        media.append(m)
+        return {"id": len(media) - 1}
+
+    return anvil_server.fill_out_media({"value": obj}, enqueue_media), media
+
+
+def anvil_reconstruct(serialized, media):
+    rv = anvil_server._reconstruct_objects(serialized, lambda d: media[d["id"]])
+    return rv["value"]
+
+
+def anvil_encode(obj):
+    serialized, media = anvil_serialize(obj)
+    return json.dumps(serialized), media
+
+
+def anvil_decode(wire):
+    text, media = wire
+    return anvil_reconstruct(json.loads(text), media)
+
+
+# KOMPOT
+
+
+def kompot_encode(obj, codec, compress):
+    payload, unhandled = _rpc._dumps(obj, codec)
+    if compress:
+        payload = _rpc._compress(payload) or payload
+    return anvil_encode([payload, unhandled])
+
+
+def kompot_decode(wire, codec):
+    payload, unhandled = anvil_decode(wire)
+    if isinstance(payload, anvil.Media) and payload.content_type in (
+        _rpc.ZLIB_TEXT,
+        _rpc.ZLIB_BYTES,
+    ):
+        payload = _rpc._decompress(payload)
+    return _rpc._loads(payload, unhandled, codec)
+
+
+def wire_bytes(wire):
+    text, media = wire
+    return len(text.encode("utf-8")) + sum(len(m.get_bytes()) for m in media)
+
+
+def fresh(serialized):
+    """a copy of the JSONable part, since reconstructing changes it in place"""
+    unhandled = serialized.get(UNHANDLED)
+    rv = json.loads(json.dumps({k: v for k, v in serialized.items() if k != UNHANDLED}))
+    if unhandled is not None:
+        rv[UNHANDLED] = unhandled
+    return rv
+
+
+def bench_kompot(report, shape, obj, n, args):
+    codec = get_codec(args.codec)
+    params = {"shape": shape, "impl": "kompot", "n": n}
+
+    seconds = measure(lambda: kompot.serialize(obj), repeat=args.repeat)
+    serialized = kompot.serialize(obj)
+    nbytes = len(json.dumps({k: v for k, v in serialized.items() if k != UNHANDLED}))
+    report.add("serialize", params, seconds, ops=n, bytes=nbytes)
+
+    seconds = measure(
+        kompot.reconstruct, setup=lambda: fresh(serialized), repeat=args.repeat
+    )
+    report.add("reconstruct", params, seconds, ops=n)
+
+    if not serialized[UNHANDLED]:
+        seconds = measure(lambda: kompot.preserve(obj), repeat=args.repeat)
+        report.add("preserve", params, seconds, ops=n)
+
+    encode = lambda: kompot_encode(obj, codec, args.compress)  # noqa: E731
+    seconds = measure(encode, repeat=args.repeat)
+    wire = encode()
+    report.add("encode", params, seconds, ops=n, bytes=wire_bytes(wire))
+    seconds = measure(lambda: kompot_decode(wire, codec), repeat=args.repeat)
+    _, _, peak = peak_memory(lambda: kompot_decode(encode(), codec))
+    report.add("decode", params, seconds, ops=n, peak_bytes=peak)
+
+
+def bench_anvil(report, shape, obj, n, args):
+    params = {"shape": shape, "impl": "anvil", "n": n}
+
+    seconds = measure(lambda: anvil_serialize(obj), repeat=args.repeat)
+    serialized, media = anvil_serialize(obj)
+    report.add("serialize", params, seconds, ops=n, bytes=len(json.dumps(serialized)))
+
+    text = json.dumps(serialized)
+    seconds = measure(
+        lambda s: anvil_reconstruct(s, media),
+        setup=lambda: json.loads(text),
+        repeat=args.repeat,
+    )
+    report.add("reconstruct", params, seconds, ops=n)
+
+    seconds = measure(lambda: anvil_encode(obj), repeat=args.repeat)
+    wire = anvil_encode(obj)
+    report.add("encode", params, seconds, ops=n, bytes=wire_bytes(wire))
+    seconds = measure(lambda: anvil_decode(wire), repeat=args.repeat)
+    _, _, peak = peak_memory(lambda: anvil_decode(anvil_encode(obj)))
+    report.add("decode", params, seconds, ops=n, peak_bytes=peak)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__)
+    parser.add_argument("--size", type=int, default=10_000, help="N")
+    parser.add_argument("--depth", type=int, default=200, help="D")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--codec", default="json", help="the kompot codec")
+    parser.add_argument(
+        "--compress", action="store_true", help="compress large kompot payloads"
+    )
+    parser.add_argument("--shape", action="append", help="only run these shapes")
+    args = parser.parse_args(argv)
+
+    report = Report("kompot_suite")
+    shapes = make_shapes(args.size, args.depth, args.seed)
+    for shape, (obj, anvil_obj, n) in shapes.items():
+        if args.shape and shape not in args.shape:
+            continue
+        bench_kompot(report, shape, obj, n, args)
+        bench_anvil(report, shape, anvil_obj, n, args)
+    report.finish(args)
+
+
+if __name__ == "__main__":
+    main()
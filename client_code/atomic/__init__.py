@@ -12,7 +12,9 @@ from .decorators import (
     subscribe,
     unsubscribe,
 )
-from .helpers import bind, set_debug, writeback
+from .helpers import bind, enable_incremental, set_debug, writeback
+from .rendering import new_scope as scope
+from .syncing import apply_patches, pull, sync, sync_handler
 
 __version__ = "0.0.1"
 
@@ -6,7 +6,7 @@ from functools import partial
 
 from anvil.server import portable_class
 
-from .constants import CHANGE, DELETE, IS_SERVER_SIDE, REGISTRAR, SENTINEL
+from .constants import CHANGE, DELETE, REGISTRAR, SENTINEL, is_inert
 from .contexts import ActionContext
 from .decorators import action
 from .registrar import add_registrar
@@ -41,7 +41,7 @@ _object_new = object.__new__
 
 def atom(base):
     """decorator for an atom class"""
-    if IS_SERVER_SIDE:
+    if is_inert():
         return base
 
     class AtomProxy(base):
@@ -104,7 +104,7 @@ def atom(base):
 
 def portable_atom(_cls, name=None):
     """decorator to for atoms that you also want to be portable classes"""
-    if IS_SERVER_SIDE:
+    if is_inert():
         return portable_class(_cls, name)
     elif name is None and type(_cls) is str:
         name = _cls
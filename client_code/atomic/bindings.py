@@ -0,0 +1,153 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+from .constants import BINDINGS, SENTINEL
+from .contexts import RenderContext
+from .subscribers import Render
+
+__version__ = "0.0.1"
+
+# values of these types can be compared with the last value pushed to a component
+_SCALARS = frozenset([str, int, float, bool, type(None)])
+
+
+class Binding:
+    """a single component property bound to an atom attribute or a selector
+    the getter and setter are stored as a function and its args to avoid a closure per binding
+    """
+
+    __slots__ = ["component", "prop", "get_fn", "get_args", "set_fn", "set_args"]
+    __slots__ += ["deps", "last"]
+
+    def __init__(self, component, prop, get_fn, get_args, set_fn, set_args):
+        self.component = component
+        self.prop = prop
+        self.get_fn = get_fn
+        self.get_args = get_args
+        self.set_fn = set_fn
+        self.set_args = set_args
+        self.deps = set()
+        self.last = SENTINEL
+
+    def push(self):
+        """set the component property - unless the value is the same as the last value we pushed"""
+        value = self.get_fn(*self.get_args)
+        last = self.last
+        tp = type(value)
+        if tp is type(last) and tp in _SCALARS and value == last:
+            return
+        self.last = value
+        setattr(self.component, self.prop, value)
+
+    def write(self, **event_args):
+        value = self.last = getattr(self.component, self.prop)
+        self.set_fn(*self.set_args, value)
+
+    def __repr__(self):
+        return type(self.component).__name__ + "." + self.prop
+
+
+class BindingGroup(Render):
+    """a single render subscriber for all the bindings of a form
+    each binding keeps track of its own dependencies
+    when a dependency changes only the bindings that depend on it are re-evaluated
+    """
+
+    def __init__(self, bound):
+        super().__init__(None, bound=bound)
+        self.form = bound
+        self.bindings = {}
+        self.deps = {}  # (atom_registrar, prop) -> bindings
+        self.stale = {}  # used as an ordered set
+        self.current = None
+
+    def add_dependent(self, parent):
+        # bindings outlive the render they were created in
+        # re-binding a component property replaces the previous binding
+        pass
+
+    def add(self, binding):
+        key = (id(binding.component), binding.prop)
+        prev = self.bindings.get(key)
+        if prev is not None:
+            self.stale.pop(prev, None)
+            self.clear_binding(prev)
+        self.bindings[key] = binding
+        self.stale[binding] = None
+        self.render()
+
+    def register(self, atom_registrar, prop):
+        super().register(atom_registrar, prop)
+        binding = self.current
+        if binding is None:
+            return
+        key = (atom_registrar, prop)
+        self.deps.setdefault(key, set()).add(binding)
+        binding.deps.add(key)
+
+    def unregister(self, atom_registrar, prop):
+        super().unregister(atom_registrar, prop)
+        key = (atom_registrar, prop)
+        for binding in self.deps.pop(key, ()):
+            binding.deps.discard(key)
+
+    def invalidate(self, atom_registrar, prop):
+        for binding in self.deps.get((atom_registrar, prop), ()):
+            self.stale[binding] = None
+
+    def clear_binding(self, binding):
+        """remove the dependencies of a binding - unless another binding shares the dependency"""
+        for key in binding.deps:
+            bindings = self.deps[key]
+            bindings.discard(binding)
+            if not bindings:
+                atom_registrar, prop = key
+                atom_registrar.unregister(prop, self, self.mode)
+        binding.deps.clear()
+
+    def dispose(self):
+        # we've been queued so only the stale bindings need to drop their dependencies
+        for binding in self.stale:
+            self.clear_binding(binding)
+
+    def teardown(self):
+        for binding in self.bindings.values():
+            self.clear_binding(binding)
+        self.bindings.clear()
+        self.stale.clear()
+
+    def render(self, event_name=None, **event_args):
+        immediate = event_name == "x-force-render"
+        if self.maybe_delay(immediate=immediate):
+            return
+        stale, self.stale = self.stale, {}
+        try:
+            with self.scope, RenderContext(self):
+                for binding in stale:
+                    self.current = binding
+                    binding.push()
+        finally:
+            self.current = None
+
+    def __repr__(self):
+        return f"bindings: {type(self.form).__name__}"
+
+
+def _get_form(component):
+    """walk up the component tree to the nearest form"""
+    node = component
+    while not hasattr(node, "init_components"):
+        parent = getattr(node, "parent", None)
+        if parent is None:
+            break
+        node = parent
+    return node
+
+
+def get_group(component):
+    form = _get_form(component)
+    group = getattr(form, BINDINGS, None)
+    if group is None:
+        group = BindingGroup(form)
+        setattr(form, BINDINGS, group)
+    return group
@@ -6,6 +6,7 @@ from anvil import is_server_side
 __version__ = "0.0.1"
 
 REGISTRAR = "__atom_registrar__"
+BINDINGS = "__atom_bindings__"
 
 # MODES
 SELECTOR = "selector"
@@ -21,3 +22,13 @@ CHANGE = "changing"
 DELETE = "deleting"
 
 IS_SERVER_SIDE = is_server_side()
+
+
+def is_inert():
+    """on the server atoms, selectors, actions and renders are inert
+    i.e. the decorators return the original class or function - unless incremental mode is enabled
+    """
+    return IS_SERVER_SIDE and not is_inert.incremental
+
+
+is_inert.incremental = False
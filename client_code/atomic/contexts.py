@@ -1,10 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
 
-from functools import partial
-
 from .constants import ACTION, IGNORE, REACTION, RENDER, SELECTOR
-from .rendering import active, call_queued, log, queued
+from .rendering import call_queued, get_scope, log
 
 __version__ = "0.0.1"
 
@@ -24,7 +22,7 @@ class Context:
             return f"{self.mode}: {self.context}"
 
     def _check_ignore(self):
-        return not active[IGNORE] or self.mode is IGNORE
+        return not get_scope().active[IGNORE] or self.mode is IGNORE
 
     def __enter__(self):
         log(lambda: self)
@@ -44,17 +42,20 @@ class Context:
 
     def add_active(self, conflicts=(), msg=""):
         mode = self.mode
+        active = get_scope().active
         if any(active[m] for m in conflicts):
             raise RuntimeError(msg)
         active[mode] += (self.context,)
 
     def pop_active(self):
         mode = self.mode
+        active = get_scope().active
         actives = active[mode]
         assert actives, "no " + mode + " to pop"
         active[mode] = actives[:-1]
 
     def make_dependent(self):
+        active = get_scope().active
         if active[IGNORE]:
             return
         actives = active[self.mode]
@@ -81,11 +82,11 @@ class ActionContext(Context):
         msg = "Cannot update an Atom or call an action from inside a selector or render method \
             - use `with ignore_updates:` if you really need to update an Atom attribute"
         self.add_active((SELECTOR, RENDER, REACTION), msg)
-        queued[ACTION] += (self.context,)
+        get_scope().queued[ACTION] += (self.context,)
 
     def popper(self):
         self.pop_active()
-        if not active[ACTION]:
+        if not get_scope().active[ACTION]:
             call_queued()
 
 
@@ -3,10 +3,10 @@
 
 from functools import wraps
 
-from .constants import IS_SERVER_SIDE, SUBSCRIBE
+from .constants import SUBSCRIBE, is_inert
 from .contexts import ActionContext
 from .registrar import get_registrar
-from .rendering import active
+from .rendering import get_scope
 from .subscribers import Reaction, Render, Selector
 from .utils import MethodType, is_atom
 
@@ -34,7 +34,7 @@ def selector(fn):
         selector = _get_selector(fn, atom, prop)
         return selector(*args, **kws)
 
-    return fn if IS_SERVER_SIDE else selector_wrapper
+    return fn if is_inert() else selector_wrapper
 
 
 class action:
@@ -49,7 +49,7 @@ class action:
     def __new__(cls, _fn=None, **kws):
         if _fn is None:
             return lambda _fn: action(_fn, **kws)
-        return _fn if IS_SERVER_SIDE else object.__new__(cls)
+        return _fn if is_inert() else object.__new__(cls)
 
     def __init__(self, _fn, **kws):
         for k, v in kws.items():
@@ -85,12 +85,13 @@ def subscribe(f):
     a subscriber takes a single argument - the tuple of actions that caused the re-render
     This might be used to update local storage based on the actions that were performed
     """
-    active[SUBSCRIBE] += (f,)
+    get_scope().active[SUBSCRIBE] += (f,)
     return f
 
 
 def unsubscribe(f):
     """remove a subscriber"""
+    active = get_scope().active
     subscribers = active[SUBSCRIBE]
     i = subscribers.index(f)  # will raise ValueError
     active[SUBSCRIBE] = subscribers[:i] + subscribers[i + 1 :]
@@ -108,7 +109,7 @@ class render:
     def __new__(cls, _fn=None, **kws):
         if _fn is None:
             return lambda _fn: render(_fn, **kws)
-        return _fn if IS_SERVER_SIDE else object.__new__(cls)
+        return _fn if is_inert() else object.__new__(cls)
 
     def __init__(self, _fn, bound=None):
         self.f = _fn
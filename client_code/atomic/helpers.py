@@ -1,10 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
 
-from functools import partial
-
-from .constants import SENTINEL
-from .decorators import autorun
+from .bindings import Binding, get_group
+from .constants import SENTINEL, is_inert
 from .rendering import log
 
 __version__ = "0.0.1"
@@ -15,42 +13,40 @@ def set_debug(is_debug=True):
     log.is_debug = is_debug
 
 
+def enable_incremental():
+    """use atoms, selectors, actions and renders on the server
+    by default these decorators are no-ops on the server
+    call this before any atoms are defined, e.g. at the top of a background task module
+    """
+    is_inert.incremental = True
+
+
 def writeback(component, prop, atom_or_selector, attr_or_action=None, events=()):
     """create a writeback between a component property and an atom attribute
     or bind the property to an atom selector and call an action when the component property is changed
     events - should be a single event str or a list of events
     If no events are provided this is the equivalent of a data-binding with no writeback
+    All the bindings for a form share a single render subscriber
     """
     atom, attr = atom_or_selector, attr_or_action
     if type(events) is str:
         events = [events]
     if isinstance(atom, dict):
         assert attr is not None, "if a dict atom is provided the attr must be a str"
-        getter = partial(atom.__getitem__, attr)
-        setter = partial(atom.__setitem__, attr)
+        binding = Binding(
+            component, prop, atom.__getitem__, (attr,), atom.__setitem__, (attr,)
+        )
     elif callable(atom):
-        getter = atom
-        setter = attr
         assert callable(attr), "a selector must be combined with a callable action"
+        binding = Binding(component, prop, atom, (), attr, ())
     else:
         assert attr is not None, "if an atom is provided the attr must be a str"
-        getter = partial(getattr, atom, attr)
-        setter = partial(setattr, atom, attr)
-
-    def render_component():
-        setattr(component, prop, getter())
-
-    render_component.__name__ = render_component.__qualname__ = (
-        type(component).__name__ + "." + prop
-    )
-
-    def do_action(**event_args):
-        setter(getattr(component, prop))
+        binding = Binding(component, prop, getattr, (atom, attr), setattr, (atom, attr))
 
     for event in events:
-        component.add_event_handler(event, do_action)
+        component.add_event_handler(event, binding.write)
 
-    autorun(render_component, bound=component)
+    get_group(component).add(binding)
 
 
 def _noop():
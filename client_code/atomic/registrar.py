@@ -17,9 +17,10 @@ class AtomRegistrar:
 
     def register(self, prop, subscriber, mode):
         subscriber_set = self.to_update[mode].setdefault(prop, set())
+        # always tell the subscriber - a subscriber may track which of its parts depend on a prop
+        subscriber.register(self, prop)
         if subscriber not in subscriber_set:
             subscriber_set.add(subscriber)
-            subscriber.register(self, prop)
             return True
 
     def unregister(self, prop, subscriber, mode):
@@ -6,15 +6,71 @@ from .utils import get_atom_prop_repr
 
 __version__ = "0.0.1"
 
+
 # STATE
-active = {ACTION: (), REACTION: (), SELECTOR: (), RENDER: (), SUBSCRIBE: (), IGNORE: ()}
-queued = {ACTION: (), REACTION: frozenset(), SELECTOR: frozenset(), RENDER: frozenset()}
+class Scope:
+    """a reactive scope has its own active contexts, queues and subscribers
+    subscribers belong to the scope they were created in and are queued and flushed in that scope
+    an update cycle only flushes the scopes that have something queued
+    subscribe functions are called with the actions from the scope and any of its child scopes
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.active = {
+            ACTION: (),
+            REACTION: (),
+            SELECTOR: (),
+            RENDER: (),
+            SUBSCRIBE: (),
+            IGNORE: (),
+        }
+        self.queued = {ACTION: (), REACTION: set(), SELECTOR: set(), RENDER: set()}
+        self.subscribers = set()  # subscribers with dependencies
+        self.num_calls = 0
+
+    def __enter__(self):
+        _scopes.append(self)
+        return self
+
+    def __exit__(self, *args):
+        popped = _scopes.pop()
+        assert popped is self, "scopes must be exited in order"
+
+    def dispose(self):
+        """tear down the scope - all subscribers created in this scope stop updating"""
+        for subscriber in list(self.subscribers):
+            subscriber.teardown()
+        self.subscribers.clear()
+        self.queued.update({REACTION: set(), SELECTOR: set(), RENDER: set()})
+        self.active[SUBSCRIBE] = ()
+        _pending.pop(self, None)
+
+    def __repr__(self):
+        return "<root scope>" if self.parent is None else "<scope>"
+
+
+root = Scope()
+_scopes = [root]
+_pending = {}  # scopes with queued subscribers - used as an ordered set
+
+
+def get_scope():
+    return _scopes[-1]
+
+
+def new_scope():
+    """create a new scope, it can be used as a context manager
+    e.g. `with atomic.scope():`
+    """
+    return Scope(get_scope())
 
 
 # LOGGING
 def log(fn):
     if not log.is_debug:
         return
+    active = _scopes[-1].active
     indent = sum(len(active[v]) for v in (SELECTOR, RENDER, REACTION, IGNORE))
     print(f"{'    ' * indent}{fn()}")
 
@@ -26,6 +82,7 @@ def register(atom, prop):
     """if there is an active selector or render
     we asks the atom registrar to register a relationship between an atom and the attribute being accessed
     """
+    active = _scopes[-1].active
     if active[IGNORE]:
         return
     # check selectors first since you can't call a render inside a selctor
@@ -56,23 +113,20 @@ def remove_atom_prop_relationship(subscriber, mode):
     subscriber.dispose()
 
 
-def remove_dependents(root, queue, mode, seen):
+def remove_dependents(root, mode, seen):
     """
-    take dependents from a root subscriber and remove them from the subscriber queue
+    take dependents from a root subscriber and remove them from their scope's subscriber queue
     """
     if root in seen:
-        return queue
+        return
     seen.add(root)
     dependents = root.dependents
     if mode is not SELECTOR:
         root.dependents = set()
         remove_atom_prop_relationship(root, mode)
-    if not dependents:
-        return queue
-    queue -= dependents
     for dependent in dependents:
-        queue = remove_dependents(dependent, queue, mode, seen)
-    return queue
+        dependent.scope.queued[mode].discard(dependent)
+        remove_dependents(dependent, mode, seen)
 
 
 def get_to_queue(atom_registrar, prop, mode):
@@ -81,83 +135,108 @@ def get_to_queue(atom_registrar, prop, mode):
 
 
 def queue_subscribers(atom_registrar, prop, mode):
-    """update the current queue of subscribers with a new queue, removing dependent subscribers"""
+    """add subscribers to the queue of the scope they belong to, removing dependent subscribers"""
     to_queue = get_to_queue(atom_registrar, prop, mode)
-    queue = queued[mode] | to_queue
+    if not to_queue:
+        return
+    for subscriber in to_queue:
+        scope = subscriber.scope
+        scope.queued[mode].add(subscriber)
+        _pending[scope] = None
     seen = set()
     for subscriber in to_queue:
-        queue = remove_dependents(subscriber, queue, mode, seen)
-    return queue
+        if mode is RENDER:
+            subscriber.invalidate(atom_registrar, prop)
+        remove_dependents(subscriber, mode, seen)
 
 
 def request(atom, prop):
     """when an attribute of an atom is accessed we update the queues based on the subscribers registered"""
-    if active[IGNORE]:
+    if _scopes[-1].active[IGNORE]:
         return
     atom_registrar = get_registrar(atom)
     if atom_registrar is None:
         return
-    queued.update(
-        {
-            REACTION: queue_subscribers(atom_registrar, prop, REACTION),
-            RENDER: queue_subscribers(atom_registrar, prop, RENDER),
-            SELECTOR: queue_subscribers(atom_registrar, prop, SELECTOR),
-        }
-    )
+    queue_subscribers(atom_registrar, prop, REACTION)
+    queue_subscribers(atom_registrar, prop, RENDER)
+    queue_subscribers(atom_registrar, prop, SELECTOR)
 
 
-def call_render_queue():
+def call_render_queue(scope):
     """this should call the most parent renders"""
-    queue, queued[RENDER] = queued[RENDER], frozenset()
+    queued = scope.queued
+    queue, queued[RENDER] = queued[RENDER], set()
     for render in queue:
         render.render()
     assert not queued[RENDER]
 
 
-def call_queue_repeatedly(mode, update):
+def call_queue_repeatedly(scope, mode, update):
     """
     calling selectors and reactions may lead to more queued selectors and reactions
     child selectors are called first which will then queue renders from parent/dependent selectors
     the then_react method can cause an action which could then create another reaction
     """
+    queued = scope.queued
     for _ in range(1000):
         if not queued[mode]:
             return
-        queue, queued[mode] = queued[mode], frozenset()
+        queue, queued[mode] = queued[mode], set()
         for item in queue:
             update(item)
     else:
         raise RuntimeError(f"Suspected infinite loop from {mode}s")
 
 
-def call_subscriber_queue():
+def call_subscriber_queue(scope):
     """any registered subscribers will be called after all renders have taken place
-    they get passed a tuple of actions that were used in this render round"""
+    they get passed a tuple of actions that were used in this render round
+    subscribers of parent scopes also get the actions"""
+    queued = scope.queued
     actions, queued[ACTION] = queued[ACTION], ()
     if not actions:
         return
-    for subscriber in active[SUBSCRIBE]:
-        subscriber(actions)
-
+    while scope is not None:
+        for subscriber in scope.active[SUBSCRIBE]:
+            subscriber(actions)
+        scope = scope.parent
 
-num_calls = 0
 
-
-def call_queued():
-    """calls all the queued subscribers - called after all actions have finished"""
-    global num_calls
-    num_calls += 1
-    if num_calls > 1000:
+def flush(scope):
+    """calls all the queued subscribers in a scope"""
+    scope.num_calls += 1
+    if scope.num_calls > 1000:
         raise RuntimeError(
             "Queued 1000 update cycles without completing - suspected infinte loop"
         )
+    _pending.pop(scope, None)
+    queued = scope.queued
     has_queued = log.is_debug and (
         queued[SELECTOR] or queued[REACTION] or queued[RENDER]
     )
-    call_queue_repeatedly(SELECTOR, lambda s: s.compute())
-    call_queue_repeatedly(REACTION, lambda r: r.react())
-    call_render_queue()
-    call_subscriber_queue()
-    if has_queued and num_calls:
+    with scope:
+        call_queue_repeatedly(scope, SELECTOR, lambda s: s.compute())
+        call_queue_repeatedly(scope, REACTION, lambda r: r.react())
+        call_render_queue(scope)
+        call_subscriber_queue(scope)
+    if has_queued and scope.num_calls:
         print()
-    num_calls = 0
+    scope.num_calls = 0
+
+
+def call_queued():
+    """calls all the queued subscribers - called after all actions have finished
+    the current scope is flushed first, followed by any other scopes that were affected
+    """
+    flush(_scopes[-1])
+    for _ in range(1000):
+        if not _pending:
+            return
+        scope = next(iter(_pending))
+        if scope.active[ACTION]:
+            # this scope will flush when its action completes
+            _pending.pop(scope)
+        else:
+            flush(scope)
+    else:
+        raise RuntimeError("Suspected infinite loop between scopes")
@@ -5,9 +5,10 @@ from functools import lru_cache
 
 import anvil
 
-from .constants import REACTION, RENDER, SELECTOR
+from .constants import IGNORE, REACTION, RENDER, SELECTOR
 from .contexts import ReactionContext, RenderContext, SelectorContext
-from .rendering import active, register, request
+from .registrar import get_registrar
+from .rendering import get_scope, log, register, request
 from .utils import get_atom_prop_repr
 
 __version__ = "0.0.1"
@@ -21,6 +22,7 @@ class Subscriber:
     def __init__(self):
         self.dependents = set()
         self.atom_registrar_prop = set()
+        self.scope = get_scope()
 
     def add_dependent(self):
         raise NotImplementedError
@@ -30,11 +32,23 @@ class Subscriber:
             # the registrar will call our unregister method
             registrar.unregister(prop, self, self.mode)
 
+    def teardown(self):
+        """called when our scope is disposed - stop updating altogether"""
+        self.dispose()
+
     def register(self, atom_registrar, prop):
+        if not self.atom_registrar_prop:
+            self.scope.subscribers.add(self)
         self.atom_registrar_prop.add((atom_registrar, prop))
 
     def unregister(self, atom_registrar, prop):
         self.atom_registrar_prop.discard((atom_registrar, prop))
+        if not self.atom_registrar_prop:
+            self.scope.subscribers.discard(self)
+
+    def invalidate(self, atom_registrar, prop):
+        """called when a prop we depend on changes, before we are queued"""
+        pass
 
 
 class Render(Subscriber):
@@ -68,7 +82,7 @@ class Render(Subscriber):
         delay = (
             not anvil.js.get_dom_node(bound).isConnected
             and not immediate
-            and not active[RENDER]
+            and not get_scope().active[RENDER]
         )
         if delay:
             bound.add_event_handler("show", self.render)
@@ -79,7 +93,7 @@ class Render(Subscriber):
         immediate = event_name == "x-force-render"
         if self.maybe_delay(immediate=immediate):
             return
-        with RenderContext(self):
+        with self.scope, RenderContext(self):
             res = self.f(*self.args, **self.kws)
         return res
 
@@ -105,6 +119,7 @@ class Selector(Subscriber):
         self.status = INITIAL
         self.args = ()
         self.kws = {}
+        self.value = None
 
     def add_dependent(self, parent):
         # my parent depends on me
@@ -114,6 +129,7 @@ class Selector(Subscriber):
         with SelectorContext(self):
             cached = self.f(*self.args, **self.kws)
         self.status = CACHE
+        self.value = cached
         return cached
 
     def __call__(self, *args, **kws):
@@ -122,10 +138,25 @@ class Selector(Subscriber):
         # and we only want the registration to occur when we call the selector
         # this allows selectors to be used as the bind/writeback function
         register(self.atom, self.prop)
+        if self.status is CACHE and args == self.args and kws == self.kws:
+            # same call as last time - skip the selector context
+            log(lambda: self)
+            active = get_scope().active
+            parents = active[SELECTOR]
+            if parents and not active[IGNORE]:
+                self.add_dependent(parents[-1])
+            return self.value
         self.args = args
         self.kws = kws
         return self.compute_cached()
 
+    def teardown(self):
+        self.dispose()
+        # we will no longer be recomputed - so the next call should create a new selector
+        selectors = get_registrar(self.atom).selectors
+        if selectors.get(self.prop) is self:
+            del selectors[self.prop]
+
     def compute(self):
         self.status = RECOMPUTE
         self.f.cache_clear()
@@ -0,0 +1,245 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+from .atoms import DictAtom, ListAtom
+from .constants import ACTION, IS_SERVER_SIDE
+from .decorators import action, subscribe, unsubscribe
+from .rendering import get_scope, root
+from .utils import is_atom
+
+__version__ = "0.0.1"
+
+SYNC_NAME = "atomic.private.sync"
+
+# CLIENT STATE
+_synced = {}  # key -> atom
+_keys = {}  # id(atom) -> key
+# the DictAtoms nested in a synced atom don't know their parent
+# so we record which synced atom and prop they belong to
+_owners = {}  # id(DictAtom) -> (DictAtom, key, prop)
+_owned = {}  # (key, prop) -> [id(DictAtom), ...]
+# the actions that applied patches from the server, so that they aren't sent back
+_from_server = {}  # id(action) -> action
+
+# SERVER STATE
+_handlers = {}  # key -> fn(changed, deleted)
+
+
+def _plain(val):
+    """convert nested ListAtoms/DictAtoms so that kompot sees plain lists and dicts"""
+    if isinstance(val, list):
+        return [_plain(v) for v in val]
+    if isinstance(val, DictAtom):
+        return {k: _plain(v) for k, v in dict.items(val)}
+    return val
+
+
+def _get_owner(atom, prop):
+    """a ListAtom requests renders on behalf of the atom and prop that it belongs to"""
+    if type(atom) is ListAtom:
+        return atom._request_render.args
+    return atom, prop
+
+
+def _get_key(atom, prop):
+    """Returns: the key and prop of the synced atom that a change belongs to, or None"""
+    atom, prop = _get_owner(atom, prop)
+    key = _keys.get(id(atom))
+    if key is not None:
+        return None if prop is None else (key, prop)
+    owner = _owners.get(id(atom))
+    if owner is None or owner[0] is not atom:
+        return None
+    return owner[1:]
+
+
+def _own(key, prop, val):
+    """record the DictAtoms nested in the value of a prop of a synced atom"""
+    for i in _owned.pop((key, prop), ()):
+        del _owners[i]
+    owned = []
+    stack = [val]
+    while stack:
+        val = stack.pop()
+        if isinstance(val, DictAtom):
+            if id(val) not in _owners:
+                _owners[id(val)] = (val, key, prop)
+                owned.append(id(val))
+            stack.extend(dict.values(val))
+        elif isinstance(val, list):
+            stack.extend(val)
+    if owned:
+        _owned[key, prop] = owned
+
+
+def _items(atom):
+    if isinstance(atom, dict):
+        return dict.items(atom)
+    return getattr(atom, "__dict__", {}).items()
+
+
+def _get(atom, prop):
+    if isinstance(atom, dict):
+        return dict.__getitem__(atom, prop)
+    return getattr(atom, prop)
+
+
+def _collect(actions):
+    """compact the actions from a single render cycle into one patch per synced atom
+    we only record which props changed - their values are read once at the end of the cycle
+    """
+    dirty = {}
+    for a in actions:
+        if _from_server.pop(id(a), None) is a:
+            continue
+        atom = getattr(a, "atom", None)
+        if atom is None:
+            continue
+        found = _get_key(atom, getattr(a, "prop", None))
+        if found is not None:
+            key, prop = found
+            dirty.setdefault(key, {})[prop] = None
+
+    patches = []
+    for key, props in dirty.items():
+        atom = _synced[key]
+        changed, deleted = {}, []
+        for prop in props:
+            try:
+                val = _get(atom, prop)
+            except (KeyError, AttributeError):
+                deleted.append(prop)
+                _own(key, prop, None)
+            else:
+                changed[prop] = _plain(val)
+                _own(key, prop, val)
+        patches.append([key, changed, deleted])
+    return patches
+
+
+def _send(patches):
+    # kompot is only needed once something has changed
+    from .. import kompot
+
+    return kompot.call_async(SYNC_NAME, patches).on_result(apply_patches)
+
+
+def _sync_subscriber(actions):
+    patches = _collect(actions)
+    if patches:
+        _send(patches)
+
+
+def apply_patch(obj, changed, deleted=()):
+    """apply a single patch to an atom, DictAtom or any object with attributes"""
+    if isinstance(obj, dict):
+        obj.update(changed)
+        for prop in deleted:
+            obj.pop(prop, None)
+        return obj
+    for prop, val in changed.items():
+        setattr(obj, prop, val)
+    for prop in deleted:
+        if hasattr(obj, prop):
+            delattr(obj, prop)
+    return obj
+
+
+@action
+def _apply_patches(patches):
+    queued = get_scope().queued
+    start = len(queued[ACTION])
+    for key, changed, deleted in patches:
+        atom = _synced.get(key)
+        if atom is None:
+            continue
+        apply_patch(atom, changed, deleted)
+        for prop in changed:
+            _own(key, prop, _get(atom, prop))
+        for prop in deleted:
+            _own(key, prop, None)
+    # the actions queued while applying are skipped by the sync subscriber
+    # even when this runs inside an outer action that changes other props
+    for a in queued[ACTION][start:]:
+        _from_server[id(a)] = a
+
+
+def apply_patches(patches):
+    """apply patches from the server to synced atoms, without sending them back to the server
+    all patches are applied as a single action"""
+    if patches:
+        _apply_patches(patches)
+
+
+def sync(atom, key):
+    """sync an atom (or DictAtom) with the server
+    after each render cycle any changed attributes are sent to the server as a patch
+    the server should register a handler for the key with @sync_handler(key)
+
+    Returns: a dispose function - when called the atom is no longer synced
+    """
+    assert is_atom(atom), "only atoms can be synced"
+    assert key not in _synced, f"an atom is already synced with the key {key!r}"
+    if not _synced:
+        # the root scope's subscribers get the actions from every scope
+        # and aren't removed when another scope is disposed
+        with root:
+            subscribe(_sync_subscriber)
+    _synced[key] = atom
+    _keys[id(atom)] = key
+    for prop, val in _items(atom):
+        _own(key, prop, val)
+
+    def dispose():
+        if _synced.get(key) is not atom:
+            return
+        del _synced[key]
+        del _keys[id(atom)]
+        for owned in [owned for owned in _owned if owned[0] == key]:
+            _own(*owned, None)
+        if not _synced:
+            with root:
+                unsubscribe(_sync_subscriber)
+
+    return dispose
+
+
+def pull(*keys):
+    """ask the server for changes to synced atoms, by default all of them
+    each sync handler is called with an empty patch and the changes it returns are applied
+
+    Returns: the AsyncCall
+    """
+    return _send([[key, {}, []] for key in keys or _synced])
+
+
+def sync_handler(key):
+    """decorate a server function that applies patches for a synced atom key
+    the function is called with the changed dict and the list of deleted attributes
+    it can return a dict of changes that will be applied to the client atom
+    """
+
+    def decorator(fn):
+        _handlers[key] = fn
+        return fn
+
+    return decorator
+
+
+def _receive(patches):
+    rv = []
+    for key, changed, deleted in patches:
+        try:
+            handler = _handlers[key]
+        except KeyError:
+            raise LookupError(f"No sync handler has been registered for {key!r}")
+        server_changes = handler(changed, deleted)
+        if server_changes:
+            rv.append([key, server_changes, []])
+    return rv
+
+
+if IS_SERVER_SIDE:
+    from ..kompot import callable as _callable
+
+    _receive = _callable(SYNC_NAME)(_receive)
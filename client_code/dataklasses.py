@@ -110,6 +110,14 @@ def make__hash__(fields):
     return "def __hash__(self):\n" f"  return hash({self_tuple})\n"
 
 
+# the classes made by dataklass - their instances have exactly the fields in __match_args__
+_dataklasses = set()
+
+
+def is_dataklass(cls):
+    return cls in _dataklasses
+
+
 def dataklass(cls):
     fields = all_hints(cls)
     nfields = get_nfields(fields)
@@ -125,6 +133,7 @@ def dataklass(cls):
     if "__hash__" not in clsdict:
         cls.__hash__ = patch_attributes(make__hash__(nfields), fields, 1)
     cls.__match_args__ = tuple(fields)
+    _dataklasses.add(cls)
     return cls
 
 
@@ -1,9 +1,24 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
-from ._batcher import batch_call
-from ._register import register
-from ._rpc import call, call_async, call_s, callable
+from ._batcher import batch_call, set_auto_batch
+from ._cache import Cache, get_cache
+from ._codecs import register_codec
+from ._metrics import CallStats, add_call_hook, remove_call_hook
+from ._register import get_manifest, preload, register
+from ._rpc import (
+    call,
+    call_async,
+    call_s,
+    callable,
+    codec,
+    lazy,
+    set_codec,
+    set_compress,
+    set_dedupe,
+    set_media_threshold,
+)
 from ._serialize import preserve, reconstruct, serialize
+from ._stream import stream
 
 __version__ = "0.0.1"
 
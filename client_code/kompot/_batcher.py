@@ -1,26 +1,172 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
 
+from time import sleep
+
 import anvil.server
 from anvil import is_server_side
 
-from ._rpc import _registered, call, call_s, callable
+from ._register import register
+from ._request import get_request, with_request
+from ._rpc import _call, _registered, _requires_user, call, call_s, callable
 
 __version__ = "0.0.1"
 
 PRIVATE_NAME = "kompot.private.batch_call"
 
 
-def do_batch_call(call_sigs):
-    rv = []
-    for fn_name, args, kws in call_sigs:
-        try:
-            fn = _registered[fn_name]
-        except KeyError:
-            raise anvil.server.NoServerFunctionError(
-                f"No server function matching '{fn_name}' has been registered with kompot"
-            )
-        rv.append(fn(*args, **kws))
+# the most threads used to run a parallel batch on the server
+MAX_WORKERS = 8
+
+
+@register(name="kompot.BatchRef")
+@anvil.server.portable_class
+class BatchRef:
+    """A placeholder for the result of an earlier call in a batch_call
+    ref["key"] and ref.attr are placeholders for parts of the result
+    """
+
+    __slots__ = ("index", "path")
+
+    def __init__(self, index, path=()):
+        self.index = index
+        self.path = list(path)  # [["item", key] | ["attr", name], ...]
+
+    def __getitem__(self, key):
+        return BatchRef(self.index, self.path + [["item", key]])
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name in BatchRef.__slots__:
+            raise AttributeError(name)
+        return BatchRef(self.index, self.path + [["attr", name]])
+
+    def __repr__(self):
+        return f"<kompot.BatchRef to call {self.index}>"
+
+
+def _resolve_ref(ref, outcomes):
+    if not 0 <= ref.index < len(outcomes) or outcomes[ref.index] is None:
+        raise ValueError("A batch call can only use the results of earlier calls")
+    rv, error = outcomes[ref.index]
+    if error is not None:
+        raise RuntimeError(f"Call {ref.index} in the batch raised an exception")
+    for kind, key in ref.path:
+        if kind == "item":
+            rv = rv[key]
+        elif kind == "attr" and type(key) is str and not key.startswith("_"):
+            # the path comes from the client, so private attributes are off limits
+            rv = getattr(rv, key)
+        else:
+            raise ValueError(f"A batch call can't refer to {kind} {key!r} of a result")
+    return rv
+
+
+def _resolve(obj, outcomes):
+    """replace the BatchRefs in the args of a call with the results they refer to"""
+    tp = type(obj)
+    if tp is BatchRef:
+        return _resolve_ref(obj, outcomes)
+    if tp is list or tp is tuple:
+        return tp(_resolve(item, outcomes) for item in obj)
+    if tp is dict:
+        return {k: _resolve(v, outcomes) for k, v in obj.items()}
+    return obj
+
+
+def _find_refs(obj, found):
+    tp = type(obj)
+    if tp is BatchRef:
+        found.add(obj.index)
+    elif tp is list or tp is tuple:
+        for item in obj:
+            _find_refs(item, found)
+    elif tp is dict:
+        for item in obj.values():
+            _find_refs(item, found)
+    return found
+
+
+def _run(call_sig, outcomes):
+    fn_name, args, kws = call_sig
+    try:
+        fn = _registered[fn_name]
+    except KeyError:
+        raise anvil.server.NoServerFunctionError(
+            f"No server function matching '{fn_name}' has been registered with kompot"
+        )
+    args, kws = _resolve((args, kws), outcomes)
+    return fn(*args, **kws)
+
+
+def _error_obj(e):
+    if isinstance(e, anvil.server.AnvilWrappedError):
+        return e.error_obj
+    # anvil's exceptions know the name they are sent between client and server with
+    tp = getattr(type(e), "registered_type_name", None) or type(e).__name__
+    return {"type": tp, "message": str(e), "trace": []}
+
+
+def _run_captured(call_sig, outcomes):
+    """Returns: [result, None] or [None, error_obj]"""
+    try:
+        return [_run(call_sig, outcomes), None]
+    except Exception as e:
+        return [None, _error_obj(e)]
+
+
+def _waves(call_sigs):
+    """group the calls so that each call comes after the calls it refers to"""
+    waves = []
+    depth = []
+    for i, call_sig in enumerate(call_sigs):
+        refs = _find_refs(call_sig[1:], set())
+        # refs to later calls fail when the call runs
+        d = max([depth[j] + 1 for j in refs if 0 <= j < i] or [0])
+        depth.append(d)
+        if d == len(waves):
+            waves.append([])
+        waves[d].append(i)
+    return waves
+
+
+def do_batch_call(call_sigs, parallel=False, capture_errors=False):
+    """with capture_errors each call returns [result, None] or [None, error_obj]
+    otherwise the first error is raised
+    with parallel the calls run in a thread pool and errors are always captured
+
+    the args of a call can contain BatchRefs to the results of earlier calls
+    """
+    outcomes = [None] * len(call_sigs)
+
+    if parallel:
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = max(1, min(MAX_WORKERS, len(call_sigs)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for wave in _waves(call_sigs):
+                # the worker threads don't have Anvil's call context
+                # so they get the user, and share the permission checks, of this request
+                needs_user = any(call_sigs[i][0] in _requires_user for i in wave)
+                request = [get_request(needs_user)]
+                sigs = [call_sigs[i] for i in wave]
+                n = len(wave)
+                results = pool.map(
+                    with_request, request * n, [_run_captured] * n, sigs, [outcomes] * n
+                )
+                for i, outcome in zip(wave, results):
+                    outcomes[i] = outcome
+        return outcomes
+
+    for i, call_sig in enumerate(call_sigs):
+        if capture_errors:
+            outcomes[i] = _run_captured(call_sig, outcomes)
+        else:
+            outcomes[i] = [_run(call_sig, outcomes), None]
+
+    if capture_errors:
+        return outcomes
+
+    rv = [result for result, _ in outcomes]
 
     if len(call_sigs) > 1:
         return rv
@@ -32,15 +178,41 @@ if is_server_side():
     do_batch_call = callable(PRIVATE_NAME)(do_batch_call)
 
 
+def _rebuild_error(error_obj):
+    """the exceptions of anvil.server and anvil.users are rebuilt as themselves
+    anything else is an AnvilWrappedError
+    """
+    module, _, name = (error_obj.get("type") or "").rpartition(".")
+    cls = None
+    if module == "anvil.server":
+        cls = getattr(anvil.server, name, None)
+    elif module == "anvil.users":
+        import anvil.users as users
+
+        cls = getattr(users, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = anvil.server.AnvilWrappedError
+    return cls(error_obj)
+
+
 class batch_call:
-    def __init__(self, *, silent=False):
+    """with parallel=True the calls run concurrently on the server
+    result is then a list with a result for each call, None for a call that raised
+    and errors is a list with the exception raised by each call, or None
+    """
+
+    def __init__(self, *, silent=False, parallel=False):
         self.result = None
+        self.errors = None
         self._silent = silent
+        self._parallel = parallel
         self._call_sigs = []
         self._done = False
 
     def call(self, fn_name, *args, **kws):
+        """Returns: a BatchRef to the result, which can be passed to later calls in the batch"""
         self._call_sigs.append([fn_name, args, kws])
+        return BatchRef(len(self._call_sigs) - 1)
 
     def __enter__(self):
         if self._done:
@@ -56,5 +228,79 @@ class batch_call:
             return
 
         call_method = call_s if self._silent else call
-        if call_sigs:
+        if not call_sigs:
+            return
+        if not self._parallel:
             self.result = call_method(PRIVATE_NAME, call_sigs)
+            return
+        rv = call_method(PRIVATE_NAME, call_sigs, parallel=True)
+        self.result = [result for result, _ in rv]
+        self.errors = [error and _rebuild_error(error) for _, error in rv]
+
+
+# AUTO BATCHING
+# with auto batching on, kompot.call_async calls made close together are sent as one batch_call
+# each call gets its own AsyncCall that resolves with its own result
+
+_auto_batch = {"window": None, "batch": None}
+
+
+def set_auto_batch(window=0):
+    """batch the kompot.call_async calls made within window seconds of the first call
+    window=0 batches the calls made in the same tick, window=None turns auto batching off
+    """
+    _auto_batch["window"] = window
+    _auto_batch["batch"] = None
+
+
+class _AutoBatch:
+    def __init__(self, codec, lazy=False):
+        self.codec = codec
+        self.lazy = lazy
+        self.call_sigs = []
+        self.async_call = None
+
+    def send(self, window):
+        # give the other calls made in this window a chance to join the batch
+        sleep(window)
+        if _auto_batch["batch"] is self:
+            _auto_batch["batch"] = None
+        call_sigs = self.call_sigs
+        server_call = anvil.server.call_s
+        if len(call_sigs) == 1:
+            fn_name, args, kws = call_sigs[0]
+            return [_call(server_call, self.codec, fn_name, args, kws, self.lazy)]
+        kws = {"capture_errors": True}
+        return _call(
+            server_call, self.codec, PRIVATE_NAME, (call_sigs,), kws, self.lazy
+        )
+
+    def get(self, i, done=None):
+        try:
+            rv = self.async_call.await_result()
+        finally:
+            if done is not None:
+                done()
+        if len(self.call_sigs) == 1:
+            return rv[0]
+        result, error = rv[i]
+        if error is not None:
+            raise _rebuild_error(error)
+        return result
+
+
+def queue_call(codec, fn_name, args, kws, done=None, lazy=False):
+    """Returns: an AsyncCall for the result of the call, done() is called when the batch returns
+    calls with a different codec or lazy setting start a new batch
+    """
+    from .. import non_blocking
+
+    batch = _auto_batch["batch"]
+    if batch is not None and batch.codec is codec and batch.lazy == lazy:
+        batch.call_sigs.append([fn_name, args, kws])
+    else:
+        batch = _auto_batch["batch"] = _AutoBatch(codec, lazy)
+        batch.call_sigs.append([fn_name, args, kws])
+        # send runs until it sleeps, so the call sig must be added first
+        batch.async_call = non_blocking.call_async(batch.send, _auto_batch["window"])
+    return non_blocking.call_async(batch.get, len(batch.call_sigs) - 1, done)
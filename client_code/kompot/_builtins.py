@@ -1,14 +1,33 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
 
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 from math import isfinite
+from sys import byteorder
+from time import time
 
+import anvil
 import anvil.tz
 from anvil.server import portable_class
 
 from ._register import get_registered_cls, register, registered_types
 
+try:
+    from base64 import b64decode, b64encode
+except ImportError:
+    b64decode = b64encode = None
+
+try:
+    from array import array
+except ImportError:
+    # not every client side runtime has array
+    array = None
+
+try:
+    _memoryview = memoryview
+except NameError:
+    _memoryview = None
+
 __version__ = "0.0.1"
 
 
@@ -63,8 +82,120 @@ class Tuple(tuple, Iterable):
     pass
 
 
-class Bytes(bytes, Iterable):
-    pass
+# BINARY
+# binary values are sent as base64 strings
+# when serialize is given a media_threshold, values at least that many bytes long
+# are sent as BlobMedia objects through the unhandled channel instead
+# format version 1 sends them as a list of ints, like older versions of kompot
+
+_B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_B64_INDEX = {c: i for i, c in enumerate(_B64)}
+
+
+def _encode_base64(data):
+    if b64encode is not None:
+        return b64encode(data).decode("ascii")
+    chars = []
+    for i in range(0, len(data), 3):
+        chunk = data[i : i + 3]
+        n = 0
+        for b in chunk:
+            n = (n << 8) | b
+        n <<= 8 * (3 - len(chunk))
+        quad = [_B64[(n >> shift) & 0x3F] for shift in (18, 12, 6, 0)]
+        chars.extend(quad[: len(chunk) + 1])
+        chars.append("=" * (3 - len(chunk)))
+    return "".join(chars)
+
+
+def _decode_base64(s):
+    if b64decode is not None:
+        return b64decode(s)
+    s = s.rstrip("=")
+    out = []
+    for i in range(0, len(s), 4):
+        chunk = s[i : i + 4]
+        n = 0
+        for c in chunk:
+            n = (n << 6) | _B64_INDEX[c]
+        n <<= 6 * (4 - len(chunk))
+        out.extend((n >> shift) & 0xFF for shift in (16, 8, 0)[: len(chunk) - 1])
+    return bytes(out)
+
+
+def encode_binary(data, info):
+    """a base64 string, or a BlobMedia object if data is at least info["media_threshold"] bytes"""
+    if info and info.get("version") == 1:
+        return list(data)
+    threshold = info and info.get("media_threshold")
+    if threshold is not None and len(data) >= threshold:
+        return anvil.BlobMedia("application/octet-stream", bytes(data))
+    return _encode_base64(data)
+
+
+def decode_binary(data):
+    if isinstance(data, str):
+        return _decode_base64(data)
+    if isinstance(data, list):
+        # older versions of kompot sent bytes as a list of ints
+        return bytes(data)
+    return data.get_bytes()
+
+
+class Binary:
+    def __init__(self, v):
+        self.v = v
+
+
+class Bytes(Binary):
+    def __serialize__(self, info):
+        return encode_binary(self.v, info)
+
+    @staticmethod
+    def __new_deserialized__(data, info):
+        return decode_binary(data)
+
+
+class ByteArray(Binary):
+    def __serialize__(self, info):
+        return encode_binary(self.v, info)
+
+    @staticmethod
+    def __new_deserialized__(data, info):
+        return bytearray(decode_binary(data))
+
+
+class MemoryView(Binary):
+    """[format, shape, data] - reconstructed as a read only view of a copy of the data"""
+
+    def __serialize__(self, info):
+        v = self.v
+        return [v.format, list(v.shape), encode_binary(v.tobytes(), info)]
+
+    @staticmethod
+    def __new_deserialized__(data, info):
+        fmt, shape, data = data
+        view = _memoryview(decode_binary(data))
+        if fmt == "B" and len(shape) == 1:
+            return view
+        return view.cast(fmt, shape)
+
+
+class Array(Binary):
+    """[typecode, byteorder, data] - the items are swapped if the byteorder doesn't match"""
+
+    def __serialize__(self, info):
+        v = self.v
+        return [v.typecode, byteorder, encode_binary(v.tobytes(), info)]
+
+    @staticmethod
+    def __new_deserialized__(data, info):
+        typecode, order, data = data
+        rv = array(typecode)
+        rv.frombytes(decode_binary(data))
+        if order != byteorder:
+            rv.byteswap()
+        return rv
 
 
 class Date:
@@ -79,32 +210,101 @@ class Date:
         return date.fromisoformat(iso)
 
 
+# DATETIME
+# a datetime is sent as "seconds[.micros]+offset"
+#   seconds - whole seconds since the epoch, in UTC
+#   micros  - 6 digits, left out when zero
+#   offset  - the utc offset in minutes, always signed
+# format version 1 sends "%Y-%m-%d %H:%M:%S.%f%z", like older versions of kompot
+
+_EPOCH = datetime(1970, 1, 1)
+_MINUTE = timedelta(minutes=1)
+
+# utc offsets in minutes for timezones with a fixed offset
+_FIXED_OFFSETS = (anvil.tz.tzoffset, timezone)
+_offsets = {}
+# anvil.tz.tzlocal has a fixed offset too, but it changes with daylight saving
+_local = [0.0, 0]  # [expires, offset]
+_tzoffsets = {}  # offset -> anvil.tz.tzoffset
+_epochs = {}  # offset -> the epoch in that timezone
+
+
+def get_offset(v):
+    tz = v.tzinfo
+    if tz is None:
+        now = time()
+        if now >= _local[0]:
+            _local[:] = now + 60, anvil.tz.tzlocal().utcoffset(v) // _MINUTE
+        return _local[1]
+    offset = _offsets.get(tz)
+    if offset is None:
+        offset = tz.utcoffset(v) // _MINUTE
+        if isinstance(tz, _FIXED_OFFSETS):
+            if len(_offsets) > 256:
+                _offsets.clear()
+            _offsets[tz] = offset
+    return offset
+
+
+def get_tzoffset(offset):
+    tz = _tzoffsets.get(offset)
+    if tz is None:
+        tz = _tzoffsets[offset] = anvil.tz.tzoffset(minutes=offset)
+    return tz
+
+
+def get_epoch(offset):
+    """the epoch as a local time in a timezone with this offset"""
+    epoch = _epochs.get(offset)
+    if epoch is None:
+        epoch = _EPOCH + offset * _MINUTE
+        epoch = _epochs[offset] = epoch.replace(tzinfo=get_tzoffset(offset))
+    return epoch
+
+
+def _from_iso(iso):
+    sign = iso[-5]
+    has_offset = sign in ("+", "-")
+    offset = 0
+    if has_offset:
+        hours = int(iso[-5:-2])
+        mins = int(sign + iso[-2:])
+        offset = hours * 60 + mins
+        iso = iso[:-5]
+    return datetime.fromisoformat(iso).replace(tzinfo=get_tzoffset(offset))
+
+
 class DateTime:
     def __init__(self, v: datetime):
         self.v = v
 
     def __serialize__(self, info):
         v = self.v
-        if v.tzinfo is not None:
-            offset = v.tzinfo.utcoffset(v).total_seconds()
-        else:
-            # Cannot import earlier - circular dependency!
-            offset = anvil.tz.tzlocal().utcoffset(v).total_seconds()
-        v = v.replace(tzinfo=anvil.tz.tzoffset(seconds=offset))
-        return v.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+        offset = get_offset(v)
+        if info and info.get("version") == 1:
+            v = v.replace(tzinfo=get_tzoffset(offset))
+            return v.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+        delta = v.replace(tzinfo=None) - _EPOCH
+        seconds = delta.days * 86400 + delta.seconds - offset * 60
+        micros = delta.microseconds
+        if micros:
+            return f"{seconds}.{micros:06d}{offset:+d}"
+        return f"{seconds}{offset:+d}"
 
     @staticmethod
-    def __new_deserialized__(iso, info):
-        sign = iso[-5]
-        has_offset = sign in ("+", "-")
-        offset = 0
-        if has_offset:
-            hours = int(iso[-5:-2])
-            mins = int(sign + iso[-2:])
-            offset = hours * 60 + mins
-            iso = iso[:-5]
-        tzinfo = anvil.tz.tzoffset(minutes=offset)
-        return datetime.fromisoformat(iso).replace(tzinfo=tzinfo)
+    def __new_deserialized__(data, info):
+        if ":" in data:
+            return _from_iso(data)
+        # the last sign belongs to the offset
+        i = data.rfind("+")
+        if i < 1:
+            i = data.rfind("-")
+        epoch = get_epoch(int(data[i:]))
+        seconds = data[:i]
+        j = seconds.find(".")
+        if j < 0:
+            return epoch + timedelta(0, int(seconds))
+        return epoch + timedelta(0, int(seconds[:j]), int(seconds[j + 1 :]))
 
 
 class Type:
@@ -133,8 +333,15 @@ registered_builtins = {
     datetime: DateTime,
     type: Type,
     bytes: Bytes,
+    bytearray: ByteArray,
 }
 
+if _memoryview is not None:
+    registered_builtins[_memoryview] = MemoryView
+
+if array is not None:
+    registered_builtins[array] = Array
+
 
 for cls in registered_builtins.values():
     portable_class(register(cls, name=cls.__name__))
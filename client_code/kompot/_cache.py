@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+from functools import wraps as _wraps
+from json import dumps as _json_dumps
+from time import time
+
+from ._request import get_user
+from ._serialize import UNHANDLED, serialize
+
+try:
+    from threading import Lock as _Lock
+except ImportError:
+    # client side there is only one thread
+    _Lock = None
+
+__version__ = "0.0.1"
+
+# Server side caches for the return values of kompot.callable functions
+# entries are keyed on the serialized args and kws, and the user when require_user is set
+# a dict keeps the entries in order of use - the first entry is the least recently used
+# a cache lives in the server process, so it only lasts between calls on a persistent server
+# the functions of a parallel batch use it from several threads, so the entries are behind a lock
+
+_caches = {}  # fn_name -> Cache
+
+
+class Uncacheable(Exception):
+    pass
+
+
+def make_key(args, kws):
+    serialized = serialize([args, kws])
+    unhandled = serialized.pop(UNHANDLED)
+    ids = []
+    for obj in unhandled:
+        # table rows and users are keyed on their id, anything else can't be cached
+        get_id = getattr(obj, "get_id", None)
+        if get_id is None:
+            raise Uncacheable
+        ids.append(get_id())
+    return _json_dumps([serialized, ids])
+
+
+class _NoLock:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+class Cache:
+    """an LRU cache with an optional time to live in seconds"""
+
+    def __init__(self, maxsize=128, ttl=None):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = {}  # (args_key, user_key) -> (expires, value)
+        self._lock = _NoLock() if _Lock is None else _Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """Returns: (True, value) for a hit, (False, None) for a miss"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > time()):
+                self._entries[key] = entry
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.pop(next(iter(self._entries)), None)
+                    self.evictions += 1
+
+    def invalidate(self, *args, **kws):
+        """remove the cached values for these args and kws, for every user"""
+        try:
+            args_key = make_key(args, kws)
+        except Uncacheable:
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == args_key]:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+
+def get_cache(fn_name):
+    """the cache of a kompot.callable registered with cache=..."""
+    try:
+        return _caches[fn_name]
+    except KeyError:
+        raise ValueError(f"No cache has been set for the kompot callable '{fn_name}'")
+
+
+def _get_user_key(require_user):
+    if require_user is None:
+        return None
+    user = get_user()
+    return None if user is None else user.get_id()
+
+
+def wrap_cache(fn, name, require_user, cache):
+    """cache=True for the default Cache, or a Cache"""
+    if cache is True:
+        cache = Cache()
+    _caches[name] = cache
+
+    @_wraps(fn)
+    def cache_wrapper(*args, **kws):
+        try:
+            key = make_key(args, kws), _get_user_key(require_user)
+        except Uncacheable:
+            return fn(*args, **kws)
+        hit, rv = cache.get(key)
+        if not hit:
+            rv = fn(*args, **kws)
+            if not hasattr(rv, "__next__"):
+                # generators (see kompot.stream) can only be consumed once
+                cache.set(key, rv)
+        return rv
+
+    return cache_wrapper
@@ -0,0 +1,272 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+import json as _json
+from math import copysign, frexp, ldexp
+
+import anvil
+
+try:
+    from struct import pack as _pack
+    from struct import unpack as _unpack
+except ImportError:
+    # not every client side runtime has struct
+    _pack = _unpack = None
+
+__version__ = "0.0.1"
+
+# A codec turns the output of serialize into something anvil can send and back again
+# codecs have a name, dumps(obj) -> payload and loads(payload) -> obj
+
+
+class JSONCodec:
+    name = "json"
+
+    @staticmethod
+    def dumps(obj):
+        return _json.dumps(obj)
+
+    @staticmethod
+    def loads(payload):
+        return _json.loads(payload)
+
+
+# BINARY
+# a subset of msgpack (https://msgpack.org/) - enough for the JSONable output of serialize
+# nil, bool, int (up to 64 bits), float 64, str, bin, array and map
+# the encoder builds a list of byte values so that it works wherever bytes(list) does
+
+
+def _pack_uint(out, n, size):
+    for shift in range(8 * (size - 1), -8, -8):
+        out.append((n >> shift) & 0xFF)
+
+
+def _unpack_uint(data, i, size):
+    n = 0
+    for b in data[i : i + size]:
+        n = (n << 8) | b
+    return n
+
+
+def _double_to_bits(x):
+    if _pack is not None:
+        return _unpack(">Q", _pack(">d", x))[0]
+    # finite floats only - serialize sends inf and nan as strings
+    sign = 1 if copysign(1.0, x) < 0 else 0
+    x = abs(x)
+    if x == 0:
+        return sign << 63
+    m, e = frexp(x)  # x = m * 2**e with 0.5 <= m < 1
+    exponent = e + 1022
+    if exponent <= 0:
+        # subnormal
+        mantissa = int(ldexp(m, 52 + exponent))
+        exponent = 0
+    else:
+        mantissa = int(ldexp(m, 53)) - (1 << 52)
+    return (sign << 63) | (exponent << 52) | mantissa
+
+
+def _bits_to_double(bits):
+    if _pack is not None:
+        return _unpack(">d", _pack(">Q", bits))[0]
+    sign = -1.0 if bits >> 63 else 1.0
+    exponent = (bits >> 52) & 0x7FF
+    mantissa = bits & ((1 << 52) - 1)
+    if exponent == 0:
+        return sign * ldexp(mantissa, -1074)
+    return sign * ldexp(mantissa + (1 << 52), exponent - 1075)
+
+
+def _pack_length(out, n, fix, fix_max, codes):
+    if n <= fix_max:
+        out.append(fix | n)
+    elif codes[0] is not None and n <= 0xFF:
+        out.append(codes[0])
+        out.append(n)
+    elif n <= 0xFFFF:
+        out.append(codes[1])
+        _pack_uint(out, n, 2)
+    else:
+        out.append(codes[2])
+        _pack_uint(out, n, 4)
+
+
+def _encode(obj, out):
+    tp = type(obj)
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif tp is str:
+        encoded = obj.encode("utf-8")
+        _pack_length(out, len(encoded), 0xA0, 31, (0xD9, 0xDA, 0xDB))
+        out.extend(encoded)
+    elif tp is list or tp is tuple:
+        _pack_length(out, len(obj), 0x90, 15, (None, 0xDC, 0xDD))
+        for item in obj:
+            _encode(item, out)
+    elif tp is dict:
+        _pack_length(out, len(obj), 0x80, 15, (None, 0xDE, 0xDF))
+        for k, v in obj.items():
+            _encode(k, out)
+            _encode(v, out)
+    elif isinstance(obj, int):
+        if 0 <= obj <= 0x7F:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif 0 <= obj <= 0xFFFFFFFF:
+            size = 1 if obj <= 0xFF else 2 if obj <= 0xFFFF else 4
+            out.append({1: 0xCC, 2: 0xCD, 4: 0xCE}[size])
+            _pack_uint(out, obj, size)
+        elif -(1 << 31) <= obj < 0:
+            size = 1 if obj >= -0x80 else 2 if obj >= -0x8000 else 4
+            out.append({1: 0xD0, 2: 0xD1, 4: 0xD2}[size])
+            _pack_uint(out, obj + (1 << (8 * size)), size)
+        elif 0 <= obj < (1 << 64):
+            out.append(0xCF)
+            _pack_uint(out, obj, 8)
+        elif -(1 << 63) <= obj < 0:
+            out.append(0xD3)
+            _pack_uint(out, obj + (1 << 64), 8)
+        else:
+            raise OverflowError("int too large for the binary codec")
+    elif isinstance(obj, float):
+        out.append(0xCB)
+        _pack_uint(out, _double_to_bits(obj), 8)
+    elif tp is bytes or tp is bytearray:
+        _pack_length(out, len(obj), 0, -1, (0xC4, 0xC5, 0xC6))
+        out.extend(obj)
+    else:
+        raise TypeError(f"Cannot encode {tp.__name__} with the binary codec")
+
+
+def packb(obj):
+    out = []
+    _encode(obj, out)
+    return bytes(out)
+
+
+# (size of the length or value, kind) for each first byte that isn't a fix type
+_SIZED = {
+    0xC4: (1, "bin"),
+    0xC5: (2, "bin"),
+    0xC6: (4, "bin"),
+    0xCB: (8, "float"),
+    0xCC: (1, "uint"),
+    0xCD: (2, "uint"),
+    0xCE: (4, "uint"),
+    0xCF: (8, "uint"),
+    0xD0: (1, "int"),
+    0xD1: (2, "int"),
+    0xD2: (4, "int"),
+    0xD3: (8, "int"),
+    0xD9: (1, "str"),
+    0xDA: (2, "str"),
+    0xDB: (4, "str"),
+    0xDC: (2, "array"),
+    0xDD: (4, "array"),
+    0xDE: (2, "map"),
+    0xDF: (4, "map"),
+}
+
+
+def _decode(data, i):
+    """Returns: (the value starting at data[i], the index after it)"""
+    b = data[i]
+    i += 1
+    if b <= 0x7F:
+        return b, i
+    if b >= 0xE0:
+        return b - 0x100, i
+    if 0xA0 <= b <= 0xBF:
+        end = i + (b & 0x1F)
+        return data[i:end].decode("utf-8"), end
+    if 0x90 <= b <= 0x9F:
+        kind, n = "array", b & 0x0F
+    elif 0x80 <= b <= 0x8F:
+        kind, n = "map", b & 0x0F
+    elif b == 0xC0:
+        return None, i
+    elif b == 0xC2:
+        return False, i
+    elif b == 0xC3:
+        return True, i
+    else:
+        try:
+            size, kind = _SIZED[b]
+        except KeyError:
+            raise ValueError(f"Unsupported binary codec type 0x{b:02x}")
+        n = _unpack_uint(data, i, size)
+        i += size
+        if kind == "uint":
+            return n, i
+        if kind == "int":
+            bits = 8 * size
+            return (n - (1 << bits) if n >> (bits - 1) else n), i
+        if kind == "float":
+            return _bits_to_double(n), i
+        if kind == "str":
+            return data[i : i + n].decode("utf-8"), i + n
+        if kind == "bin":
+            return bytes(data[i : i + n]), i + n
+
+    if kind == "array":
+        rv = []
+        for _ in range(n):
+            item, i = _decode(data, i)
+            rv.append(item)
+        return rv, i
+
+    rv = {}
+    for _ in range(n):
+        k, i = _decode(data, i)
+        rv[k], i = _decode(data, i)
+    return rv, i
+
+
+def unpackb(data):
+    rv, i = _decode(data, 0)
+    if i != len(data):
+        raise ValueError("Extra data after the binary codec payload")
+    return rv
+
+
+class BinaryCodec:
+    """msgpack encoded bytes, sent as a Media object"""
+
+    name = "binary"
+    content_type = "application/x-kompot"
+
+    @classmethod
+    def dumps(cls, obj):
+        return anvil.BlobMedia(cls.content_type, packb(obj))
+
+    @staticmethod
+    def loads(payload):
+        if not isinstance(payload, bytes):
+            payload = payload.get_bytes()
+        return unpackb(payload)
+
+
+codecs = {}
+
+
+def register_codec(codec):
+    """add a codec that can be chosen with kompot.codec(name)"""
+    codecs[codec.name] = codec
+    return codec
+
+
+def get_codec(name):
+    try:
+        return codecs[name]
+    except KeyError:
+        raise ValueError(f"Unknown kompot codec {name!r}")
+
+
+register_codec(JSONCodec)
+register_codec(BinaryCodec)
@@ -0,0 +1,200 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+from ..dataklasses import is_dataklass
+from ._register import (
+    decoders,
+    encoders,
+    get_registered_cls,
+    registered_fields,
+    registered_types,
+)
+
+__version__ = "0.0.1"
+
+# Each registered class gets an encoder and a decoder the first time it is used
+# the fields come from, in order of preference:
+#   the fields passed to register
+#   __slots__
+#   __match_args__, only for dataklasses - other classes may have attributes that aren't in it
+# classes without fields are serialized from their __dict__
+# so is a dataklass instance with attributes that aren't in __match_args__, see Encoder.dict_len
+
+
+class Encoder:
+    __slots__ = ("name", "serialize", "fields", "items", "values", "dict_len")
+
+    def __init__(self, name, serialize=None, fields=None, dict_len=None):
+        self.name = name
+        self.serialize = serialize  # cls.__serialize__ or None
+        self.fields = fields  # a tuple of field names or None
+        # None, or the number of fields when they aren't guaranteed to be all the attributes
+        # an instance whose __dict__ has a different length, or lacks a field, is serialized from its __dict__
+        # if it has every field and the same length, its keys are the fields
+        self.dict_len = dict_len
+        self.items = self.values = None
+        if fields is not None:
+            # items(obj) -> ((field, value), ...) and values(obj) -> (value, ...)
+            self.items = compile_items(fields)
+            self.values = compile_values(fields)
+
+
+def _mangle(cls, name):
+    if name.startswith("__") and not name.endswith("__"):
+        return "_" + cls.__name__.lstrip("_") + name
+    return name
+
+
+def get_slots(cls):
+    """the slots of a class if none of its instances have a __dict__, otherwise None"""
+    fields = []
+    for base in reversed(cls.__mro__[:-1]):
+        slots = base.__dict__.get("__slots__")
+        if slots is None:
+            return None
+        if isinstance(slots, str):
+            slots = [slots]
+        for slot in slots:
+            if slot in ("__dict__", "__weakref__"):
+                if slot == "__dict__":
+                    return None
+                continue
+            fields.append(_mangle(base, slot))
+    return tuple(fields)
+
+
+def get_fields(cls):
+    fields = registered_fields.get(cls)
+    if fields is not None:
+        return fields
+    fields = get_slots(cls)
+    if fields is not None:
+        return fields
+    if is_dataklass(cls):
+        return cls.__match_args__
+    return None
+
+
+def _exec(code, namespace):
+    exec(code, namespace)
+    return namespace
+
+
+def compile_items(fields):
+    """def items(obj): return (("a", obj.a), ("b", obj.b), )"""
+    pairs = "".join(f"({f!r}, obj.{f}), " for f in fields)
+    return _exec("def items(obj):\n return (" + pairs + ")\n", {})["items"]
+
+
+def compile_values(fields):
+    """def values(obj): return (obj.a, obj.b, )"""
+    code = "def values(obj):\n return (" + "".join(f"obj.{f}, " for f in fields) + ")\n"
+    return _exec(code, {})["values"]
+
+
+def compile_setter(cls, fields):
+    """def decode(data): obj = new(cls); obj.a = data["a"]; ...; return obj"""
+    code = "def decode(data):\n obj = new(cls)\n"
+    code += "".join(f" obj.{f} = data[{f!r}]\n" for f in fields)
+    code += " return obj\n"
+    return _exec(code, {"new": cls.__new__, "cls": cls})["decode"]
+
+
+def compile_encoder(cls):
+    name = registered_types[cls]
+    serialize = getattr(cls, "__serialize__", None)
+    fields = None if serialize is not None else get_fields(cls)
+    dict_len = None
+    if fields is not None and cls not in registered_fields and get_slots(cls) is None:
+        dict_len = len(fields)
+    encoder = encoders[cls] = Encoder(name, serialize, fields, dict_len)
+    return encoder
+
+
+def get_encoder(cls):
+    """Returns: the encoder for a registered class, None if the class isn't registered"""
+    encoder = encoders.get(cls)
+    if encoder is not None or cls not in registered_types:
+        return encoder
+    return compile_encoder(cls)
+
+
+def compile_decoder(tp_name):
+    cls = get_registered_cls(tp_name)
+    new = cls.__new__
+
+    new_deserialized = getattr(cls, "__new_deserialized__", None)
+    if new_deserialized is not None:
+
+        def decode(data):
+            return new_deserialized(data, None)
+
+    elif getattr(cls, "__deserialize__", None) is not None:
+
+        def decode(data):
+            obj = new(cls)
+            obj.__deserialize__(data, None)
+            return obj
+
+    elif get_slots(cls) is not None:
+        decode = compile_setter(cls, get_slots(cls))
+
+    else:
+
+        def decode(data):
+            obj = new(cls)
+            obj.__dict__.update(data)
+            return obj
+
+    decoders[tp_name] = decode
+    return decode
+
+
+def get_decoder(tp_name):
+    decode = decoders.get(tp_name)
+    if decode is not None:
+        return decode
+    return compile_decoder(tp_name)
+
+
+def decode_rows(tp_name, fields, columns):
+    """rebuild a list of objects from columns of values"""
+    cls = get_registered_cls(tp_name)
+    rows = zip(*columns)
+    if (
+        getattr(cls, "__new_deserialized__", None) is not None
+        or getattr(cls, "__deserialize__", None) is not None
+        or get_slots(cls) is not None
+    ):
+        decode = get_decoder(tp_name)
+        return [decode(dict(zip(fields, row))) for row in rows]
+
+    # objects with a __dict__ and no custom deserialization
+    new = cls.__new__
+    rv = []
+    for row in rows:
+        obj = new(cls)
+        obj.__dict__.update(zip(fields, row))
+        rv.append(obj)
+    return rv
+
+
+def get_row_decoder(tp_name, fields):
+    """Returns: a function that rebuilds one object from its row of values"""
+    cls = get_registered_cls(tp_name)
+    if (
+        getattr(cls, "__new_deserialized__", None) is not None
+        or getattr(cls, "__deserialize__", None) is not None
+        or get_slots(cls) is not None
+    ):
+        decode = get_decoder(tp_name)
+        return lambda row: decode(dict(zip(fields, row)))
+
+    new = cls.__new__
+
+    def decode_row(row):
+        obj = new(cls)
+        obj.__dict__.update(zip(fields, row))
+        return obj
+
+    return decode_row
@@ -0,0 +1,298 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+try:
+    import zlib as _zlib
+except ImportError:
+    # not every client side runtime has zlib
+    _zlib = None
+
+__version__ = "0.0.1"
+
+# zlib streams (RFC 1950) of DEFLATE data (RFC 1951)
+# compress and decompress use the zlib module when it is available
+# the pure Python versions are for client side runtimes without it:
+#   _deflate - greedy LZ77 matches with the fixed Huffman codes, in a single block
+#   _inflate - any DEFLATE stream: stored, fixed and dynamic Huffman blocks
+
+
+def _adler32(data):
+    a, b = 1, 0
+    for i in range(0, len(data), 5552):
+        for byte in data[i : i + 5552]:
+            a += byte
+            b += a
+        a %= 65521
+        b %= 65521
+    return (b << 16) | a
+
+
+# (base, extra bits) for length codes 257..285 and distance codes 0..29
+_LENGTHS = [
+    (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (8, 0), (9, 0), (10, 0),
+    (11, 1), (13, 1), (15, 1), (17, 1), (19, 2), (23, 2), (27, 2), (31, 2),
+    (35, 3), (43, 3), (51, 3), (59, 3), (67, 4), (83, 4), (99, 4), (115, 4),
+    (131, 5), (163, 5), (195, 5), (227, 5), (258, 0),
+]  # fmt: skip
+_DISTANCES = [
+    (1, 0), (2, 0), (3, 0), (4, 0), (5, 1), (7, 1), (9, 2), (13, 2),
+    (17, 3), (25, 3), (33, 4), (49, 4), (65, 5), (97, 5), (129, 6), (193, 6),
+    (257, 7), (385, 7), (513, 8), (769, 8), (1025, 9), (1537, 9), (2049, 10), (3073, 10),
+    (4097, 11), (6145, 11), (8193, 12), (12289, 12), (16385, 13), (24577, 13),
+]  # fmt: skip
+# the order code length code lengths are sent in, for dynamic blocks
+_CL_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15]
+
+_FIXED_LENGTHS = [8] * 144 + [9] * 112 + [7] * 24 + [8] * 8
+
+
+def _codes(lengths):
+    """canonical Huffman codes - Returns: a list of (code, length) per symbol"""
+    count = [0] * 16
+    for n in lengths:
+        count[n] += 1
+    count[0] = 0
+    next_code = [0] * 16
+    code = 0
+    for bits in range(1, 16):
+        code = (code + count[bits - 1]) << 1
+        next_code[bits] = code
+    rv = []
+    for n in lengths:
+        if n:
+            rv.append((next_code[n], n))
+            next_code[n] += 1
+        else:
+            rv.append((0, 0))
+    return rv
+
+
+def _reverse(code, n):
+    rv = 0
+    for _ in range(n):
+        rv = (rv << 1) | (code & 1)
+        code >>= 1
+    return rv
+
+
+# DEFLATE - bits are packed from the least significant bit, Huffman codes are reversed
+
+_FIXED_CODES = [(_reverse(code, n), n) for code, n in _codes(_FIXED_LENGTHS)]
+_FIXED_DIST_CODES = [(_reverse(d, 5), 5) for d in range(30)]
+
+
+def _length_symbol(length):
+    for i in range(len(_LENGTHS) - 1, -1, -1):
+        if _LENGTHS[i][0] <= length:
+            return i
+
+
+def _distance_symbol(distance):
+    for i in range(len(_DISTANCES) - 1, -1, -1):
+        if _DISTANCES[i][0] <= distance:
+            return i
+
+
+# lookup tables so that matches don't search the code tables
+_LENGTH_SYMBOLS = [None] * 3 + [_length_symbol(n) for n in range(3, 259)]
+_DISTANCE_SYMBOLS = [_distance_symbol(d) for d in range(1, 257)]
+
+
+def _deflate(data, window=32768, max_len=258):
+    out = bytearray()
+    acc = nbits = 0
+
+    def put(value, n):
+        nonlocal acc, nbits
+        acc |= value << nbits
+        nbits += n
+        while nbits >= 8:
+            out.append(acc & 0xFF)
+            acc >>= 8
+            nbits -= 8
+
+    put(0b011, 3)  # final block, fixed Huffman codes
+    heads = {}  # the last position of each 3 byte prefix
+    i = 0
+    end = len(data)
+    while i < end:
+        length = 0
+        if i + 2 < end:
+            key = data[i : i + 3]
+            j = heads.get(key)
+            heads[key] = i
+            if j is not None and i - j <= window:
+                limit = min(max_len, end - i)
+                length = 3
+                while length < limit and data[j + length] == data[i + length]:
+                    length += 1
+        if length < 3:
+            put(*_FIXED_CODES[data[i]])
+            i += 1
+            continue
+
+        sym = _LENGTH_SYMBOLS[length]
+        put(*_FIXED_CODES[257 + sym])
+        base, extra = _LENGTHS[sym]
+        if extra:
+            put(length - base, extra)
+        distance = i - j
+        if distance <= 256:
+            sym = _DISTANCE_SYMBOLS[distance - 1]
+        else:
+            sym = _distance_symbol(distance)
+        put(*_FIXED_DIST_CODES[sym])
+        base, extra = _DISTANCES[sym]
+        if extra:
+            put(distance - base, extra)
+        # index the prefixes inside the match too, so later matches can find them
+        for k in range(i + 1, min(i + length, end - 2)):
+            heads[data[k : k + 3]] = k
+        i += length
+
+    put(*_FIXED_CODES[256])  # end of block
+    if nbits:
+        out.append(acc & 0xFF)
+    return bytes(out)
+
+
+# INFLATE
+
+
+class _Bits:
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos  # the next byte
+        self.acc = 0
+        self.nbits = 0
+
+    def get(self, n):
+        while self.nbits < n:
+            self.acc |= self.data[self.pos] << self.nbits
+            self.pos += 1
+            self.nbits += 8
+        rv = self.acc & ((1 << n) - 1)
+        self.acc >>= n
+        self.nbits -= n
+        return rv
+
+    def align(self):
+        self.acc = self.nbits = 0
+
+
+def _decoder(lengths):
+    """Returns: {(length, code): symbol} with the codes in the order they are read"""
+    return {(n, code): sym for sym, (code, n) in enumerate(_codes(lengths)) if n}
+
+
+def _decode(bits, table):
+    code = n = 0
+    while True:
+        code = (code << 1) | bits.get(1)
+        n += 1
+        sym = table.get((n, code))
+        if sym is not None:
+            return sym
+        if n > 15:
+            raise ValueError("Invalid DEFLATE data")
+
+
+_FIXED_TABLES = None
+
+
+def _fixed_tables():
+    global _FIXED_TABLES
+    if _FIXED_TABLES is None:
+        _FIXED_TABLES = _decoder(_FIXED_LENGTHS), _decoder([5] * 30)
+    return _FIXED_TABLES
+
+
+def _dynamic_tables(bits):
+    hlit = bits.get(5) + 257
+    hdist = bits.get(5) + 1
+    hclen = bits.get(4) + 4
+    cl_lengths = [0] * 19
+    for i in range(hclen):
+        cl_lengths[_CL_ORDER[i]] = bits.get(3)
+    cl_table = _decoder(cl_lengths)
+    lengths = []
+    while len(lengths) < hlit + hdist:
+        sym = _decode(bits, cl_table)
+        if sym < 16:
+            lengths.append(sym)
+        elif sym == 16:
+            lengths.extend([lengths[-1]] * (3 + bits.get(2)))
+        elif sym == 17:
+            lengths.extend([0] * (3 + bits.get(3)))
+        else:
+            lengths.extend([0] * (11 + bits.get(7)))
+    return _decoder(lengths[:hlit]), _decoder(lengths[hlit:])
+
+
+def _inflate(data, pos=0):
+    """Returns: (the inflated bytes, the index after the DEFLATE data)"""
+    out = bytearray()
+    bits = _Bits(data, pos)
+    final = 0
+    while not final:
+        final = bits.get(1)
+        kind = bits.get(2)
+        if kind == 0:
+            bits.align()
+            p = bits.pos
+            n = data[p] | (data[p + 1] << 8)
+            out += data[p + 4 : p + 4 + n]
+            bits.pos = p + 4 + n
+            continue
+        if kind == 1:
+            lit_table, dist_table = _fixed_tables()
+        elif kind == 2:
+            lit_table, dist_table = _dynamic_tables(bits)
+        else:
+            raise ValueError("Invalid DEFLATE block type")
+        while True:
+            sym = _decode(bits, lit_table)
+            if sym < 256:
+                out.append(sym)
+                continue
+            if sym == 256:
+                break
+            base, extra = _LENGTHS[sym - 257]
+            length = base + (bits.get(extra) if extra else 0)
+            base, extra = _DISTANCES[_decode(bits, dist_table)]
+            start = len(out) - base - (bits.get(extra) if extra else 0)
+            if start + length <= len(out):
+                out += out[start : start + length]
+            else:
+                # the match overlaps the bytes it is copying
+                for k in range(start, start + length):
+                    out.append(out[k])
+    return bytes(out), bits.pos
+
+
+def has_zlib():
+    """whether compress and decompress use the zlib module rather than the slow pure Python versions"""
+    return _zlib is not None
+
+
+def compress(data):
+    """Returns: data as a zlib stream"""
+    if _zlib is not None:
+        return _zlib.compress(data)
+    body = _deflate(data)
+    checksum = _adler32(data)
+    return b"\x78\x01" + body + bytes((checksum >> s) & 0xFF for s in (24, 16, 8, 0))
+
+
+def decompress(data):
+    if _zlib is not None:
+        return _zlib.decompress(data)
+    if (data[0] & 0x0F) != 8 or ((data[0] << 8) | data[1]) % 31:
+        raise ValueError("Invalid zlib header")
+    rv, pos = _inflate(data, 2)
+    checksum = 0
+    for byte in data[pos : pos + 4]:
+        checksum = (checksum << 8) | byte
+    if checksum != _adler32(rv):
+        raise ValueError("Invalid zlib checksum")
+    return rv
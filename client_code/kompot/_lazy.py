@@ -0,0 +1,317 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+from ._compile import get_row_decoder
+from ._register import get_registered_cls
+from ._serialize import (
+    COLUMNS,
+    DICT,
+    NAMES,
+    PATHS,
+    TYPES,
+    UNHANDLED,
+    VALUE,
+    reconstruct_portable_class,
+)
+
+__version__ = "0.0.1"
+
+# LAZY RECONSTRUCTION
+# reconstruct(obj, lazy=True) only rebuilds what is needed to return the top level value
+# a list that holds portable objects becomes a LazyList - each item is rebuilt when it is first accessed
+# a list sent as columns becomes a LazyRows - each row is rebuilt when it is first accessed
+# lists are only deferred where the user will see them:
+#   the value itself, the attributes of objects without custom deserialization and the values of dicts
+# anything else, e.g. the data passed to __deserialize__ or the items of a set, is rebuilt with its parent
+# payloads with back references are always reconstructed eagerly, see reconstruct
+
+# where the lists in the data of an entry can be deferred
+_USER = "user"  # the data is a dict of attributes, any list in it is seen by the user
+_DICT = "dict"  # the data is a list of [key, value] pairs, lists in the values are seen by the user
+_EAGER = "eager"  # the data is passed to custom code, nothing is deferred
+
+_MISSING = object()
+
+
+class LazySequence:
+    """a read only sequence whose items are rebuilt when they are first accessed
+    use list(seq) for a list
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(n))]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("list index out of range")
+        return self._get(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self._get(i)
+
+    def __contains__(self, value):
+        for item in self:
+            if item is value or item == value:
+                return True
+        return False
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazySequence)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        rv = self.__eq__(other)
+        return rv if rv is NotImplemented else not rv
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def index(self, value):
+        for i, item in enumerate(self):
+            if item is value or item == value:
+                return i
+        raise ValueError(f"{value!r} is not in list")
+
+    def count(self, value):
+        return sum(1 for item in self if item is value or item == value)
+
+
+class LazyList(LazySequence):
+    """a list from the payload, its pending items are entries that haven't been rebuilt"""
+
+    __slots__ = ("_items", "_pending", "_builder")
+
+    def __init__(self, items, builder):
+        self._items = items
+        self._pending = {}  # index -> entry
+        self._builder = builder
+
+    def __len__(self):
+        return len(self._items)
+
+    def _get(self, i):
+        entry = self._pending.pop(i, None)
+        if entry is not None:
+            self._items[i] = self._builder.build(entry, self._items[i])
+        return self._items[i]
+
+
+class LazyRows(LazySequence):
+    """a list of objects sent as columns"""
+
+    __slots__ = (
+        "_rows",
+        "_columns",
+        "_decode",
+        "_mode",
+        "_pending",
+        "_builder",
+        "_depth",
+    )
+
+    def __init__(self, tp_name, fields, columns, builder):
+        self._rows = [_MISSING] * (len(columns[0]) if columns else 0)
+        self._columns = columns
+        self._decode = get_row_decoder(tp_name, fields)
+        self._mode = builder.mode(tp_name)
+        self._pending = {}  # row -> [entry, ...]
+        self._builder = builder
+        self._depth = None  # the length of the path to the columns
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _get(self, i):
+        row = self._rows[i]
+        if row is _MISSING:
+            values = [column[i] for column in self._columns]
+            entries = self._pending.pop(i, None)
+            if entries is not None:
+                values = self._builder.place(
+                    entries, self._depth + 1, values, self._mode, row=True
+                )
+            row = self._rows[i] = self._decode(values)
+        return row
+
+
+class Builder:
+    def __init__(self, json_obj):
+        self.types = types = []
+        for index, count in json_obj[TYPES]:
+            types += [None if index is None else json_obj[NAMES][index]] * count
+        self.unhandled = json_obj.get(UNHANDLED, [])
+        self.entries = entries = json_obj[PATHS]
+        self.modes = {}
+
+        # entries are in post order - the descendants of an entry come just before it
+        # the stack holds the entries whose parent hasn't been seen yet
+        # low[entry] is the shortest prefix shared by the entries from the one below it on the stack
+        # so the entries still on the stack that share the whole path of the next entry are its children
+        # only the paths of entries that aren't in the same container as the previous entry are kept
+        self.paths = paths = {}
+        self.found = {}  # the paths of the other entries, once they are needed
+        self.children = children = {}
+        self.unhandled_index = unhandled_index = {}
+        stack = []
+        low = []
+        path = []
+        n = 0
+        for entry, item in enumerate(entries):
+            shared = item[0]
+            if len(item) == 2 and shared == n - 1:
+                path[shared] = item[1]
+            else:
+                del path[shared:]
+                path.extend(item[1:])
+                n = len(path)
+                paths[entry] = path[:]
+            if types[entry] is None:
+                unhandled_index[entry] = len(unhandled_index)
+
+            m = shared
+            start = len(stack)
+            while start and m >= n:
+                start -= 1
+                if low[stack[start]] < m:
+                    m = low[stack[start]]
+            if start < len(stack):
+                children[entry] = stack[start:]
+                del stack[start:]
+            stack.append(entry)
+            low.append(m)
+        self.roots = stack
+
+    def path_of(self, entry):
+        path = self.paths.get(entry) or self.found.get(entry)
+        if path is not None:
+            return path
+        # in the same container as the previous entry, and so on back to a known path
+        start = entry - 1
+        while start not in self.paths and start not in self.found:
+            start -= 1
+        container = self.path_of(start)[:-1]
+        path = self.found[entry] = container + self.entries[entry][1:]
+        return path
+
+    def mode(self, tp_name):
+        mode = self.modes.get(tp_name)
+        if mode is None:
+            cls = get_registered_cls(tp_name)
+            if tp_name == DICT:
+                mode = _DICT
+            elif (
+                getattr(cls, "__new_deserialized__", None) is None
+                and getattr(cls, "__deserialize__", None) is None
+            ):
+                mode = _USER
+            else:
+                mode = _EAGER
+            self.modes[tp_name] = mode
+        return mode
+
+    def build(self, entry, data):
+        tp_name = self.types[entry]
+        if tp_name is None:
+            return self.unhandled[self.unhandled_index[entry]]
+        children = self.children.get(entry)
+        if tp_name == COLUMNS:
+            return self.build_rows(entry, children, data)
+        if children is not None:
+            depth = len(self.path_of(entry))
+            data = self.place(children, depth, data, self.mode(tp_name))
+        return reconstruct_portable_class(tp_name, data)
+
+    def build_rows(self, entry, children, data):
+        tp_name, fields, columns = data
+        if children is None:
+            return LazyRows(tp_name, fields, columns, self)
+        # the paths of the children are [2, column, row, ...]
+        # or [2, column] for a column that was itself sent as columns
+        # those columns are built first, since the number of rows is the length of a column
+        depth = len(self.path_of(entry))
+        pending = {}
+        for child in children:
+            path = self.path_of(child)
+            if len(path) == depth + 2:
+                columns[path[-1]] = self.build(child, columns[path[-1]])
+            else:
+                pending.setdefault(path[depth + 2], []).append(child)
+        rows = LazyRows(tp_name, fields, columns, self)
+        rows._pending = pending
+        rows._depth = depth
+        return rows
+
+    def place(self, entries, depth, data, mode, row=False):
+        """put the children of an entry into its data
+        entries are the children, depth is the length of the path to the data
+        with row=True the data is a row of values, and the paths of the entries include the row index
+        Returns: the data, which is replaced by a child with the same path
+        """
+        lazy = {}  # id(list) -> (LazyList, parent, key)
+        prev = -2
+        target = None  # the container or LazyList of the previous entry
+        for entry in entries:
+            if entry == prev + 1 and entry not in self.paths:
+                # in the same container as the previous entry
+                key = self.entries[entry][1]
+            else:
+                path = self.path_of(entry)
+                path = (
+                    path[depth : depth + 1] + path[depth + 2 :] if row else path[depth:]
+                )
+                if not path:
+                    data = self.build(entry, data)
+                    prev = -2
+                    continue
+                last = len(path) - 1
+                if mode == _USER:
+                    first = 1
+                elif mode == _DICT and path[1:2] == [1]:
+                    first = 2
+                else:
+                    first = len(path)
+
+                parent = None
+                target = data
+                for key in path[:last]:
+                    parent, target = target, target[key]
+                if last >= first and type(target) is list:
+                    wrapped = lazy.get(id(target))
+                    if wrapped is None:
+                        wrapped = lazy[id(target)] = (
+                            LazyList(target, self),
+                            parent,
+                            key,
+                        )
+                    target = wrapped[0]
+                key = path[last]
+            prev = entry
+
+            if type(target) is LazyList:
+                target._pending[key] = entry
+            else:
+                target[key] = self.build(entry, target[key])
+
+        # swap the lists for the LazyLists once nothing else walks through them
+        for items, parent, key in lazy.values():
+            parent[key] = items
+        return data
+
+
+def reconstruct_lazy(json_obj):
+    builder = Builder(json_obj)
+    holder = {VALUE: json_obj[VALUE]}
+    holder = builder.place(builder.roots, 0, holder, _USER)
+    return holder[VALUE]
@@ -0,0 +1,136 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+from math import frexp
+
+__version__ = "0.0.1"
+
+# INSTRUMENTATION
+# a call hook is called after each successful kompot.call, call_s and call_async with a dict of
+#   fn_name        - the name of the server function
+#   serialize      - seconds spent serializing (and compressing) the args
+#   network        - seconds between sending the call and getting the reply, less the server's time
+#   server         - seconds the server function ran for
+#   server_codec   - seconds the server spent deserializing the args and serializing the result
+#   deserialize    - seconds spent deserializing the result
+#   total          - seconds for the whole call
+#   request_size   - the size of the payload sent, in characters for text or bytes for Media
+#   response_size  - the size of the payload received
+# the timings are only collected, and the server only times itself, while there are hooks
+# a batch of calls, from batch_call or auto batching, is recorded as one call to the batch function
+# the sizes don't include unhandled objects, e.g. Media objects, which anvil sends as they are
+
+_call_hooks = []
+
+TIMINGS = ("serialize", "network", "server", "server_codec", "deserialize", "total")
+SIZES = ("request_size", "response_size")
+
+
+def add_call_hook(hook):
+    """call hook(timings) after each kompot call, see _metrics.py"""
+    if hook not in _call_hooks:
+        _call_hooks.append(hook)
+    return hook
+
+
+def remove_call_hook(hook):
+    if hook in _call_hooks:
+        _call_hooks.remove(hook)
+
+
+def emit(timings):
+    # the call has already succeeded, so a failing hook is printed rather than raised
+    for hook in list(_call_hooks):
+        try:
+            hook(timings)
+        except Exception as e:
+            print(f"kompot call hook {hook!r} failed: {e!r}")
+
+
+class Histogram:
+    """counts values in buckets that double in size
+    bucket k holds the values below base * 2**k
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.buckets = {}  # k -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        k = frexp(value / self.base)[1] if value > 0 else 0
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Returns: the upper bound of the bucket that holds the q quantile, at most the max"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen >= rank:
+                return min(self.base * 2**k, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": [
+                [self.base * 2**k, self.buckets[k]] for k in sorted(self.buckets)
+            ],
+        }
+
+
+class CallStats:
+    """a call hook that keeps a histogram of each timing and size for each server function
+
+    stats = kompot.add_call_hook(kompot.CallStats())
+    ...
+    stats.summary("get_rows")["server"]["p90"]
+    """
+
+    def __init__(self):
+        self._functions = {}  # fn_name -> {metric: Histogram}
+
+    def __call__(self, timings):
+        histograms = self._functions.get(timings["fn_name"])
+        if histograms is None:
+            histograms = self._functions[timings["fn_name"]] = {}
+            for metric in TIMINGS:
+                histograms[metric] = Histogram(1e-6)
+            for metric in SIZES:
+                histograms[metric] = Histogram(1)
+        for metric, histogram in histograms.items():
+            value = timings.get(metric)
+            if value is not None:
+                histogram.add(value)
+
+    def functions(self):
+        return list(self._functions)
+
+    def summary(self, fn_name):
+        """Returns: {metric: histogram summary} for a server function"""
+        try:
+            histograms = self._functions[fn_name]
+        except KeyError:
+            raise ValueError(f"No kompot calls to '{fn_name}' have been recorded")
+        return {metric: histogram.summary() for metric, histogram in histograms.items()}
+
+    def clear(self):
+        self._functions.clear()
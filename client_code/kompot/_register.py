@@ -1,36 +1,128 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
 
-from anvil.server import SerializationError
+from keyword import iskeyword
+from time import time
 
-from anvil_extras.utils import import_module
+from anvil.server import SerializationError
 
 __version__ = "0.0.1"
 
 registered_types = {}
 registered_names = {}
+registered_fields = {}
+
+# compiled encoders and decoders - see _compile.py
+encoders = {}
+decoders = {}
+
+# type names that couldn't be found, so that we don't import their module for every lookup
+# a name is removed when it is registered
+# if the module was imported the name is kept until it is evicted
+# if the import failed, it may work later, so the import is tried again after MISSING_RETRY seconds
+# the names come from the other side, so only the most recent MAX_MISSING are kept
+MAX_MISSING = 1024
+MISSING_RETRY = 60
+_missing = {}  # tp_name -> None, or the time to retry the import - oldest first
+
 
+def _add_missing(tp_name, retry=False):
+    _missing.pop(tp_name, None)
+    _missing[tp_name] = time() + MISSING_RETRY if retry else None
+    while len(_missing) > MAX_MISSING:
+        del _missing[next(iter(_missing))]
 
-def register(cls, name=None):
+
+def _is_missing(tp_name):
+    if tp_name not in _missing:
+        return False
+    retry_at = _missing[tp_name]
+    if retry_at is None or time() < retry_at:
+        return True
+    del _missing[tp_name]
+    return False
+
+
+def register(cls=None, name=None, fields=None):
+    """register a portable class with kompot
+    fields is an optional schema - the attributes to serialize, in order
+    """
+    if cls is None:
+        return lambda cls: register(cls, name, fields)
     if name is None:
         name = cls.__module__ + "." + cls.__name__
+    if fields is not None:
+        fields = tuple(fields)
+        for field in fields:
+            # the encoder and decoder are compiled with obj.field for each field
+            if not field.isidentifier() or iskeyword(field):
+                raise ValueError(f"{field!r} is not a valid field name")
+        registered_fields[cls] = fields
     registered_types[cls] = name
     registered_names[name] = cls
+    _missing.pop(name, None)
+    encoders.pop(cls, None)
+    decoders.pop(name, None)
     return cls
 
 
+def _import_module(mod):
+    try:
+        from anvil_extras.utils import import_module
+    except ImportError:
+        from importlib import import_module
+    import_module(mod)
+
+
 def get_registered_cls(tp_name):
     try:
         return registered_names[tp_name]
     except KeyError:
         pass
+    if _is_missing(tp_name):
+        raise SerializationError(f"Unregistered type {tp_name}")
 
     # assume we've sent a portable_class across the wire
     # if we're now on the server then the client module might need to be imported
     # we do that now and try to get the registered cls after the import
-    mod, _ = tp_name.rsplit(".", 1)
-    import_module(mod)
+    mod = tp_name.rpartition(".")[0]
+    try:
+        if mod:
+            _import_module(mod)
+    except ImportError:
+        _add_missing(tp_name, retry=True)
+        raise SerializationError(f"Unregistered type {tp_name}")
     try:
         return registered_names[tp_name]
     except KeyError:
+        _add_missing(tp_name)
         raise SerializationError(f"Unregistered type {tp_name}")
+
+
+def get_manifest():
+    """Returns: the names of the registered classes, to preload them before they are needed"""
+    return sorted(name for name in registered_names if "." in name)
+
+
+def preload(manifest):
+    """import the module of each type name in a manifest, see get_manifest
+    each module is imported once, however many of its names are in the manifest
+    Returns: the names that still aren't registered
+    """
+    modules = {}
+    for tp_name in manifest:
+        if tp_name not in registered_names:
+            modules.setdefault(tp_name.rpartition(".")[0], []).append(tp_name)
+    missing = []
+    for mod, tp_names in modules.items():
+        imported = True
+        try:
+            if mod:
+                _import_module(mod)
+        except ImportError:
+            imported = False
+        for tp_name in tp_names:
+            if tp_name not in registered_names:
+                _add_missing(tp_name, retry=not imported)
+                missing.append(tp_name)
+    return missing
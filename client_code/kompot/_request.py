@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+try:
+    from threading import local as _thread_local
+except ImportError:
+    # client side there is only one thread
+    _thread_local = None
+
+__version__ = "0.0.1"
+
+# The permission checks are memoised for the length of one incoming request
+# so that a batch of calls to functions with the same require_user only checks it once
+# the user itself is looked up for every call, since a call in the batch may log in or out
+# the memo is per thread - a parallel batch passes it to its worker threads, see with_request
+# worker threads don't have Anvil's call context, so they also get the user from the request thread
+
+
+_UNKNOWN = object()
+
+
+class _Local:
+    memo = None
+    user = _UNKNOWN
+
+
+_local = _Local() if _thread_local is None else _thread_local()
+
+
+class request_memo:
+    """memoise the permission checks until the outermost with block exits"""
+
+    def __enter__(self):
+        self.outer = get_memo() is None
+        if self.outer:
+            _local.memo = {}
+
+    def __exit__(self, *args):
+        if self.outer:
+            _local.memo = None
+
+
+def get_memo():
+    return getattr(_local, "memo", None)
+
+
+def get_request(needs_user=True):
+    """Returns: the memo and, if it is needed, the user of this request, to pass to with_request"""
+    return get_memo(), get_user() if needs_user else _UNKNOWN
+
+
+def with_request(request, fn, *args):
+    """call fn in another thread with the memo and user of the request that started it"""
+    _local.memo, _local.user = request
+    try:
+        return fn(*args)
+    finally:
+        _local.memo, _local.user = None, _UNKNOWN
+
+
+def get_user():
+    """the current user, or the user of the request for the worker threads of a parallel batch"""
+    user = getattr(_local, "user", _UNKNOWN)
+    if user is not _UNKNOWN:
+        return user
+    import anvil.users
+
+    return anvil.users.get_user()
+
+
+def check_permission(require_user, user):
+    """Returns: require_user(user), memoised for the request and the id of the user"""
+    memo = get_memo()
+    if memo is None:
+        return require_user(user)
+    key = (require_user, user.get_id())
+    try:
+        return memo[key]
+    except KeyError:
+        permitted = memo[key] = require_user(user)
+        return permitted
@@ -1,16 +1,55 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 anvilistas
-import json as _json
+from functools import partial as _partial
 from functools import wraps as _wraps
+from time import time as _time
 
 import anvil.server as _server
+from anvil import BlobMedia as _BlobMedia
 from anvil import is_server_side
 
+from ._cache import Uncacheable, make_key, wrap_cache
+from ._codecs import JSONCodec, get_codec
+from ._compress import compress, decompress, has_zlib
+from ._metrics import _call_hooks, emit
+from ._request import check_permission, get_user, request_memo
 from ._serialize import UNHANDLED, reconstruct, serialize
 
 __version__ = "0.0.1"
 
 _registered = {}
+_requires_user = set()  # the names of the functions registered with require_user
+_codec = [JSONCodec]  # the codec used for calls from this side - a stack, see codec()
+_lazy_results = [
+    False
+]  # whether results are reconstructed lazily - a stack, see lazy()
+
+# call_async shares one AsyncCall between identical calls to these functions while they are in flight
+_deduped = set()
+_in_flight = {}  # (fn_name, codec name, lazy, args key) -> AsyncCall
+
+# binary values at least this many bytes long are sent to the other side as Media objects
+# by default, see set_media_threshold
+MEDIA_THRESHOLD = 1 << 16
+# payloads at least this many bytes long are compressed by default, see set_compress
+COMPRESS_THRESHOLD = 1 << 14
+
+# compression is opt-in - once it is turned on a client with the zlib module
+# compresses large calls and adds +zlib-ok to the codec name to ask for compressed replies
+# the server only compresses the replies of calls that asked for it
+_settings = {
+    "media_threshold": MEDIA_THRESHOLD,
+    "compress": False,
+    "compress_threshold": COMPRESS_THRESHOLD,
+}
+# a compressed payload is sent as Media with one of these content types
+# and the codec name of a compressed call ends with +zlib
+ZLIB = "zlib"
+ZLIB_OK = "zlib-ok"
+ZLIB_TEXT = "text/x-kompot-zlib"
+ZLIB_BYTES = "application/x-kompot-zlib"
+# a codec name ending with +timing asks the server to send back how long it took, see _metrics.py
+TIMING = "timing"
 
 
 def _has_permission(require_user):
@@ -19,7 +58,7 @@ def _has_permission(require_user):
 
     import anvil.users
 
-    user = anvil.users.get_user()
+    user = get_user()
     if user is None:
         msg = "You must be logged in to call this server function"
         raise anvil.users.AuthenticationFailed(msg)
@@ -27,7 +66,8 @@ def _has_permission(require_user):
     if require_user is True:
         return True
 
-    return require_user(user)
+    # memoised for the length of the request, see _request.py
+    return check_permission(require_user, user)
 
 
 def _wrap_require(fn, name, require_user):
@@ -41,50 +81,212 @@ def _wrap_require(fn, name, require_user):
     return require_wrapper
 
 
-def _register(fn, name=None, require_user=None):
+def _register(fn, name=None, require_user=None, cache=None):
     if name is None:
         name = fn.__name__
-    _registered[name] = _wrap_require(fn, name, require_user)
+    wrapped = fn
+    if cache:
+        # permissions are checked before the cache is used
+        wrapped = wrap_cache(fn, name, require_user, cache)
+    _registered[name] = _wrap_require(wrapped, name, require_user)
+    if require_user is None:
+        _requires_user.discard(name)
+    else:
+        _requires_user.add(name)
     return fn
 
 
-def _dumps(obj):
-    serialized = serialize(obj)
+def _dumps(obj, codec=JSONCodec):
+    serialized = serialize(obj, media_threshold=_settings["media_threshold"])
     unhandled = serialized.pop(UNHANDLED)
-    return _json.dumps(serialized), unhandled
-
-
-def _loads(serialized, unhandled):
-    obj = _json.loads(serialized)
+    return codec.dumps(serialized), unhandled
+
+
+def _compress(payload):
+    """Returns: a compressed Media object, or None if compressing isn't worth it"""
+    if isinstance(payload, str):
+        content_type = ZLIB_TEXT
+        # a character is at most 4 bytes in utf-8
+        if len(payload) * 4 < _settings["compress_threshold"]:
+            return None
+        data = payload.encode("utf-8")
+    else:
+        content_type = ZLIB_BYTES
+        data = payload.get_bytes()
+    if len(data) < _settings["compress_threshold"]:
+        return None
+    compressed = compress(data)
+    if len(compressed) >= len(data):
+        return None
+    return _BlobMedia(content_type, compressed)
+
+
+def _decompress(payload):
+    data = decompress(payload.get_bytes())
+    if payload.content_type == ZLIB_TEXT:
+        return data.decode("utf-8")
+    return data
+
+
+def _loads(serialized, unhandled, codec=JSONCodec, lazy=False):
+    obj = codec.loads(serialized)
     obj[UNHANDLED] = unhandled
-    return reconstruct(obj)
+    return reconstruct(obj, lazy=lazy)
 
 
 def _wrap_callable(fn):
-    @_wraps(fn)
-    def wrapped(json_obj, unhandled):
-        args, kws = _loads(json_obj, unhandled)
+    def handle(payload, unhandled, codec_name):
+        # the caller chooses the codec and we reply with the same codec
+        # callers using the json codec without flags don't send a codec_name
+        # replies are only compressed for callers that sent +zlib-ok
+        start = _time()
+        codec = JSONCodec
+        flags = ()
+        if codec_name is not None:
+            flags = codec_name.split("+")
+            codec = get_codec(flags[0])
+            if ZLIB in flags:
+                payload = _decompress(payload)
+        args, kws = _loads(payload, unhandled, codec)
+        ran = _time()
         rv = fn(*args, **kws)
-        return _dumps(rv)
+        done = _time()
+        payload, unhandled = _dumps(rv, codec)
+        compressed = _compress(payload) if ZLIB_OK in flags else None
+        if TIMING in flags:
+            timings = {"run": done - ran, "codec": (ran - start) + (_time() - done)}
+            if compressed is None:
+                return payload, unhandled, None, timings
+            return compressed, unhandled, ZLIB, timings
+        if compressed is None:
+            return payload, unhandled
+        return compressed, unhandled, ZLIB
+
+    @_wraps(fn)
+    def wrapped(payload, unhandled, codec_name=None):
+        # the permission checks are memoised for the whole request, e.g. a batch
+        with request_memo():
+            return handle(payload, unhandled, codec_name)
 
     return wrapped
 
 
+class codec:
+    """use a codec for kompot calls made inside the with block
+    e.g. `with kompot.codec("binary"): kompot.call("get_data")`
+    """
+
+    def __init__(self, name):
+        self.codec = get_codec(name)
+
+    def __enter__(self):
+        _codec.append(self.codec)
+
+    def __exit__(self, *args):
+        _codec.pop()
+
+
+def set_codec(name):
+    """set the codec used for kompot calls by default"""
+    _codec[0] = get_codec(name)
+
+
+def set_compress(enabled=True, threshold=None):
+    """compress the payloads of kompot calls that are at least threshold bytes long
+    threshold=None uses the default, COMPRESS_THRESHOLD
+    on the server only the threshold is used - it compresses the replies to clients that turned compression on
+    """
+    _settings["compress"] = enabled
+    _settings["compress_threshold"] = (
+        COMPRESS_THRESHOLD if threshold is None else threshold
+    )
+
+
+def set_media_threshold(threshold=MEDIA_THRESHOLD):
+    """send binary values at least threshold bytes long as Media objects in kompot calls
+    threshold=None always sends them in the payload
+    """
+    _settings["media_threshold"] = threshold
+
+
+class lazy:
+    """lazily reconstruct the results of kompot calls made inside the with block
+    e.g. `with kompot.lazy(): rows = kompot.call("get_rows")`
+    """
+
+    def __enter__(self):
+        _lazy_results.append(True)
+
+    def __exit__(self, *args):
+        _lazy_results.pop()
+
+
+def _size(payload):
+    return len(payload) if isinstance(payload, str) else len(payload.get_bytes())
+
+
+def _call(server_call, codec, fn_name, args, kws, lazy=False):
+    timed = bool(_call_hooks)
+    start = _time() if timed else None
+    payload, unhandled = _dumps([args, kws], codec)
+    codec_name = codec.name
+    # the pure Python inflate is too slow to ask for compressed replies without zlib
+    if _settings["compress"] and has_zlib():
+        compressed = _compress(payload)
+        if compressed is not None:
+            payload = compressed
+            codec_name += "+" + ZLIB
+        codec_name += "+" + ZLIB_OK
+    if timed:
+        codec_name += "+" + TIMING
+        sent = _time()
+
+    if codec_name == JSONCodec.name:
+        rv = server_call(fn_name, payload, unhandled)
+    else:
+        rv = server_call(fn_name, payload, unhandled, codec_name)
+
+    if timed:
+        received = _time()
+        request_size, response_size = _size(payload), _size(rv[0])
+    payload, unhandled = rv[0], rv[1]
+    if len(rv) > 2 and rv[2] == ZLIB:
+        payload = _decompress(payload)
+    result = _loads(payload, unhandled, codec, lazy)
+
+    if timed:
+        server = rv[3] if len(rv) > 3 else {"run": None, "codec": None}
+        server_time = (server["run"] or 0) + (server["codec"] or 0)
+        end = _time()
+        emit(
+            {
+                "fn_name": fn_name,
+                "serialize": sent - start,
+                "network": max(0, received - sent - server_time),
+                "server": server["run"],
+                "server_codec": server["codec"],
+                "deserialize": end - received,
+                "total": end - start,
+                "request_size": request_size,
+                "response_size": response_size,
+            }
+        )
+    return result
+
+
 def call(fn_name, *args, **kws):
-    rv = _server.call(fn_name, *_dumps([args, kws]))
-    return _loads(*rv)
+    return _call(_server.call, _codec[-1], fn_name, args, kws, _lazy_results[-1])
 
 
 def call_s(fn_name, *args, **kws):
-    rv = _server.call_s(fn_name, *_dumps([args, kws]))
-    return _loads(*rv)
+    return _call(_server.call_s, _codec[-1], fn_name, args, kws, _lazy_results[-1])
 
 
-def callable(fn_or_name=None, require_user=None):
+def callable(fn_or_name=None, require_user=None, cache=None):
     if fn_or_name is None or isinstance(fn_or_name, str):
         _callable_decorator = _server.callable(fn_or_name, require_user=require_user)
         return lambda fn: _callable_decorator(
-            _wrap_callable(_register(fn, fn_or_name, require_user))
+            _wrap_callable(_register(fn, fn_or_name, require_user, cache))
         )
 
     return _server.callable(_wrap_callable(_register(fn_or_name)))
@@ -92,8 +294,64 @@ def callable(fn_or_name=None, require_user=None):
 
 def call_async(fn_name, *args, **kws):
     from .. import non_blocking
+    from ._batcher import _auto_batch, queue_call
 
     # non_blocking is client side only
     # we don't want this import to be top level if we're on the server
 
-    return non_blocking.call_async(call_s, fn_name, *args, **kws)
+    codec, lazy_results = _codec[-1], _lazy_results[-1]
+    key = _dedupe_key(fn_name, codec, lazy_results, args, kws)
+    if key is not None:
+        async_call = _in_flight.get(key)
+        if async_call is not None:
+            return async_call
+        finished = []
+
+        def done():
+            # the call can fail before it suspends, and so before it is in flight
+            finished.append(True)
+            _in_flight.pop(key, None)
+
+    else:
+        done = None
+
+    if _auto_batch["window"] is not None:
+        async_call = queue_call(codec, fn_name, args, kws, done, lazy_results)
+    else:
+        call_s = _partial(_call_done, done, _server.call_s, codec, lazy=lazy_results)
+        async_call = non_blocking.call_async(call_s, fn_name, args, kws)
+
+    if key is not None and not finished:
+        _in_flight[key] = async_call
+    return async_call
+
+
+def _call_done(done, *args, **kws):
+    try:
+        return _call(*args, **kws)
+    finally:
+        if done is not None:
+            done()
+
+
+def _dedupe_key(fn_name, codec, lazy_results, args, kws):
+    """Returns: the key for sharing an in flight call, or None if the call isn't shared"""
+    if fn_name not in _deduped:
+        return None
+    try:
+        return (fn_name, codec.name, lazy_results, make_key(args, kws))
+    except Uncacheable:
+        return None
+
+
+def set_dedupe(fn_name, dedupe=True):
+    """share one AsyncCall between identical kompot.call_async calls to fn_name while the first is in flight
+    calls are identical if they have the same args, codec and lazy setting
+    every caller gets the same result object, so don't change it in place
+    """
+    if dedupe:
+        _deduped.add(fn_name)
+    else:
+        _deduped.discard(fn_name)
+        for key in [key for key in _in_flight if key[0] == fn_name]:
+            del _in_flight[key]
@@ -3,8 +3,9 @@
 
 from anvil.server import SerializationError
 
-from ._builtins import registered_builtins
-from ._register import get_registered_cls, registered_types
+from ._builtins import Dict, registered_builtins
+from ._compile import decode_rows, get_decoder, get_encoder
+from ._register import decoders, encoders, register
 
 __version__ = "0.0.1"
 
@@ -12,94 +13,353 @@ VALUE = "_"
 PATHS = "P"
 TYPES = "T"
 UNHANDLED = "X"
+NAMES = "N"
+VERSION = "V"
 
+# version 1 - P is a list of full paths and T is a list of type names
+# version 2 - P is a list of [shared, *keys] paths relative to the previous path
+#             T is a run length encoded list of [index, count] pairs into the N names table
+#             lists of portable objects of the same class are sent as columns
+FORMAT_VERSION = 2
 
-def serialize_portable_class(obj, cls, path, paths, types, unhandled):
-    __serialize__ = getattr(obj, "__serialize__", None)
-    if __serialize__ is not None:
-        data = __serialize__(None)
-        rv = do_remap(data, path, paths, types, unhandled)
-    else:
-        # `do_remap(obj.__dict__, ....)` also works here
-        # which would give us a list of items - see Dict.__serialize__
-        # but since we don't care about this dict being ordered, and we know the keys are strings
-        # we can serialize it directly as a JSON object
-        rv = {}
-        for k, v in obj.__dict__.items():
-            path.append(k)
-            rv[k] = do_remap(v, path, paths, types, unhandled)
-            path.pop()
-
-    paths.append(path[:])
-    types.append(registered_types[cls])
-    return rv
-
-
-def serialize_builtin(obj, builtin, path, paths, types, unhandled):
-    cls = registered_builtins[builtin]
-    obj = cls(obj)
-    if type(obj) is builtin:
-        # floats and ints use this
-        return obj
-    return serialize_portable_class(obj, cls, path, paths, types, unhandled)
-
+# lists with fewer items than this are sent as one object per item
+COLUMNAR_MIN_ROWS = 4
+COLUMNS = "Columns"
+REF = "Ref"
+DICT = Dict.__name__
 
 NoneType = type(None)
+LEAF_TYPES = frozenset([NoneType, str, bool])
+# ints outside this range are sent as strings, see Long
+MAX_INT = 2147483647
+
+
+def get_columns(items, memo=None):
+    """if the items are all instances of the same registered class, with the same attributes
+    return a [type_name, fields, columns] list, otherwise None
+    with a memo, items that have been seen before, or that repeat, are not sent as columns
+    """
+    cls = type(items[0])
+    encoder = get_encoder(cls)
+    if encoder is None or encoder.serialize is not None:
+        return None
+    for item in items:
+        if type(item) is not cls:
+            return None
+    if memo is not None:
+        ids = set(map(id, items))
+        if len(ids) != len(items) or not ids.isdisjoint(memo):
+            return None
+
+    values = encoder.values
+    dict_len = encoder.dict_len
+    if dict_len is not None:
+        for item in items:
+            if len(item.__dict__) != dict_len:
+                values = None
+                break
+    columns = None
+    if values is not None:
+        fields = encoder.fields
+        try:
+            columns = [list(column) for column in zip(*map(values, items))]
+        except AttributeError:
+            if dict_len is None:
+                raise
+    if columns is None:
+        dicts = [item.__dict__ for item in items]
+        keys = dicts[0].keys()
+        for d in dicts:
+            if d.keys() != keys:
+                return None
+        fields = list(keys)
+        columns = [[d[field] for d in dicts] for field in fields]
+
+    if not fields:
+        return None
+    return [encoder.name, list(fields), columns]
+
+
+# a memo record is [value, target, pending, link]
+#   target  - what a back reference to the value is sent as, None until it is known
+#   pending - None or a list of (out, key) back references waiting for the target
+#   link    - the path to a list, only turned into a target if the list is referenced again
+
+
+def unlink(link):
+    """(((None, "_"), 0), "a") -> ["_", 0, "a"]"""
+    path = []
+    while link is not None:
+        link, key = link
+        path.append(key)
+    path.reverse()
+    return path
+
+
+def set_target(record, target):
+    record[1] = target
+    pending = record[2]
+    if pending is not None:
+        for out, key in pending:
+            out[key] = target
+
+
+def do_remap(obj, paths, types, unhandled, columnar=True, memo=None, info=None):
+    """remap an object to a JSONable object using an explicit stack
+
+    Each frame on the stack is (items, out, depth, finish, link)
+        items  - an iterator of (key, value) pairs to remap into out[key]
+        out    - the list or dict we are remapping into
+        depth  - the length of the path to out, i.e. each key is path[depth]
+        finish - None or (type_name, path_length, record, rows) for a portable object
+                 the path and type are recorded once all its children are done
+        link   - the path to out as linked (parent, key) pairs, used for back references
+
+    Portable objects are recorded in post-order - children before their parents
+    reconstruct relies on this order
+
+    Paths are recorded relative to the previous path as [shared, *keys]
+    shared is the length of the prefix in common with the previous path
+
+    With columnar=True a list of objects of the same class is remapped as a
+    [type_name, fields, columns] list and recorded with the Columns type
+
+    With a memo (a dict), an object that has already been seen is recorded with the Ref type
+    its value is a back reference to the first time the object was seen:
+        index       - the index of a portable object in the paths
+        [index, i]  - row i of the Columns at index
+        [VALUE,...] - the full path to a list
+
+    info is passed to each __serialize__ method, e.g. {"version": 2, "media_threshold": None}
+    """
+    path = []
+    # the shortest the path has been since the last path was recorded
+    low = 0
+    holder = {}
+    stack = [(iter([(VALUE, obj)]), holder, 0, None, None)]
+    rows = None
+
+    while stack:
+        items, out, depth, finish, link = stack[-1]
+
+        for key, value in items:
+            tp = type(value)
+            if tp in LEAF_TYPES:
+                out[key] = value
+                continue
+            # plain ints and finite floats are JSONable - x - x is nan for inf and nan
+            if tp is int:
+                if -MAX_INT <= value <= MAX_INT:
+                    out[key] = value
+                    continue
+            elif tp is float and value - value == 0.0:
+                out[key] = value
+                continue
+
+            del path[depth:]
+            path.append(key)
+            if depth < low:
+                low = depth
+
+            record = None
+            if memo is not None and tp is not int and tp is not float:
+                record = memo.get(id(value))
+                if record is not None:
+                    target = record[1]
+                    if target is None and record[3] is not None:
+                        target = record[1] = unlink(record[3])
+                    elif target is None:
+                        # a cycle - the target is known once the object is finished
+                        if record[2] is None:
+                            record[2] = []
+                        record[2].append((out, key))
+                    out[key] = target
+                    types.append(REF)
+                    paths.append([low] + path[low:])
+                    low = len(path)
+                    continue
+                record = memo[id(value)] = [value, None, None, None]
+
+            if tp is list:
+                columns = None
+                if columnar and len(value) >= COLUMNAR_MIN_ROWS:
+                    columns = get_columns(value, memo)
+                if columns is None:
+                    child = (link, key)
+                    if record is not None:
+                        record[3] = child
+                    rv = out[key] = [None] * len(value)
+                    stack.append((enumerate(value), rv, depth + 1, None, child))
+                else:
+                    if record is not None:
+                        rows = [[item, None, None, None] for item in value]
+                        memo.update(zip(map(id, value), rows))
+                    data = [(key, columns)]
+                    done = (COLUMNS, depth + 1, record, rows)
+                    stack.append((iter(data), out, depth, done, link))
+                break
+
+            if tp in registered_builtins:
+                cls = registered_builtins[tp]
+                value = cls(value)
+                if type(value) is tp:
+                    # floats and ints use this
+                    out[key] = value
+                    continue
+                tp = cls
+
+            encoder = encoders.get(tp) or get_encoder(tp)
+            if encoder is None:
+                # we don't know how to serialize - it could be a table row, media object, capability
+                # leave it alone and let anvil handle it
+                if record is not None:
+                    del memo[id(value)]
+                types.append(None)
+                paths.append([low] + path[low:])
+                low = len(path)
+                unhandled.append(value)
+                out[key] = None
+                continue
+
+            done = (encoder.name, depth + 1, record, None)
+            if encoder.serialize is not None:
+                data = encoder.serialize(value, info)
+                if type(data) is str:
+                    # nothing to remap (most builtins) - record it straight away
+                    out[key] = data
+                    paths.append([low] + path[low:])
+                    low = len(path)
+                    types.append(encoder.name)
+                    if record is not None:
+                        set_target(record, len(types) - 1)
+                    continue
+                # the remapped data takes the place of the object at the same path
+                data = [(key, data)]
+                stack.append((iter(data), out, depth, done, link))
+                break
+
+            rv = out[key] = {}
+            dict_len = encoder.dict_len
+            if encoder.items is None or (
+                dict_len is not None and len(value.__dict__) != dict_len
+            ):
+                # we know the keys are strings so we can remap the __dict__ directly as a JSON object
+                items = value.__dict__.items()
+            elif dict_len is None:
+                items = encoder.items(value)
+            else:
+                try:
+                    items = encoder.items(value)
+                except AttributeError:
+                    items = value.__dict__.items()
+            stack.append((iter(items), rv, depth + 1, done, (link, key)))
+            break
 
-
-def do_remap(obj, path, paths, types, unhandled):
-    tp = type(obj)
-
-    if tp in (NoneType, str, bool):
-        return obj
-
-    if tp is list:
-        rv = []
-        for i, o in enumerate(obj):
-            path.append(i)
-            rv.append(do_remap(o, path, paths, types, unhandled))
-            path.pop()
-        return rv
-
-    if tp in registered_builtins:
-        return serialize_builtin(obj, tp, path, paths, types, unhandled)
-
-    if tp in registered_types:
-        return serialize_portable_class(obj, tp, path, paths, types, unhandled)
-
-    # we don't know how to serialize - it could be a table row, media object, capability
-    # leave it alone and let anvil handle it
-    types.append(None)
-    paths.append(path[:])
-    unhandled.append(obj)
-    return None
+        else:
+            stack.pop()
+            if finish is not None:
+                tp_name, length, record, rows = finish
+                if length < low:
+                    low = length
+                paths.append([low] + path[low:length])
+                low = length
+                types.append(tp_name)
+                if record is not None:
+                    index = len(types) - 1
+                    set_target(record, index)
+                    if rows is not None:
+                        for i, row in enumerate(rows):
+                            set_target(row, [index, i])
+
+    return holder[VALUE]
+
+
+def expand_paths(paths):
+    """turn relative paths into full paths from the root"""
+    rv = []
+    path = []
+    for entry in paths:
+        del path[entry[0] :]
+        path.extend(entry[1:])
+        rv.append(path[:])
+    return rv
 
 
-def serialize(obj):
+def encode_types(types):
+    """intern the type names and run length encode the indexes"""
+    names = {}
+    runs = []
+    prev = count = None
+    for tp_name in types:
+        index = tp_name if tp_name is None else names.setdefault(tp_name, len(names))
+        if index == prev and count is not None:
+            count += 1
+            continue
+        if count is not None:
+            runs.append([prev, count])
+        prev, count = index, 1
+    if count is not None:
+        runs.append([prev, count])
+    return list(names), runs
+
+
+def decode_types(names, runs):
+    for index, count in runs:
+        tp_name = None if index is None else names[index]
+        for _ in range(count):
+            yield tp_name
+
+
+def serialize(obj, version=FORMAT_VERSION, media_threshold=None):
+    """version 1 is the original format, readable by older versions of kompot
+    it sends datetimes and bytes the way they did, and they can't read the newer builtins,
+    e.g. bytearray, memoryview and array
+
+    binary values at least media_threshold bytes long are sent as unhandled Media objects
+    """
     types = []
     unhandled = []
     paths = []
-    val = do_remap(obj, [VALUE], paths, types, unhandled)
-    return {VALUE: val, PATHS: paths, TYPES: types, UNHANDLED: unhandled}
+    info = {"version": version, "media_threshold": media_threshold}
+    if version == 1:
+        val = do_remap(obj, paths, types, unhandled, columnar=False, info=info)
+    else:
+        val = do_remap(obj, paths, types, unhandled, memo={}, info=info)
+    if version == 1:
+        return {
+            VALUE: val,
+            PATHS: expand_paths(paths),
+            TYPES: types,
+            UNHANDLED: unhandled,
+        }
+    names, types = encode_types(types)
+    return {
+        VERSION: version,
+        VALUE: val,
+        PATHS: paths,
+        NAMES: names,
+        TYPES: types,
+        UNHANDLED: unhandled,
+    }
 
 
 def reconstruct_portable_class(tp_name: str, data):
-    cls = get_registered_cls(tp_name)
-    new_deserialized = getattr(cls, "__new_deserialized__", None)
-    if new_deserialized is not None:
-        return new_deserialized(data, None)
-
-    obj = cls.__new__(cls)
-    deserialize = getattr(obj, "__deserialize__", None)
-    if deserialize is not None:
-        deserialize(data, None)
-    else:
-        obj.__dict__.update(data)
+    decode = decoders.get(tp_name) or get_decoder(tp_name)
+    return decode(data)
 
-    return obj
+
+class Columns:
+    """rebuilds the rows of a list that was sent as columns"""
+
+    @staticmethod
+    def __new_deserialized__(data, info):
+        return decode_rows(*data)
 
 
-def reconstruct(json_obj):
+register(Columns, name=COLUMNS)
+
+
+def reconstruct_v1(json_obj):
     paths, types = json_obj[PATHS], json_obj[TYPES]
     unhandled = iter(json_obj.get(UNHANDLED, []))
 
@@ -121,8 +381,165 @@ def reconstruct(json_obj):
     return json_obj[VALUE]
 
 
-def preserve(obj):
-    rv = serialize(obj)
+class Refs:
+    """resolves back references while reconstructing
+
+    a back reference to an object that has already been reconstructed is resolved immediately
+    a back reference to an ancestor (a cycle) is patched once everything has been reconstructed
+    """
+
+    def __init__(self, json_obj):
+        self.results = []  # the reconstructed value of each path
+        self.lists = {}  # path index -> the list a back reference refers to
+        self.pending = {}  # id(container) -> (container, [(key, target), ...])
+        self.fixups = []  # (obj, key, target, set_fn)
+
+        # lists are never replaced so we can find them before anything is reconstructed
+        path = []
+        types = decode_types(json_obj[NAMES], json_obj[TYPES])
+        for index, (entry, tp) in enumerate(zip(json_obj[PATHS], types)):
+            del path[entry[0] :]
+            path.extend(entry[1:])
+            if tp != REF:
+                continue
+            target = walk(json_obj, path)
+            if type(target) is list and target[0] == VALUE:
+                self.lists[index] = walk(json_obj, target)
+
+    def get(self, target):
+        if type(target) is int:
+            return self.results[target]
+        index, row = target
+        return self.results[index][row]
+
+    def resolve(self, data, key):
+        index = len(self.results)
+        if index in self.lists:
+            return self.lists[index]
+        target = data[key]
+        if (target if type(target) is int else target[0]) < index:
+            return self.get(target)
+        # a cycle - the target hasn't been reconstructed yet
+        self.pending.setdefault(id(data), (data, []))[1].append((key, target))
+        return None
+
+    def pop(self, container):
+        return self.pending.pop(id(container), (None, ()))[1]
+
+    def relink(self, tp_name, data, obj):
+        """data has been reconstructed as obj - move any pending back references onto obj"""
+        fixups = self.fixups
+        if tp_name == COLUMNS:
+            _, fields, columns = data
+            for field, column in zip(fields, columns):
+                for row, target in self.pop(column):
+                    fixups.append((obj[row], field, target, setattr))
+        elif tp_name == DICT:
+            for pair in data:
+                for key, target in self.pop(pair):
+                    if key != 1:
+                        raise SerializationError("Unable to restore a cyclic dict key")
+                    fixups.append((obj, pair[0], target, _setitem))
+        else:
+            pending = self.pop(data)
+            if pending and type(data) is not dict:
+                msg = f"Unable to restore a cyclic reference inside a {tp_name}"
+                raise SerializationError(msg)
+            for key, target in pending:
+                fixups.append((obj, key, target, setattr))
+
+    def finish(self):
+        get = self.get
+        # what's left are lists that we can patch in place
+        for container, pending in self.pending.values():
+            for key, target in pending:
+                container[key] = get(target)
+        for obj, key, target, set_fn in self.fixups:
+            set_fn(obj, key, get(target))
+
+
+def _setitem(obj, key, value):
+    obj[key] = value
+
+
+def walk(obj, path):
+    for key in path:
+        obj = obj[key]
+    return obj
+
+
+def reconstruct(json_obj, lazy=False):
+    """with lazy=True lists of portable objects are rebuilt as their items are accessed, see _lazy.py"""
+    version = json_obj.get(VERSION, 1)
+    if version == 1:
+        return reconstruct_v1(json_obj)
+    if version != FORMAT_VERSION:
+        raise SerializationError(f"Unknown kompot format version {version}")
+    if lazy and REF not in json_obj[NAMES]:
+        from ._lazy import reconstruct_lazy
+
+        return reconstruct_lazy(json_obj)
+
+    types = decode_types(json_obj[NAMES], json_obj[TYPES])
+    unhandled = iter(json_obj.get(UNHANDLED, []))
+    refs = Refs(json_obj) if REF in json_obj[NAMES] else None
+
+    # containers[i] is the container at path[:i]
+    # a relative path tells us how many of these we can reuse
+    # the reused containers are never replaced since children are reconstructed before their parents
+    path = []
+    containers = [json_obj]
+
+    for entry, tp in zip(json_obj[PATHS], types):
+        shared = entry[0]
+        if len(entry) == 1:
+            # the parent of the previous path - the containers are already known
+            del path[shared:]
+            del containers[shared:]
+            last = shared - 1
+            data = containers[last]
+        elif len(entry) == 2 and shared == len(path) - 1:
+            # a sibling of the previous path
+            path[shared] = entry[1]
+            last = shared
+            data = containers[last]
+        else:
+            del path[shared:]
+            path.extend(entry[1:])
+            last = len(path) - 1
+            del containers[min(shared, last) + 1 :]
+            data = containers[-1]
+            for i in range(len(containers) - 1, last):
+                data = data[path[i]]
+                containers.append(data)
+
+        key = path[last]
+        if tp is None:
+            data[key] = next(unhandled)
+        elif refs is None:
+            data[key] = reconstruct_portable_class(tp, data[key])
+        elif tp == REF:
+            data[key] = refs.resolve(data, key)
+        else:
+            json_data = data[key]
+            data[key] = reconstruct_portable_class(tp, json_data)
+            if refs.pending:
+                refs.relink(tp, json_data, data[key])
+
+        if refs is not None:
+            refs.results.append(data[key])
+
+    if refs is not None:
+        refs.finish()
+
+    return json_obj[VALUE]
+
+
+def preserve(obj, version=FORMAT_VERSION):
+    """like serialize, but raises SerializationError for unhandled objects
+    use version=1 for data that older versions of kompot need to read
+    """
+    rv = serialize(obj, version)
     unhandled = rv.pop(UNHANDLED)
 
     if unhandled:
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+
+import anvil.server
+from anvil import is_server_side
+
+from ._rpc import _registered, call_s, callable
+
+__version__ = "0.0.1"
+
+PRIVATE_NAME = "kompot.private.stream"
+
+# STREAMING
+# a kompot.callable that returns a generator can be streamed with kompot.stream
+# each value the generator yields is a chunk, sent in its own round trip
+# a chunk is only computed when the client asks for it, so the client learns that
+# the stream is done from a call that returns no chunk
+# the server keeps the open generators between calls, at most MAX_STREAMS of them
+# so streaming needs a persistent server - if the generator is missing,
+# e.g. the next call ran in a new server process, the stream fails
+
+MAX_STREAMS = 32
+
+_END = object()
+_streams = {}  # token -> _Stream, oldest first
+
+
+class _Stream:
+    def __init__(self, fn_name, chunks):
+        self.fn_name = fn_name
+        self.chunks = chunks
+        self.index = 0  # the index of the next chunk
+
+
+def _run(call_sig):
+    fn_name, args, kws = call_sig
+    try:
+        fn = _registered[fn_name]
+    except KeyError:
+        raise anvil.server.NoServerFunctionError(
+            f"No server function matching '{fn_name}' has been registered with kompot"
+        )
+    return fn(*args, **kws)
+
+
+def _new_token():
+    from uuid import uuid4
+
+    return uuid4().hex
+
+
+def _close(state):
+    close = getattr(state.chunks, "close", None)
+    if close is not None:
+        close()
+
+
+def next_chunk(call_sig, token=None, index=0):
+    """Returns: [token, chunks, done] - chunks is an empty list or a list with the next chunk"""
+    if token is None:
+        rv = _run(call_sig)
+        if not hasattr(rv, "__next__"):
+            # not a generator - the whole result is one chunk
+            return [None, [rv], True]
+        state = _Stream(call_sig[0], rv)
+        token = _new_token()
+    else:
+        state = _streams.pop(token, None)
+        if state is None or state.index != index or state.fn_name != call_sig[0]:
+            if state is not None:
+                _close(state)
+            raise RuntimeError(
+                f"The kompot stream of '{call_sig[0]}' has expired. "
+                "Streaming needs a persistent server, and at most "
+                f"{MAX_STREAMS} streams are kept open at a time"
+            )
+
+    chunk = next(state.chunks, _END)
+    if chunk is _END:
+        return [token, [], True]
+    state.index += 1
+    _streams[token] = state
+    while len(_streams) > MAX_STREAMS:
+        _close(_streams.pop(next(iter(_streams))))
+    return [token, [chunk], False]
+
+
+if is_server_side():
+    next_chunk = callable(PRIVATE_NAME)(next_chunk)
+
+
+class stream:
+    """Stream the chunks yielded by a kompot.callable generator
+
+    for chunk in kompot.stream("export_rows", year=2021):
+        ...
+    """
+
+    def __init__(self, fn_name, *args, **kws):
+        self._call_sig = [fn_name, args, kws]
+
+    def __iter__(self):
+        token = None
+        index = 0
+        done = False
+        while not done:
+            token, chunks, done = call_s(PRIVATE_NAME, self._call_sig, token, index)
+            for chunk in chunks:
+                index += 1
+                yield chunk
+
+    def on_chunk(self, chunk_handler):
+        """call chunk_handler with each chunk without blocking
+        Returns: an AsyncCall that resolves with the number of chunks once the stream is done
+        """
+        from .. import non_blocking
+
+        def consume():
+            n = 0
+            for chunk in self:
+                chunk_handler(chunk)
+                n += 1
+            return n
+
+        return non_blocking.call_async(consume)
@@ -8,16 +8,23 @@ is_server_side = anvil.is_server_side
 anvil.is_server_side = lambda: False  # so that atomic thinks we're client side
 
 from client_code.atomic import (
+    DictAtom,
     action,
+    apply_patches,
     atom,
     autorun,
     bind,
+    constants,
+    enable_incremental,
     ignore_updates,
     portable_atom,
     reaction,
     render,
+    scope,
     selector,
     subscribe,
+    sync,
+    syncing,
     unsubscribe,
     writeback,
 )
@@ -146,6 +153,68 @@ def test_bind():
     assert c1.value == c2.value == c3.value == count_atom.value == 5
 
 
+class FakeForm(FakeComponent):
+    def init_components(self, **properties):
+        pass
+
+
+class CountingComponent(FakeComponent):
+    def __init__(self, parent):
+        self.parent = parent
+        self.sets = 0
+        super().__init__()
+        self.sets = 0
+
+    def __setattr__(self, name, value):
+        if name == "value":
+            object.__setattr__(self, "sets", self.sets + 1)
+        object.__setattr__(self, name, value)
+
+
+def test_shared_bindings():
+    count_atom = CountAtom()
+    other_atom = CountAtom()
+    form = FakeForm()
+    components = [CountingComponent(form) for _ in range(10)]
+    for c in components[:-1]:
+        bind(c, "value", count_atom, "value")
+    bind(components[-1], "value", other_atom.get_count)
+
+    # a single subscriber for all the bindings of the form
+    registrar = count_atom.__atom_registrar__
+    assert len(registrar.to_update["render"]["value"]) == 1
+    assert all(c.sets == 1 for c in components)
+
+    count_atom.value = 5
+    assert [c.value for c in components] == [5] * 9 + [0]
+    assert [c.sets for c in components] == [2] * 9 + [1]
+
+    # only the binding that depends on the other atom is re-evaluated
+    other_atom.value = 2
+    assert [c.sets for c in components] == [2] * 9 + [2]
+
+    # no-op property sets are skipped
+    count_atom.value = 6
+    count_atom.value = 5
+    assert [c.sets for c in components] == [4] * 9 + [2]
+
+    @action
+    def no_change():
+        count_atom.value = 7
+        count_atom.value = 5
+
+    no_change()
+    assert [c.sets for c in components] == [4] * 9 + [2]
+
+    # re-binding a component property replaces the binding
+    bind(components[0], "value", other_atom, "value")
+    assert components[0].value == 2
+    count_atom.value = 1
+    assert components[0].value == 2
+    other_atom.value = 3
+    assert components[0].value == components[-1].value == 3
+
+
 subscribe_db = {"todos": []}
 autorun_db = {}
 
@@ -357,3 +426,216 @@ def test_bugs():
     # bug #50
     s = SubCount()
     assert len(s.__dict__) == 1
+
+
+@atom
+class Profile:
+    def __init__(self):
+        self.name = "a"
+        self.tags = []
+        self.age = 1
+
+    @action
+    def update(self, name, age):
+        self.name = name
+        self.age = age
+        self.name = name.upper()
+
+
+def test_sync(monkeypatch):
+    sent = []
+    monkeypatch.setattr(syncing, "_send", sent.append)
+
+    profile = Profile()
+    settings = DictAtom(theme="dark")
+    dispose_profile = sync(profile, "profile")
+    dispose_settings = sync(settings, "settings")
+
+    # one patch per atom per render cycle with the final values
+    profile.update("bob", 42)
+    assert sent.pop() == [["profile", {"name": "BOB", "age": 42}, []]]
+
+    profile.tags.append("x")
+    assert sent.pop() == [["profile", {"tags": ["x"]}, []]]
+    assert type(profile.tags) is not list
+
+    @action
+    def update_both():
+        profile.age = 43
+        settings["theme"] = "light"
+        del settings["theme"]
+        del profile.name
+
+    update_both()
+    assert sent.pop() == [
+        ["profile", {"age": 43}, ["name"]],
+        ["settings", {}, ["theme"]],
+    ]
+
+    # patches from the server are applied but not echoed back
+    apply_patches([["profile", {"name": "alice"}, []], ["unknown", {"x": 1}, []]])
+    assert profile.name == "alice"
+    assert not sent
+
+    # even inside an action that changes other props
+    @action
+    def apply_and_update():
+        apply_patches([["profile", {"name": "carol"}, []]])
+        profile.age = 50
+
+    apply_and_update()
+    assert profile.name == "carol"
+    assert sent.pop() == [["profile", {"age": 50}, []]]
+
+    # changes to nested dicts are sent as the whole top level prop
+    profile.prefs = {"colors": {"bg": "white"}, "tags": []}
+    assert sent.pop() == [["profile", {"prefs": profile.prefs}, []]]
+    profile.prefs["colors"]["bg"] = "black"
+    assert sent.pop() == [
+        ["profile", {"prefs": {"colors": {"bg": "black"}, "tags": []}}, []]
+    ]
+    profile.prefs["tags"].append("x")
+    assert sent.pop()[0][1]["prefs"]["tags"] == ["x"]
+    old = profile.prefs
+    profile.prefs = {}
+    sent.clear()
+    old["colors"]["bg"] = "red"
+    assert not sent
+
+    nested = DictAtom(inner={"x": 1})
+    dispose_nested = sync(nested, "nested")
+    nested["inner"]["x"] = 2
+    assert sent.pop() == [["nested", {"inner": {"x": 2}}, []]]
+    apply_patches([["nested", {"inner": {"x": 3}}, []]])
+    assert not sent
+    nested["inner"]["x"] = 4
+    assert sent.pop() == [["nested", {"inner": {"x": 4}}, []]]
+
+    # the client pulls changes made on the server
+    syncing.pull()
+    assert sent.pop() == [["profile", {}, []], ["settings", {}, []], ["nested", {}, []]]
+    syncing.pull("settings")
+    assert sent.pop() == [["settings", {}, []]]
+
+    dispose_profile()
+    dispose_settings()
+    dispose_nested()
+    profile.age = 44
+    nested["inner"]["x"] = 5
+    assert not sent
+    assert not syncing._owners and not syncing._owned
+
+
+def test_sync_scopes(monkeypatch):
+    sent = []
+    monkeypatch.setattr(syncing, "_send", sent.append)
+
+    profile = Profile()
+    settings = DictAtom(theme="dark")
+    child = scope()
+    with child:
+        dispose_profile = sync(profile, "profile")
+        profile.age = 2
+        assert sent.pop() == [["profile", {"age": 2}, []]]
+
+    # changes in the root scope are sent when the first atom was synced in a child scope
+    profile.age = 3
+    assert sent.pop() == [["profile", {"age": 3}, []]]
+
+    # disposing the child scope doesn't stop syncing
+    dispose_settings = sync(settings, "settings")
+    child.dispose()
+    profile.age = 4
+    settings["theme"] = "light"
+    assert sent == [
+        [["profile", {"age": 4}, []]],
+        [["settings", {"theme": "light"}, []]],
+    ]
+    sent.clear()
+
+    # atoms can be disposed outside the scope they were synced in
+    dispose_profile()
+    with scope():
+        dispose_settings()
+    profile.age = 5
+    settings["theme"] = "dark"
+    assert not sent and not syncing._synced
+    assert syncing._sync_subscriber not in syncing.root.active[constants.SUBSCRIBE]
+
+
+def test_sync_handler(monkeypatch):
+    monkeypatch.setattr(syncing, "_handlers", {})
+    todos = {"done": 0}
+
+    @syncing.sync_handler("todos")
+    def update_todos(changed, deleted):
+        todos.update(changed)
+        return {"done": todos["done"]}
+
+    todos["done"] = 3  # changed on the server
+    assert syncing._receive([["todos", {}, []]]) == [["todos", {"done": 3}, []]]
+    assert syncing._receive([["todos", {"done": 4}, []]]) == [
+        ["todos", {"done": 4}, []]
+    ]
+    with pytest.raises(LookupError):
+        syncing._receive([["unknown", {}, []]])
+
+
+def test_incremental(monkeypatch):
+    monkeypatch.setattr(constants, "IS_SERVER_SIDE", True)
+    monkeypatch.setattr(constants.is_inert, "incremental", False)
+
+    class Plain:
+        pass
+
+    assert atom(Plain) is Plain
+    assert action(test_incremental) is test_incremental
+
+    enable_incremental()
+    count_atom = atom(CountAtom.__base__)()
+    renders = []
+    autorun(lambda: renders.append(count_atom.value))
+    count_atom.value = 1
+    assert renders == [0, 1]
+
+
+def test_scopes():
+    shared, a_atom, b_atom = CountAtom(), CountAtom(), CountAtom()
+    a_renders, b_renders = [], []
+    a_actions, root_actions = [], []
+
+    a_scope, b_scope = scope(), scope()
+    with a_scope:
+        autorun(lambda: a_renders.append((a_atom.value, shared.get_count())))
+        subscribe(a_actions.extend)
+    with b_scope:
+        autorun(lambda: b_renders.append((b_atom.value, shared.get_count())))
+    subscribe(root_actions.extend)
+
+    # an update in one scope doesn't flush the other
+    with a_scope:
+        a_atom.value = 1
+    assert a_renders == [(0, 0), (1, 0)]
+    assert b_renders == [(0, 0)]
+    assert len(a_actions) == len(root_actions) == 1
+
+    # a shared atom updates subscribers in both scopes
+    shared.value = 2
+    assert a_renders[-1] == (1, 2)
+    assert b_renders[-1] == (0, 2)
+    assert len(a_actions) == 1
+    assert len(root_actions) == 2
+
+    # a disposed scope stops updating
+    b_scope.dispose()
+    shared.value = 3
+    b_atom.value = 3
+    assert a_renders[-1] == (1, 3)
+    assert b_renders[-1] == (0, 2)
+
+    a_scope.dispose()
+    shared.value = 4
+    assert a_renders[-1] == (1, 3)
+    assert len(a_actions) == 1
+    assert shared.get_count() == 4
+    unsubscribe(root_actions.extend)
@@ -0,0 +1,1121 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 anvilistas
+import json
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import anvil.server
+
+import pytest
+
+from client_code import kompot
+from client_code.dataklasses import portable_dataklass
+from client_code.kompot import (
+    _batcher,
+    _builtins,
+    _cache,
+    _codecs,
+    _compress,
+    _lazy,
+    _metrics,
+    _register,
+    _rpc,
+    _stream,
+)
+from client_code.kompot._serialize import NAMES, PATHS, TYPES, UNHANDLED, VERSION
+
+__version__ = "0.0.1"
+
+
+@kompot.register
+@anvil.server.portable_class
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return type(other) is Point and self.__dict__ == other.__dict__
+
+
+class Unknown:
+    pass
+
+
+def round_trip(obj, lazy=False):
+    serialized = kompot.serialize(obj)
+    unhandled = serialized.pop(UNHANDLED)
+    serialized = json.loads(json.dumps(serialized))
+    serialized[UNHANDLED] = unhandled
+    return kompot.reconstruct(serialized, lazy=lazy)
+
+
+def test_round_trip():
+    when = datetime(2021, 1, 2, 3, 4, 5, tzinfo=anvil.tz.tzoffset(hours=1))
+    obj = {
+        1: (2, 3),
+        "a": [{1, 2}, frozenset(["x"]), when, date(2021, 1, 2), b"ab"],
+        "b": [2**40, float("inf"), 1.5, None, True, "s"],
+        "c": Point(Point(1, 2), [Point(3, (4,))]),
+        "d": Point,
+    }
+    assert round_trip(obj) == obj
+
+
+def test_wire_format():
+    obj = {1: (2, 3), "a": [{1}, 2**40]}
+    serialized = kompot.serialize(obj, version=1)
+    assert serialized[PATHS] == [
+        ["_", 0, 1],
+        ["_", 1, 1, 0],
+        ["_", 1, 1, 1],
+        ["_"],
+    ]
+    assert serialized[TYPES] == ["Tuple", "Set", "Long", "Dict"]
+    assert kompot.reconstruct(serialized) == obj
+
+    serialized = kompot.serialize(obj)
+    assert serialized[VERSION] == 2
+    assert serialized[PATHS] == [[0, "_", 0, 1], [1, 1, 1, 0], [3, 1], [1]]
+    assert serialized[NAMES] == ["Tuple", "Set", "Long", "Dict"]
+    assert serialized[TYPES] == [[0, 1], [1, 1], [2, 1], [3, 1]]
+    assert kompot.reconstruct(serialized) == obj
+
+
+def test_compact_types():
+    points = [Point(i, i) for i in range(100)] + [Unknown(), Unknown()]
+    serialized = kompot.serialize(points)
+    assert serialized[NAMES] == [Point.__module__ + ".Point"]
+    assert serialized[TYPES] == [[0, 100], [None, 2]]
+    assert serialized[PATHS][:2] == [[0, "_", 0], [1, 1]]
+    assert kompot.reconstruct(serialized)[:100] == points[:100]
+
+
+def test_unhandled():
+    unknown = Unknown()
+    serialized = kompot.serialize([1, [2, unknown]])
+    assert serialized[UNHANDLED] == [unknown]
+    assert serialized[PATHS] == [[0, "_", 1, 1]]
+    assert serialized[TYPES] == [[None, 1]]
+    assert kompot.reconstruct(serialized)[1][1] is unknown
+
+    with pytest.raises(anvil.server.SerializationError):
+        kompot.preserve(unknown)
+
+
+def test_preserve_version():
+    obj = {"a": [Point(1, 2)], 1: (2, 3)}
+    assert kompot.preserve(obj)[VERSION] == 2
+    preserved = kompot.preserve(obj, version=1)
+    # version 1 has a type name for each path
+    assert VERSION not in preserved and NAMES not in preserved
+    assert Point.__module__ + ".Point" in preserved[TYPES]
+    assert kompot.reconstruct(json.loads(json.dumps(preserved))) == obj
+
+
+def test_deep_nesting():
+    depth = sys.getrecursionlimit() * 10
+    nested = [1]
+    for _ in range(depth):
+        nested = (Point(nested, None),)
+
+    rv = kompot.reconstruct(kompot.serialize(nested))
+    for _ in range(depth):
+        assert type(rv) is tuple
+        rv = rv[0].x
+    assert rv == [1]
+
+
+@kompot.register
+@anvil.server.portable_class
+class Custom:
+    def __init__(self, value):
+        self.value = value
+
+    def __deserialize__(self, data, info):
+        self.__dict__.update(data)
+        self.deserialized = True
+
+
+def test_columnar():
+    points = [Point(i, (i,)) for i in range(10)]
+    serialized = kompot.serialize(points)
+    name, fields, columns = serialized["_"]
+    assert name == Point.__module__ + ".Point"
+    assert fields == ["x", "y"]
+    assert columns == [list(range(10)), [[i] for i in range(10)]]
+    assert serialized[NAMES] == ["Tuple", "Columns"]
+    assert round_trip(points) == points
+
+    customs = round_trip([Custom(i) for i in range(10)])
+    assert [c.value for c in customs] == list(range(10))
+    assert all(c.deserialized for c in customs)
+
+    # mixed classes and attributes are sent one object at a time
+    mixed = points[:5] + [Custom(1)]
+    assert type(kompot.serialize(mixed)["_"][0]) is dict
+    points[0].z = 1
+    assert type(kompot.serialize(points)["_"][0]) is dict
+    assert round_trip(points) == points
+
+
+@kompot.register
+@anvil.server.portable_class
+class Slotted:
+    __slots__ = ("x", "__y")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.__y = y
+
+    def __eq__(self, other):
+        return type(other) is Slotted and (self.x, self.__y) == (other.x, other.__y)
+
+
+@kompot.register
+@portable_dataklass
+class Klass:
+    a: int
+    b: tuple
+
+
+@kompot.register(fields=["a"])
+@anvil.server.portable_class
+class Schema:
+    def __init__(self, a):
+        self.a = a
+        self.cache = "not sent"
+
+
+@kompot.register
+@anvil.server.portable_class
+@dataclass
+class DataClass:
+    a: int
+    b: int = field(init=False, default=0)
+
+
+@kompot.register
+@anvil.server.portable_class
+class Matched:
+    __match_args__ = ("x",)
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def test_compiled_classes():
+    assert kompot.serialize(Slotted(1, 2))["_"] == {"x": 1, "_Slotted__y": 2}
+    assert kompot.serialize(Klass(1, (2,)))["_"] == {"a": 1, "b": [2]}
+    assert kompot.serialize(Schema(1))["_"] == {"a": 1}
+
+    objs = [Slotted(1, (2,)), Klass(3, (4,)), Schema(5)]
+    assert round_trip(objs)[:2] == objs[:2]
+    assert round_trip(objs)[2].__dict__ == {"a": 5}
+
+    for cls in (Slotted, Klass):
+        rows = [cls(i, (i,)) for i in range(10)]
+        serialized = kompot.serialize(rows)
+        assert serialized["_"][0] == kompot._register.registered_types[cls]
+        assert round_trip(rows) == rows
+
+    with pytest.raises(ValueError):
+        kompot.register(Schema, fields=["not a field"])
+    with pytest.raises(ValueError):
+        kompot.register(Schema, fields=["class"])
+
+    # __match_args__ is only used for dataklasses
+    obj = DataClass(1)
+    obj.b = 2
+    assert round_trip(obj) == obj
+    assert round_trip(Matched(1, 2)).__dict__ == {"x": 1, "y": 2}
+
+    # a dataklass with attributes that aren't fields is sent with its __dict__
+    obj = Klass(1, (2,))
+    obj.extra = 3
+    assert round_trip(obj).__dict__ == {"a": 1, "b": (2,), "extra": 3}
+    rows = [Klass(i, (i,)) for i in range(10)]
+    rows[5].extra = 5
+    assert round_trip(rows)[5].extra == 5 and round_trip(rows) == rows
+    for row in rows:
+        row.extra = 1
+    serialized = kompot.serialize(rows)
+    assert serialized["_"][1] == ["a", "b", "extra"]
+    assert [row.extra for row in round_trip(rows)] == [1] * 10
+    del rows[0].a
+    assert round_trip(rows)[0].__dict__ == {"b": (0,), "extra": 1}
+
+
+def test_shared_references():
+    parent = Point(0, 0)
+    shared = [1, 2]
+    children = [Point(parent, shared) for _ in range(5)]
+    rv = round_trip([parent, children, shared, {"a": shared}])
+    parent, children, shared, d = rv
+    assert all(child.x is parent for child in children)
+    assert all(child.y is shared for child in children)
+    assert d["a"] is shared
+
+    # a repeated row is not sent as columns
+    rows = [parent] * 5
+    serialized = kompot.serialize(rows)
+    assert serialized[NAMES] == [Point.__module__ + ".Point", "Ref"]
+    rv = kompot.reconstruct(serialized)
+    assert all(row is rv[0] for row in rv)
+
+    # rows sent as columns keep their identity
+    rv = round_trip([children, children[2]])
+    assert rv[1] is rv[0][2]
+
+
+@kompot.register
+@anvil.server.portable_class
+class Box:
+    def __init__(self, item):
+        self.item = item
+
+    def __serialize__(self, info):
+        return [self.item]
+
+    @classmethod
+    def __new_deserialized__(cls, data, info):
+        return cls(data[0])
+
+
+def test_cycles():
+    node = Point(None, [])
+    node.x = node
+    node.y.append(Point(node, None))
+    node.y.append(node.y)
+    rv = round_trip(node)
+    assert rv.x is rv
+    assert rv.y[0].x is rv
+    assert rv.y[1] is rv.y
+
+    d = {}
+    d["self"] = d
+    rv = round_trip([d])[0]
+    assert rv["self"] is rv
+
+    # children sent as columns refer back to their parent
+    parent = Point([], None)
+    parent.x.extend(Point(parent, i) for i in range(10))
+    rv = round_trip(parent)
+    assert all(child.x is rv for child in rv.x)
+
+    t = ([],)
+    t[0].append(t)
+    rv = round_trip(t)
+    assert rv[0][0] is rv
+
+    box = Box(None)
+    box.item = box
+    with pytest.raises(anvil.server.SerializationError):
+        round_trip(box)
+
+
+def test_binary_codec(monkeypatch):
+    values = [None, True, 0, -1, 200, -200, 2**40, -(2**40), 0.1, -0.0, 5e-324]
+    values += ["", "é" * 40, b"\x00\xff", list(range(40)), {"a": {"b": []}}]
+    assert _codecs.unpackb(_codecs.packb(values)) == values
+
+    # without struct
+    monkeypatch.setattr(_codecs, "_pack", None)
+    monkeypatch.setattr(_codecs, "_unpack", None)
+    floats = [0.1, -2.5e-310, 1.7976931348623157e308, -0.0]
+    assert _codecs.unpackb(_codecs.packb(floats)) == floats
+
+
+def test_rpc_codecs(monkeypatch):
+    def echo(*args, **kws):
+        return [args, kws]
+
+    payloads = []
+
+    def server_call(fn_name, payload, unhandled, *codec_name):
+        payloads.append(payload)
+        return _rpc._wrap_callable(echo)(payload, unhandled, *codec_name)
+
+    monkeypatch.setattr(_rpc._server, "call", server_call)
+    args = (1, 2.5, "s", Point(1, (2,)), Unknown())
+    expected = [args, {"a": {1: None}}]
+
+    assert kompot.call("echo", *args, a={1: None}) == expected
+    assert type(payloads[-1]) is str
+    with kompot.codec("binary"):
+        assert kompot.call("echo", *args, a={1: None}) == expected
+    assert isinstance(payloads[-1], anvil.Media)
+    assert kompot.call("echo") == [(), {}]
+    assert type(payloads[-1]) is str
+
+    with pytest.raises(ValueError):
+        kompot.codec("unknown")
+
+
+def test_binary_values():
+    data = bytes(range(256))
+    obj = {
+        "bytes": data,
+        "bytearray": bytearray(b"kompot"),
+        "view": memoryview(array("h", [1, -2, 3, -4])).cast("B").cast("h", [2, 2]),
+        "array": array("d", [0.5, -1.5]),
+        "same": [data, data],
+    }
+    assert kompot.serialize(b"kompot")["_"] == "a29tcG90"
+
+    rv = round_trip(obj)
+    assert rv["bytes"] == data and rv["same"][0] is rv["same"][1] is rv["bytes"]
+    assert type(rv["bytearray"]) is bytearray and rv["bytearray"] == b"kompot"
+    assert rv["view"].format == "h" and rv["view"].tolist() == [[1, -2], [3, -4]]
+    assert rv["array"] == obj["array"]
+
+    # older versions of kompot sent bytes as a list of ints
+    old = {"_": [1, 2], PATHS: [["_"]], TYPES: ["Bytes"], UNHANDLED: []}
+    assert kompot.reconstruct(old) == b"\x01\x02"
+
+
+def test_binary_media():
+    obj = [b"small", bytes(100), array("i", range(100))]
+    serialized = kompot.serialize(obj, media_threshold=100)
+    media = serialized[UNHANDLED]
+    assert len(media) == 2 and all(isinstance(m, anvil.Media) for m in media)
+    assert kompot.reconstruct(serialized) == obj
+
+    # preserve never uses media
+    assert kompot.reconstruct(kompot.preserve(bytes(100))) == bytes(100)
+
+
+@pytest.fixture
+def rpc_settings():
+    yield
+    kompot.set_compress(False)
+    kompot.set_media_threshold()
+
+
+def test_rpc_media_threshold(rpc_settings):
+    assert _rpc._dumps([bytes(100)])[1] == []
+    kompot.set_media_threshold(100)
+    assert len(_rpc._dumps([bytes(100), bytes(99)])[1]) == 1
+    kompot.set_media_threshold(None)
+    assert _rpc._dumps([bytes(1 << 16)])[1] == []
+
+
+def test_base64_fallback(monkeypatch):
+    import base64
+
+    monkeypatch.setattr(_builtins, "b64encode", None)
+    monkeypatch.setattr(_builtins, "b64decode", None)
+    for n in range(8):
+        data = bytes(range(255, 255 - n, -1))
+        encoded = base64.b64encode(data).decode("ascii")
+        assert _builtins._encode_base64(data) == encoded
+        assert _builtins._decode_base64(encoded) == data
+
+
+def test_numeric_leaves():
+    values = [0, -(2**31) + 1, 2**31 - 1, 2**31, -(2**40), 0.5, -0.0]
+    values += [float("inf"), float("-inf")]
+    serialized = kompot.serialize(values)
+    assert serialized["_"][:3] == values[:3] and serialized["_"][5:7] == values[5:7]
+    assert round_trip(values) == values
+    nan = round_trip(float("nan"))
+    assert nan != nan
+
+
+def test_datetimes():
+    tz = anvil.tz.tzoffset(hours=-3.5)
+    when = datetime(2021, 1, 2, 3, 4, 5, 60, tzinfo=tz)
+    assert kompot.serialize(when)["_"] == "1609569245.000060-210"
+    assert kompot.serialize(when.replace(microsecond=0))["_"] == "1609569245-210"
+
+    values = [when, datetime(1960, 1, 1, 0, 0, 0, 500000, tzinfo=anvil.tz.UTC)]
+    values += [datetime(2021, 6, 1, 12), datetime(2100, 1, 1, tzinfo=tz)]
+    rv = round_trip(values)
+    assert rv[0] == when and rv[0].utcoffset() == when.utcoffset()
+    assert rv[1] == values[1]
+    assert rv[2].utcoffset() is not None and rv[2].replace(tzinfo=None) == values[2]
+    assert rv[3] == values[3]
+
+    # older versions of kompot sent strftime strings
+    old = {"_": "2021-01-02 03:04:05.000060-0330", PATHS: [["_"]], TYPES: ["DateTime"]}
+    assert kompot.reconstruct(old) == when
+
+
+def test_version_1_builtins():
+    """version 1 output can be read by the decoders of older versions of kompot"""
+
+    def old_datetime(iso):
+        sign = iso[-5]
+        offset = 0
+        if sign in ("+", "-"):
+            offset = int(iso[-5:-2]) * 60 + int(sign + iso[-2:])
+            iso = iso[:-5]
+        tzinfo = anvil.tz.tzoffset(minutes=offset)
+        return datetime.fromisoformat(iso).replace(tzinfo=tzinfo)
+
+    when = datetime(2021, 1, 2, 3, 4, 5, 60, tzinfo=anvil.tz.tzoffset(hours=-3.5))
+    naive = datetime(2021, 6, 1, 12)
+    obj = [when, naive, b"ab", bytes(200)]
+    for serialized in (
+        kompot.serialize(obj, version=1, media_threshold=100),
+        kompot.preserve(obj, version=1),
+    ):
+        assert serialized[TYPES] == ["DateTime", "DateTime", "Bytes", "Bytes"]
+        assert not serialized.get(UNHANDLED)
+        value = json.loads(json.dumps(serialized["_"]))
+        assert value[0] == "2021-01-02 03:04:05.000060-0330"
+        assert old_datetime(value[0]) == when
+        assert old_datetime(value[1]).replace(tzinfo=None) == naive
+        assert bytes(value[2]) == b"ab" and bytes(value[3]) == bytes(200)
+        rv = kompot.reconstruct(serialized)
+        assert rv[0] == when and rv[1].replace(tzinfo=None) == naive
+        assert rv[2:] == [b"ab", bytes(200)]
+
+
+class User:
+    def __init__(self, id):
+        self.id = id
+
+    def get_id(self):
+        return self.id
+
+
+def test_callable_cache(monkeypatch):
+    calls = []
+
+    @kompot.callable("test_lookup", cache=kompot.Cache(maxsize=2, ttl=60))
+    def lookup(*args, **kws):
+        calls.append(args)
+        return len(calls)
+
+    call = _rpc._registered["test_lookup"]
+    cache = kompot.get_cache("test_lookup")
+    assert [call(1), call(1), call(x=1), call(1)] == [1, 1, 2, 1]
+    # least recently used
+    assert [call(2), call(1), call(x=1)] == [3, 1, 4]
+    assert cache.stats() == {"hits": 3, "misses": 4, "evictions": 2, "size": 2}
+
+    cache.invalidate(1)
+    assert call(1) == 5
+    now = _cache.time()
+    monkeypatch.setattr(_cache, "time", lambda: now + 61)
+    assert call(1) == 6
+    # rows are keyed on their id, other unhandled objects aren't cached
+    assert [call(User(1)), call(User(1)), call(User(2))] == [7, 7, 8]
+    assert [call(Unknown()), call(Unknown())] == [9, 10]
+    cache.clear()
+    assert cache.stats()["size"] == 0
+
+    with pytest.raises(ValueError):
+        kompot.get_cache("unknown")
+
+    # parallel batches use a cache from several threads
+    cache = kompot.Cache(maxsize=8)
+
+    def hammer(n):
+        for i in range(2000):
+            key = (i % 20, n)
+            if not cache.get(key)[0]:
+                cache.set(key, i)
+            if i % 100 == 0:
+                cache.invalidate(i)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8000 and stats["size"] <= 8
+
+
+def test_batch_user_lookups(server_calls, monkeypatch):
+    import anvil.users
+
+    lookups, checks = [], []
+    user = User("a")
+
+    def get_user():
+        # the worker threads of a parallel batch don't have the call context
+        assert threading.current_thread() is threading.main_thread()
+        lookups.append(1)
+        return user
+
+    def is_admin(u):
+        checks.append(u)
+        return u.id == "a"
+
+    monkeypatch.setattr(anvil.users, "get_user", get_user)
+
+    @kompot.callable("test_admin_only", require_user=is_admin)
+    def admin_only(x):
+        return x
+
+    @kompot.callable("test_logged_in", require_user=True, cache=True)
+    def logged_in(x):
+        return x
+
+    for parallel in (False, True):
+        lookups.clear()
+        checks.clear()
+        with kompot.batch_call(silent=True, parallel=parallel) as c:
+            for i in range(10):
+                c.call("test_admin_only", i)
+                c.call("test_logged_in", i)
+        assert c.result == [i for i in range(10) for _ in range(2)]
+        assert checks == [user]
+
+    # a new request checks the permission again
+    user = User("b")
+    with pytest.raises(anvil.server.PermissionDenied):
+        kompot.call_s("test_admin_only", 1)
+    assert checks == [checks[0], user]
+
+    # anvil's exceptions are rebuilt as themselves
+    with kompot.batch_call(silent=True, parallel=True) as c:
+        c.call("test_admin_only", 1)
+        c.call("test_logged_in", 1)
+    assert type(c.errors[0]) is anvil.server.PermissionDenied and c.result[1] == 1
+
+    # the user is looked up for each call, so logging out stops the later calls
+    @kompot.callable("test_logout")
+    def logout():
+        nonlocal user
+        user = None
+
+    user = User("a")
+    with pytest.raises(anvil.users.AuthenticationFailed):
+        with kompot.batch_call(silent=True) as c:
+            c.call("test_admin_only", 1)
+            c.call("test_logout")
+            c.call("test_admin_only", 2)
+
+
+def test_callable_cache_per_user(monkeypatch):
+    import anvil.users
+
+    user = User("a")
+    monkeypatch.setattr(anvil.users, "get_user", lambda: user)
+
+    @kompot.callable("test_user_lookup", require_user=True, cache=True)
+    def lookup():
+        return user.id
+
+    call = _rpc._registered["test_user_lookup"]
+    assert call() == "a"
+    user = User("b")
+    assert call() == "b"
+    assert kompot.get_cache("test_user_lookup").stats()["misses"] == 2
+    user = User("a")
+    assert call() == "a"
+    kompot.get_cache("test_user_lookup").invalidate()
+    assert kompot.get_cache("test_user_lookup").stats()["size"] == 0
+
+
+class FakeAsyncCall:
+    """runs the function the first time the result is awaited"""
+
+    def __init__(self, fn, *args):
+        self.fn = lambda: fn(*args)
+        self.done = False
+
+    def await_result(self):
+        if not self.done:
+            self.value, self.done = self.fn(), True
+        return self.value
+
+
+@pytest.fixture
+def server_calls(monkeypatch):
+    import client_code
+
+    calls = []
+
+    def call_s(fn_name, payload, unhandled, *codec_name):
+        calls.append(fn_name)
+        fn = _rpc._wrap_callable(_rpc._registered[fn_name])
+        return fn(payload, unhandled, *codec_name)
+
+    fake = type(sys)("non_blocking")
+    fake.call_async = FakeAsyncCall
+    monkeypatch.setitem(sys.modules, "client_code.non_blocking", fake)
+    monkeypatch.setattr(client_code, "non_blocking", fake, raising=False)
+    monkeypatch.setattr(anvil.server, "call_s", call_s, raising=False)
+    return calls
+
+
+def test_auto_batch(server_calls):
+    @kompot.callable("test_double")
+    def double(x):
+        return Point(x, 2 * x)
+
+    kompot.set_auto_batch(0)
+    try:
+        calls = [kompot.call_async("test_double", i) for i in range(3)]
+        assert [c.await_result() for c in calls] == [Point(i, 2 * i) for i in range(3)]
+        assert server_calls == [_batcher.PRIVATE_NAME]
+        # a batch of one is sent as a normal call
+        assert kompot.call_async("test_double", 5).await_result() == Point(5, 10)
+        assert server_calls[-1] == "test_double"
+    finally:
+        kompot.set_auto_batch(None)
+
+    kompot.call_async("test_double", 1).await_result()
+    assert server_calls[-1] == "test_double"
+
+
+def test_auto_batch_lazy(server_calls, monkeypatch):
+    @kompot.callable("test_rows")
+    def get_rows(n):
+        return [Counted(i) for i in range(n)]
+
+    monkeypatch.setattr(Counted, "built", 0)
+    kompot.set_auto_batch(0)
+    try:
+        with kompot.lazy():
+            lazy_calls = [kompot.call_async("test_rows", n) for n in (10, 20)]
+        eager_call = kompot.call_async("test_rows", 5)
+        rows = [c.await_result() for c in lazy_calls]
+        assert all(isinstance(r, _lazy.LazyRows) for r in rows)
+        assert Counted.built == 0
+        assert rows[1][15].n == 15 and Counted.built == 1
+        # a call with a different lazy setting goes in its own batch
+        assert type(eager_call.await_result()) is list
+        assert server_calls == [_batcher.PRIVATE_NAME, "test_rows"]
+
+        with kompot.lazy():
+            rows = kompot.call_async("test_rows", 10).await_result()
+        assert isinstance(rows, _lazy.LazyRows)
+    finally:
+        kompot.set_auto_batch(None)
+
+
+def test_dedupe(server_calls):
+    @kompot.callable("test_shared")
+    def shared(x, media=None):
+        if x is None:
+            raise ValueError("no x")
+        return Point(x, x)
+
+    first = kompot.call_async("test_shared", 1)
+    assert kompot.call_async("test_shared", 1) is not first
+
+    kompot.set_dedupe("test_shared")
+    try:
+        first = kompot.call_async("test_shared", 1)
+        assert kompot.call_async("test_shared", 1) is first
+        assert kompot.call_async("test_shared", 2) is not first
+        with kompot.codec("binary"):
+            assert kompot.call_async("test_shared", 1) is not first
+        media = anvil.BlobMedia("text/plain", b"x")
+        assert kompot.call_async("test_shared", 1, media) is not kompot.call_async(
+            "test_shared", 1, media
+        )
+
+        assert first.await_result() == Point(1, 1)
+        # the call has returned, so the next one goes to the server
+        server_calls.clear()
+        again = kompot.call_async("test_shared", 1)
+        assert again is not first
+        assert again.await_result() == Point(1, 1)
+        assert server_calls == ["test_shared"]
+
+        failed = kompot.call_async("test_shared", None)
+        with pytest.raises(ValueError, match="no x"):
+            failed.await_result()
+        assert kompot.call_async("test_shared", None) is not failed
+
+        kompot.set_auto_batch(0)
+        try:
+            calls = [kompot.call_async("test_shared", x) for x in (3, 3, 4)]
+            assert calls[0] is calls[1]
+            assert [c.await_result() for c in calls] == [Point(3, 3)] * 2 + [
+                Point(4, 4)
+            ]
+            assert kompot.call_async("test_shared", 3) is not calls[0]
+        finally:
+            kompot.set_auto_batch(None)
+    finally:
+        kompot.set_dedupe("test_shared", False)
+    assert not _rpc._in_flight
+
+
+def test_batch_call_parallel(server_calls):
+    @kompot.callable("test_slow")
+    def slow(x):
+        time.sleep(0.2)
+        if x is None:
+            raise ValueError("no x")
+        return Point(x, x)
+
+    start = time.perf_counter()
+    with kompot.batch_call(silent=True, parallel=True) as c:
+        for x in [1, None, 3, 4]:
+            c.call("test_slow", x)
+    assert time.perf_counter() - start < 0.6
+    assert c.result == [Point(1, 1), None, Point(3, 3), Point(4, 4)]
+    assert [e is None for e in c.errors] == [True, False, True, True]
+    assert isinstance(c.errors[1], anvil.server.AnvilWrappedError)
+    assert c.errors[1].message == "no x"
+
+    kompot.set_auto_batch(0)
+    try:
+        ok, error = [kompot.call_async("test_slow", x) for x in (1, None)]
+        assert ok.await_result() == Point(1, 1)
+        with pytest.raises(anvil.server.AnvilWrappedError, match="no x"):
+            error.await_result()
+    finally:
+        kompot.set_auto_batch(None)
+
+
+def test_batch_call_pipelining(server_calls):
+    @kompot.callable("test_create")
+    def create(x):
+        return {"point": Point(x, 2 * x), "n": x}
+
+    @kompot.callable("test_add")
+    def add(a, b=0):
+        if a is None:
+            raise ValueError("no a")
+        return a + b
+
+    with kompot.batch_call(silent=True) as c:
+        ref = c.call("test_create", 1)
+        total = c.call("test_add", ref["point"].y, b=ref["n"])
+        c.call("test_add", total, [ref["n"]][0])
+    assert c.result[1:] == [3, 4]
+    assert server_calls == [_batcher.PRIVATE_NAME]
+
+    with kompot.batch_call(silent=True, parallel=True) as c:
+        first = c.call("test_add", None)
+        c.call("test_add", first, b=1)
+        c.call("test_add", 2, b=c.call("test_add", 1))
+    assert c.result[2:] == [1, 3]
+    assert [e is None for e in c.errors] == [False, False, True, True]
+    assert "raised an exception" in c.errors[1].message
+
+    with pytest.raises(Exception, match="earlier calls"):
+        with kompot.batch_call(silent=True) as c:
+            c.call("test_add", _batcher.BatchRef(1))
+            c.call("test_add", 1)
+
+    # a hand built path can't reach private attributes on the server
+    for path in (
+        [["attr", "__init__"], ["attr", "__globals__"], ["item", "SECRET"]],
+        [["attr", "_private"]],
+        [["call", "x"]],
+    ):
+        with pytest.raises(ValueError, match="can't refer"):
+            with kompot.batch_call(silent=True) as c:
+                c.call("test_create", 1)
+                c.call("test_add", _batcher.BatchRef(0, [["item", "point"]] + path))
+
+
+def test_stream(server_calls):
+    @kompot.callable("test_pages")
+    def pages(n, size=2):
+        for i in range(0, n, size):
+            yield [Point(j, j) for j in range(i, min(n, i + size))]
+
+    @kompot.callable("test_not_a_generator")
+    def not_a_generator():
+        return [1, 2]
+
+    assert list(kompot.stream("test_pages", 0)) == []
+    chunks = list(kompot.stream("test_pages", 5))
+    assert chunks == [
+        [Point(0, 0), Point(1, 1)],
+        [Point(2, 2), Point(3, 3)],
+        [Point(4, 4)],
+    ]
+    # a call for each chunk, and one to find the end
+    assert server_calls.count(_stream.PRIVATE_NAME) == 5
+    assert not _stream._streams
+
+    # chunks are only computed when they're asked for
+    computed = []
+
+    @kompot.callable("test_counted_pages")
+    def counted_pages(n):
+        for i in range(n):
+            computed.append(i)
+            yield i
+
+    it = iter(kompot.stream("test_counted_pages", 5))
+    assert next(it) == 0 and computed == [0]
+
+    # a new server process has lost the generator
+    _stream._streams.clear()
+    with pytest.raises(RuntimeError, match="persistent server"):
+        next(it)
+
+    server_calls.clear()
+    assert list(kompot.stream("test_not_a_generator")) == [[1, 2]]
+    assert len(server_calls) == 1
+
+    seen = []
+    rv = kompot.stream("test_pages", 3).on_chunk(seen.append)
+    assert rv.await_result() == 2 and len(seen) == 2
+
+
+def test_compress(monkeypatch):
+    import zlib
+
+    data = json.dumps([{"id": i, "name": f"row {i}"} for i in range(500)]).encode()
+    samples = [b"", b"a", data, bytes(range(256)) * 3]
+    for level in (0, 1, 9):
+        for sample in samples:
+            assert _compress._inflate(zlib.compress(sample, level), 2)[0] == sample
+
+    monkeypatch.setattr(_compress, "_zlib", None)
+    for sample in samples:
+        compressed = _compress.compress(sample)
+        assert zlib.decompress(compressed) == sample
+        assert _compress.decompress(compressed) == sample
+    assert len(_compress.compress(data)) < len(data) / 3
+
+
+def test_rpc_compression(monkeypatch, rpc_settings):
+    def echo(*args, **kws):
+        return [args, kws]
+
+    requests, replies = [], []
+
+    def server_call(fn_name, payload, unhandled, *codec_name):
+        requests.append((payload, codec_name))
+        rv = _rpc._wrap_callable(echo)(payload, unhandled, *codec_name)
+        replies.append(rv)
+        return rv
+
+    monkeypatch.setattr(_rpc._server, "call", server_call)
+    kompot.set_compress(False, threshold=1000)
+    rows = [Point(i, f"row {i}") for i in range(200)]
+
+    # off by default, and the server doesn't compress replies that weren't asked for
+    assert kompot.call("echo", rows) == [(rows,), {}]
+    assert requests[-1][1] == () and len(replies[-1]) == 2
+    with kompot.codec("binary"):
+        assert kompot.call("echo", rows) == [(rows,), {}]
+    assert requests[-1][1] == ("binary",) and len(replies[-1]) == 2
+
+    kompot.set_compress(threshold=1000)
+    assert kompot.call("echo", rows) == [(rows,), {}]
+    payload, codec_name = requests[-1]
+    assert codec_name == ("json+zlib+zlib-ok",)
+    assert payload.content_type == _rpc.ZLIB_TEXT and len(replies[-1]) == 3
+
+    with kompot.codec("binary"):
+        assert kompot.call("echo", rows) == [(rows,), {}]
+    assert requests[-1][1] == ("binary+zlib+zlib-ok",) and len(replies[-1]) == 3
+
+    # small payloads, the threshold is in bytes
+    assert kompot.call("echo", 1) == [(1,), {}]
+    assert requests[-1][1] == ("json+zlib-ok",) and len(replies[-1]) == 2
+    assert _rpc._compress("\u20ac" * 400) is not None
+    assert _rpc._compress("e" * 400) is None
+
+    # without zlib the client doesn't compress or ask for compressed replies
+    monkeypatch.setattr(_compress, "_zlib", None)
+    assert kompot.call("echo", rows) == [(rows,), {}]
+    assert requests[-1][1] == () and len(replies[-1]) == 2
+
+
+@kompot.register
+@anvil.server.portable_class
+class Counted:
+    built = 0
+
+    def __init__(self, n):
+        self.n = n
+
+    def __deserialize__(self, data, info):
+        Counted.built += 1
+        self.__dict__.update(data)
+
+
+def test_lazy_reconstruct(monkeypatch):
+    monkeypatch.setattr(Counted, "built", 0)
+    objs = [
+        [Point(i, [Point(-i, i)] if i % 3 else []) for i in range(10)],
+        {"rows": [Point(i, {"k": Point(i, i)}) for i in range(6)], 3: (Point(1, 2),)},
+        [1, [Point(1, 2), "a"], {"a": date(2021, 1, 2)}, b"ab"],
+        Point([Point(1, 2), [Point(3, 4)]], [Point(5, 6)] * 0),
+        "a",
+        # columns of objects that are themselves sent as columns
+        Point([Point(Point(i, i), i) for i in range(4)], 0),
+        [Point(Point(Point(i, [Point(i, i)]), i), -i) for i in range(5)],
+    ]
+    for obj in objs:
+        assert round_trip(obj, lazy=True) == round_trip(obj) == obj
+
+    rows = round_trip([Counted(i) for i in range(10)], lazy=True)
+    assert isinstance(rows, _lazy.LazyRows) and len(rows) == 10
+    assert Counted.built == 0
+    assert rows[3].n == 3 and rows[3] is rows[3] and rows[-1].n == 9
+    assert Counted.built == 2
+    assert [row.n for row in rows[:2]] == [0, 1] and Counted.built == 4
+    assert [row.n for row in rows] == list(range(10)) and Counted.built == 10
+
+    monkeypatch.setattr(Counted, "built", 0)
+    unknown = Unknown()
+    rv = round_trip({"p": Point([Counted(1), "a", Counted(2)], unknown)}, lazy=True)
+    assert Counted.built == 0
+    p = rv["p"]
+    assert isinstance(p.x, _lazy.LazyList) and p.y is unknown
+    assert p.x[2].n == 2 and Counted.built == 1
+    assert "a" in p.x and list(p.x)[0].n == 1 and Counted.built == 2
+
+    # back references are reconstructed eagerly
+    shared = Point(1, 2)
+    rv = round_trip([shared, shared, shared, shared], lazy=True)
+    assert type(rv) is list and rv[0] is rv[3]
+
+
+def test_rpc_lazy(monkeypatch):
+    def get_rows(n):
+        return [Counted(i) for i in range(n)]
+
+    def server_call(fn_name, payload, unhandled, *codec_name):
+        return _rpc._wrap_callable(get_rows)(payload, unhandled, *codec_name)
+
+    monkeypatch.setattr(_rpc._server, "call", server_call)
+    monkeypatch.setattr(Counted, "built", 0)
+    with kompot.lazy():
+        rows = kompot.call("get_rows", 100)
+    assert Counted.built == 0
+    assert rows[50].n == 50 and Counted.built == 1
+    assert type(kompot.call("get_rows", 100)) is list
+
+
+def test_registry_lookups(monkeypatch):
+    imports = []
+    import_module = _register._import_module
+
+    def counted_import(mod):
+        imports.append(mod)
+        import_module(mod)
+
+    monkeypatch.setattr(_register, "_import_module", counted_import)
+    monkeypatch.setattr(_register, "_missing", {})
+    for _ in range(3):
+        with pytest.raises(anvil.server.SerializationError):
+            _register.get_registered_cls("json.Missing")
+    assert imports == ["json"]
+
+    # a module that can't be imported is tried again after MISSING_RETRY seconds
+    now = [0.0]
+    monkeypatch.setattr(_register, "time", lambda: now[0])
+    for seconds in (0, 1, _register.MISSING_RETRY, _register.MISSING_RETRY + 1):
+        now[0] = seconds
+        with pytest.raises(anvil.server.SerializationError):
+            _register.get_registered_cls("nowhere.Missing")
+    assert imports == ["json", "nowhere", "nowhere"]
+
+    # only the most recent failed lookups are kept
+    monkeypatch.setattr(_register, "MAX_MISSING", 2)
+    for name in ("json.A", "json.B", "json.C"):
+        with pytest.raises(anvil.server.SerializationError):
+            _register.get_registered_cls(name)
+    assert list(_register._missing) == ["json.B", "json.C"]
+    _register._missing.clear()
+
+    # registering a name removes it from the failed lookups
+    class Missing:
+        pass
+
+    kompot.register(Missing, name="nowhere.Missing")
+    try:
+        assert _register.get_registered_cls("nowhere.Missing") is Missing
+    finally:
+        del _register.registered_names["nowhere.Missing"]
+        del _register.registered_types[Missing]
+
+    manifest = kompot.get_manifest()
+    assert _register.registered_types[Point] in manifest and "Dict" not in manifest
+
+    # each module is imported once
+    imports.clear()
+    missing = kompot.preload(["json.A", "json.B", _register.registered_types[Point]])
+    assert missing == ["json.A", "json.B"] and imports == ["json"]
+    with pytest.raises(anvil.server.SerializationError):
+        _register.get_registered_cls("json.A")
+    assert imports == ["json"]
+
+    assert kompot.preload(["nowhere.A"]) == ["nowhere.A"]
+    with pytest.raises(anvil.server.SerializationError):
+        _register.get_registered_cls("nowhere.A")
+    assert imports == ["json", "nowhere"]
+    _register._missing.clear()
+
+
+def test_call_hooks(monkeypatch, capsys, rpc_settings):
+    def slow_echo(*args, **kws):
+        time.sleep(0.01)
+        return [args, kws]
+
+    codec_names = []
+
+    def server_call(fn_name, payload, unhandled, *codec_name):
+        codec_names.append(codec_name)
+        return _rpc._wrap_callable(slow_echo)(payload, unhandled, *codec_name)
+
+    monkeypatch.setattr(_rpc._server, "call", server_call)
+    kompot.set_compress(threshold=1000)
+    rows = [Point(i, f"row {i}") for i in range(200)]
+
+    seen = []
+    kompot.add_call_hook(seen.append)
+    stats = kompot.add_call_hook(kompot.CallStats())
+    try:
+        assert kompot.call("slow_echo", rows) == [(rows,), {}]
+        assert kompot.call("slow_echo", 1) == [(1,), {}]
+    finally:
+        kompot.remove_call_hook(seen.append)
+        kompot.remove_call_hook(stats)
+    assert codec_names == [("json+zlib+zlib-ok+timing",), ("json+zlib-ok+timing",)]
+
+    timings = seen[0]
+    assert timings["fn_name"] == "slow_echo"
+    assert timings["server"] >= 0.01 and timings["server_codec"] > 0
+    assert timings["total"] >= timings["server"] + timings["serialize"]
+    assert 0 < timings["request_size"] < len(json.dumps(kompot.serialize(rows)))
+    assert seen[1]["request_size"] < timings["request_size"]
+
+    assert stats.functions() == ["slow_echo"]
+    summary = stats.summary("slow_echo")
+    assert summary["server"]["count"] == 2 and summary["server"]["min"] >= 0.01
+    assert summary["server"]["p50"] <= summary["server"]["max"]
+    with pytest.raises(ValueError):
+        stats.summary("unknown")
+
+    # without hooks the server doesn't time itself
+    assert kompot.call("slow_echo", 1) == [(1,), {}]
+    assert codec_names[-1] == ("json+zlib-ok",) and len(seen) == 2
+
+    # a failing hook doesn't fail the call or stop the other hooks
+    def failing_hook(timings):
+        raise RuntimeError("hook failed")
+
+    kompot.add_call_hook(failing_hook)
+    kompot.add_call_hook(seen.append)
+    try:
+        assert kompot.call("slow_echo", 1) == [(1,), {}]
+    finally:
+        kompot.remove_call_hook(failing_hook)
+        kompot.remove_call_hook(seen.append)
+    assert len(seen) == 3 and "hook failed" in capsys.readouterr().out
+
+
+def test_histogram():
+    histogram = _metrics.Histogram(1)
+    for value in [1, 2, 3, 5, 100]:
+        histogram.add(value)
+    summary = histogram.summary()
+    assert summary["count"] == 5 and summary["mean"] == 22.2
+    assert summary["buckets"] == [[2, 1], [4, 2], [8, 1], [128, 1]]
+    assert summary["p50"] == 4 and summary["p99"] == 100